@@ -0,0 +1,300 @@
+"""
+Annotate a large corpus with the pipeline.
+
+Texts are streamed from files or stdin through ``nlp.pipe`` and written in
+fixed-size shards (DocBin or JSONL). A manifest in the output directory records
+every finished shard, so running the same command again after an interruption
+skips the shards that are already done.
+"""
+
+from pathlib import Path
+import argparse
+import json
+import os
+import sys
+import srsly
+from spacy.tokens import DocBin
+
+# Importing the pipeline loader registers the "persian_normalizer" and
+# "rule_based_lemmatizer" factories
+from lemmatizer.pipeline import load_pipeline
+
+MANIFEST = "manifest.json"
+
+
+def read_records(inputs, input_format="text", text_key="text"):
+    """
+    Stream the texts to annotate.
+
+    Args:
+        inputs (list): Input files; "-" reads stdin.
+        input_format (str): "text" (one text per line) or "jsonl".
+        text_key (str): Field holding the text in JSONL records.
+
+    Yields:
+        tuple: The text and the other fields of its record (empty for text).
+    """
+    for path in inputs:
+        file = sys.stdin if path == "-" else open(path, "r", encoding="utf-8")
+        try:
+            for line in file:
+                line = line.strip()
+                if not line:
+                    continue
+                if input_format == "jsonl":
+                    record = json.loads(line)
+                    yield record.pop(text_key), record
+                else:
+                    yield line, {}
+        finally:
+            if file is not sys.stdin:
+                file.close()
+
+
+def doc_to_json(doc, record):
+    """
+    Args:
+        doc (Doc): Annotated Doc.
+        record (dict): Other fields of the input record, kept in the output.
+
+    Returns:
+        dict: The record with the text, tokens (tag and lemma) and entities.
+    """
+    return {
+        **record,
+        "text": doc.text,
+        "tokens": [
+            {
+                "text": token.text,
+                "start": token.idx,
+                "tag": token.tag_,
+                "lemma": token.lemma_,
+            }
+            for token in doc
+        ],
+        "ents": [
+            {"start": ent.start_char, "end": ent.end_char, "label": ent.label_}
+            for ent in doc.ents
+        ],
+    }
+
+
+class ShardWriter:
+    """
+    Collect the Docs of one shard and move the file into place once the shard
+    is complete, so a partially written shard is never mistaken for a done one.
+
+    Args:
+        output_dir (Path): Output directory.
+        index (int): Shard number.
+        output_format (str): "spacy" (DocBin) or "jsonl".
+    """
+
+    def __init__(self, output_dir, index, output_format):
+        self.index = index
+        self.n_docs = 0
+        self.path = output_dir / f"shard-{index:05d}.{output_format}"
+        self.temp_path = self.path.with_name(self.path.name + ".tmp")
+        self.doc_bin = DocBin() if output_format == "spacy" else None
+        self.file = None
+        if self.doc_bin is None:
+            self.file = open(self.temp_path, "w", encoding="utf-8")
+
+    def add(self, doc, record):
+        if self.doc_bin is not None:
+            self.doc_bin.add(doc)
+        else:
+            self.file.write(json.dumps(doc_to_json(doc, record), ensure_ascii=False))
+            self.file.write("\n")
+        self.n_docs += 1
+
+    def close(self):
+        if self.doc_bin is not None:
+            self.doc_bin.to_disk(self.temp_path)
+        else:
+            self.file.close()
+        os.replace(self.temp_path, self.path)
+
+    def discard(self):
+        if self.file is not None:
+            self.file.close()
+        if self.temp_path.exists():
+            self.temp_path.unlink()
+
+
+def load_manifest(path, settings):
+    """
+    Read the manifest of an earlier run, or start a new one.
+
+    Args:
+        path (Path): Manifest file.
+        settings (dict): Arguments that determine the shard contents.
+
+    Returns:
+        dict: The settings and the finished shards.
+
+    Raises:
+        ValueError: If the earlier run used different settings.
+    """
+    if not path.exists():
+        return {"settings": settings, "shards": {}}
+    manifest = srsly.read_json(path)
+    if manifest["settings"] != settings:
+        raise ValueError(
+            f"{path} was written with different settings: {manifest['settings']}. "
+            f"Use a new output directory."
+        )
+    return manifest
+
+
+def save_manifest(path, manifest):
+    temp_path = path.with_name(path.name + ".tmp")
+    srsly.write_json(temp_path, manifest)
+    os.replace(temp_path, path)
+
+
+def annotate(
+    pipeline_path,
+    inputs,
+    output_dir,
+    input_format="text",
+    text_key="text",
+    output_format="spacy",
+    shard_size=100000,
+    batch_size=256,
+    n_process=1,
+    components=None,
+):
+    """
+    Annotate the inputs shard by shard, skipping shards finished by an
+    earlier run with the same settings.
+
+    Args:
+        pipeline_path (str): Path to the pipeline built by package.py.
+        inputs (list): Input files; "-" reads stdin.
+        input_format (str): "text" (one text per line) or "jsonl".
+        text_key (str): Field holding the text in JSONL records.
+        output_format (str): "spacy" (DocBin shards) or "jsonl".
+        shard_size (int): Number of texts per output shard.
+        batch_size (int): Number of texts per batch passed to nlp.pipe.
+        n_process (int): Number of processes used by nlp.pipe.
+        components (list): Components to load. Defaults to all.
+
+    Returns:
+        dict: The manifest.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = output_dir / MANIFEST
+    settings = {
+        "pipeline": str(pipeline_path),
+        "components": components,
+        "inputs": list(inputs),
+        "input_format": input_format,
+        "text_key": text_key,
+        "output_format": output_format,
+        "shard_size": shard_size,
+    }
+    manifest = load_manifest(manifest_path, settings)
+    done = {int(index) for index in manifest["shards"]}
+    if done:
+        print(f"Resuming: skipping {len(done)} finished shards")
+
+    def pending():
+        records = read_records(inputs, input_format, text_key)
+        for i, (text, record) in enumerate(records):
+            shard = i // shard_size
+            if shard not in done:
+                yield text, (shard, record)
+
+    def finish_shard(writer):
+        writer.close()
+        manifest["shards"][str(writer.index)] = {
+            "file": writer.path.name,
+            "docs": writer.n_docs,
+        }
+        save_manifest(manifest_path, manifest)
+        print(f"Wrote {writer.path} ({writer.n_docs} docs)")
+
+    nlp = load_pipeline(pipeline_path, components)
+    writer = None
+    try:
+        for doc, (shard, record) in nlp.pipe(
+            pending(), as_tuples=True, batch_size=batch_size, n_process=n_process
+        ):
+            if writer is not None and writer.index != shard:
+                finish_shard(writer)
+                writer = None
+            if writer is None:
+                writer = ShardWriter(output_dir, shard, output_format)
+            writer.add(doc, record)
+        if writer is not None:
+            finish_shard(writer)
+    except BaseException:
+        # The unfinished shard is redone on the next run
+        if writer is not None:
+            writer.discard()
+        raise
+    return manifest
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Annotate a corpus in resumable shards with the pipeline."
+    )
+    parser.add_argument(
+        "inputs", nargs="+", help="Input files; use - to read from stdin."
+    )
+    parser.add_argument(
+        "--output_dir", required=True, help="Directory for the shards and manifest."
+    )
+    parser.add_argument(
+        "--pipeline_path",
+        default="fa_core_web_sm",
+        help="Path to the pipeline built by package.py.",
+    )
+    parser.add_argument(
+        "--components",
+        nargs="+",
+        default=None,
+        help="Components to load (defaults to all).",
+    )
+    parser.add_argument(
+        "--input_format",
+        choices=["text", "jsonl"],
+        default="text",
+        help="One text per line, or JSON records.",
+    )
+    parser.add_argument(
+        "--text_key", default="text", help="Field holding the text in JSONL input."
+    )
+    parser.add_argument(
+        "--output_format",
+        choices=["spacy", "jsonl"],
+        default="spacy",
+        help="Write DocBin (.spacy) or JSONL shards.",
+    )
+    parser.add_argument(
+        "--shard_size", type=int, default=100000, help="Texts per output shard."
+    )
+    parser.add_argument(
+        "--batch_size", type=int, default=256, help="Texts per batch for nlp.pipe."
+    )
+    parser.add_argument(
+        "--n_process", type=int, default=1, help="Processes used by nlp.pipe."
+    )
+    args = parser.parse_args()
+
+    manifest = annotate(
+        args.pipeline_path,
+        args.inputs,
+        args.output_dir,
+        input_format=args.input_format,
+        text_key=args.text_key,
+        output_format=args.output_format,
+        shard_size=args.shard_size,
+        batch_size=args.batch_size,
+        n_process=args.n_process,
+        components=args.components,
+    )
+    print(f"{len(manifest['shards'])} shards in {args.output_dir}")
@@ -0,0 +1,287 @@
+"""
+Benchmark the throughput and memory use of each component of the combined
+pipeline, and compare the results against a stored baseline.
+
+Each batch size runs in a fresh process, so the reported peak RSS of one run
+is not inflated by the runs before it. As the peak covers the whole process,
+each stage instead reports how much the current RSS grew while it ran. Within a run, the components are timed
+stage by stage over the same batches, and "pipeline" sums all stages.
+"""
+
+from pathlib import Path
+import argparse
+import json
+import multiprocessing
+import platform
+import resource
+import sys
+import time
+import numpy
+import spacy
+from spacy.util import minibatch
+
+# Importing the pipeline loader registers the "persian_normalizer" and
+# "rule_based_lemmatizer" factories
+from lemmatizer.pipeline import load_pipeline
+from training.corpus import read_docs
+
+DATASETS = {
+    "pos_test": "data/pos/test.spacy",
+    "ner_test": "data/ner/test.spacy",
+    "seraji_dev": "data/pos/fa_seraji-ud-dev.conllu",
+    "seraji_test": "data/pos/fa_seraji-ud-test.conllu",
+}
+
+
+def load_texts(path):
+    """
+    Read the raw texts of a .spacy file, a shard directory or a CoNLL-U file.
+
+    Args:
+        path (str): Path to the dataset.
+
+    Returns:
+        list: One text per Doc or sentence.
+    """
+    path = Path(path)
+    if path.suffix == ".spacy" or path.is_dir():
+        nlp = spacy.blank("fa")
+        return [doc.text for doc in read_docs(path, nlp.vocab)]
+    with open(path, "r", encoding="utf-8") as file:
+        return [
+            line[len("# text = ") :].strip()
+            for line in file
+            if line.startswith("# text = ")
+        ]
+
+
+def peak_rss_mb():
+    """
+    Returns:
+        float: Peak resident set size of this process so far, in MB.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def current_rss_mb():
+    """
+    Returns:
+        float: Current resident set size of this process in MB, or None where
+            /proc/self/statm is not available (e.g. macOS).
+    """
+    try:
+        with open("/proc/self/statm", "r") as file:
+            resident_pages = int(file.read().split()[1])
+    except OSError:
+        return None
+    return resident_pages * resource.getpagesize() / 2**20
+
+
+def summarize(n_words, batch_times, batch_lengths):
+    """
+    Args:
+        n_words (int): Number of words processed.
+        batch_times (list): Seconds spent on each batch.
+        batch_lengths (list): Number of Docs in each batch.
+
+    Returns:
+        dict: Words per second and per-Doc latency percentiles in ms. A Doc's
+            latency is the time of the batch it was processed in.
+    """
+    latencies = numpy.repeat(batch_times, batch_lengths) * 1000
+    total_time = sum(batch_times)
+    return {
+        "words_per_sec": n_words / total_time if total_time else 0.0,
+        "latency_ms": {
+            f"p{q}": float(numpy.percentile(latencies, q)) for q in (50, 90, 99)
+        },
+    }
+
+
+def run_benchmark(pipeline_path, texts, batch_size, repeats=3):
+    """
+    Time the tokenizer and every component over the texts.
+
+    Args:
+        pipeline_path (str): Path to the saved pipeline.
+        texts (list): Texts to process.
+        batch_size (int): Number of texts per batch.
+        repeats (int): Number of timed passes; the fastest pass is reported.
+
+    Returns:
+        dict: Results per component ("tokenizer", the pipe names and
+            "pipeline"), each with words/sec and latency percentiles. Each
+            stage also reports the largest growth of the current RSS over one
+            of its batches, and the pipeline the peak RSS of the whole run.
+    """
+    nlp = load_pipeline(pipeline_path)
+    stages = [("tokenizer", nlp.tokenizer)] + list(nlp.pipeline)
+    batches = list(minibatch(texts, batch_size))
+
+    # Warm up caches and lazily loaded data outside the timed passes
+    list(nlp.pipe(batches[0], batch_size=batch_size))
+
+    best = {}
+    for _ in range(repeats):
+        times = {name: [] for name, _ in stages}
+        n_words = 0
+        rss = {name: 0.0 for name, _ in stages}
+        for batch in batches:
+            docs = batch
+            for name, proc in stages:
+                rss_before = current_rss_mb()
+                start = time.perf_counter()
+                if hasattr(proc, "pipe"):
+                    docs = list(proc.pipe(docs, batch_size=batch_size))
+                else:
+                    docs = [proc(doc) for doc in docs]
+                times[name].append(time.perf_counter() - start)
+                if rss_before is None:
+                    rss[name] = None
+                else:
+                    rss[name] = max(rss[name], current_rss_mb() - rss_before)
+            n_words += sum(len(doc) for doc in docs)
+        total = sum(sum(batch_times) for batch_times in times.values())
+        if best and total >= best["total"]:
+            continue
+        best = {"total": total, "times": times, "n_words": n_words, "rss": rss}
+
+    lengths = [len(batch) for batch in batches]
+    results = {}
+    for name, _ in stages:
+        results[name] = summarize(best["n_words"], best["times"][name], lengths)
+        results[name]["rss_increase_mb"] = best["rss"][name]
+    pipeline_times = numpy.sum([best["times"][name] for name, _ in stages], axis=0)
+    results["pipeline"] = summarize(best["n_words"], list(pipeline_times), lengths)
+    results["pipeline"]["peak_rss_mb"] = peak_rss_mb()
+    return results
+
+
+def compare_with_baseline(results, baseline, threshold):
+    """
+    Find the components that got slower than the baseline.
+
+    Args:
+        results (dict): Output of ``benchmark``.
+        baseline (dict): Earlier output of ``benchmark``.
+        threshold (float): Allowed relative drop in words/sec (e.g. 0.1).
+
+    Returns:
+        list: Messages describing each slowdown beyond the threshold.
+    """
+    slowdowns = []
+    for dataset, runs in results["results"].items():
+        for batch_size, components in runs.items():
+            old_components = baseline["results"].get(dataset, {}).get(batch_size, {})
+            for name, scores in components.items():
+                if name not in old_components:
+                    continue
+                old = old_components[name]["words_per_sec"]
+                new = scores["words_per_sec"]
+                if old and new < old * (1 - threshold):
+                    slowdowns.append(
+                        f"{dataset} batch_size={batch_size} {name}: "
+                        f"{new:.0f} words/sec vs {old:.0f} ({new / old - 1:.1%})"
+                    )
+    return slowdowns
+
+
+def benchmark(pipeline_path, datasets, batch_sizes, repeats=3):
+    """
+    Benchmark the pipeline on each dataset and batch size.
+
+    Args:
+        pipeline_path (str): Path to the saved pipeline.
+        datasets (dict): Dataset names mapped to .spacy, shard directory or
+            CoNLL-U paths.
+        batch_sizes (list): Batch sizes to measure.
+        repeats (int): Number of timed passes per run.
+
+    Returns:
+        dict: Environment details and the results per dataset and batch size.
+    """
+    # A fresh interpreter per run keeps the peak RSS measurements independent
+    context = multiprocessing.get_context("spawn")
+    results = {}
+    with context.Pool(1, maxtasksperchild=1) as pool:
+        for dataset, path in datasets.items():
+            texts = load_texts(path)
+            results[dataset] = {}
+            for batch_size in batch_sizes:
+                print(
+                    f"Benchmarking {dataset} ({len(texts)} texts), batch_size={batch_size}"
+                )
+                results[dataset][str(batch_size)] = pool.apply(
+                    run_benchmark, (pipeline_path, texts, batch_size, repeats)
+                )
+    return {
+        "pipeline": str(pipeline_path),
+        "python": platform.python_version(),
+        "spacy": spacy.__version__,
+        "platform": platform.platform(),
+        "cpu_count": multiprocessing.cpu_count(),
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark words/sec, latency and memory of the pipeline."
+    )
+    parser.add_argument(
+        "--pipeline_path",
+        default="fa_core_web_sm",
+        help="Path to the pipeline built by package.py.",
+    )
+    parser.add_argument(
+        "--datasets",
+        nargs="+",
+        choices=list(DATASETS),
+        default=list(DATASETS),
+        help="Datasets to benchmark.",
+    )
+    parser.add_argument(
+        "--batch_sizes",
+        type=int,
+        nargs="+",
+        default=[1, 32, 256],
+        help="Batch sizes to benchmark.",
+    )
+    parser.add_argument(
+        "--repeats", type=int, default=3, help="Timed passes per run (best is kept)."
+    )
+    parser.add_argument(
+        "--output", default="benchmark.json", help="Where to write the JSON results."
+    )
+    parser.add_argument(
+        "--baseline", default=None, help="Earlier results to compare against."
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="Relative drop in words/sec reported as a slowdown.",
+    )
+    args = parser.parse_args()
+
+    results = benchmark(
+        args.pipeline_path,
+        {name: DATASETS[name] for name in args.datasets},
+        args.batch_sizes,
+        repeats=args.repeats,
+    )
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2)
+    print(f"Results saved to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as file:
+            baseline = json.load(file)
+        slowdowns = compare_with_baseline(results, baseline, args.threshold)
+        for slowdown in slowdowns:
+            print(f"SLOWDOWN {slowdown}")
+        if slowdowns:
+            sys.exit(1)
+        print(f"No slowdowns beyond {args.threshold:.0%} of the baseline.")
@@ -0,0 +1,401 @@
+"""
+Rebuild the pipeline incrementally: preprocess -> train -> evaluate -> package.
+
+The steps form a dependency graph. Each step records a stamp holding the
+content hash of its command, scripts and input files, and of the outputs it
+wrote. A step is skipped while its stamp still matches, and reruns (along
+with everything downstream of it) when an input, a script or one of its
+outputs changed. Steps whose dependencies are done run in parallel
+processes, so the POS and NER branches train side by side.
+"""
+
+from pathlib import Path
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT = Path(__file__).resolve().parent
+
+# Slim variants written by package.py next to the pipeline
+VARIANTS = ["tagger", "ner", "slim"]
+
+
+def build_steps(
+    pos_train_conllu="data/pos/fa_seraji-ud-train.conllu",
+    pos_test_conllu="data/pos/fa_seraji-ud-test.conllu",
+    ner_dataset=None,
+    output_path="fa_core_web_sm",
+    lemma_dict_path="data/lemmatizer/lemma_dict.txt",
+    build_dir=".build",
+):
+    """
+    Describe the build as a list of steps in dependency order.
+
+    Preprocessing steps are only included when their sources are available
+    (both Seraji CoNLL-U files, or a HuggingFace dataset name for NER) and
+    write the converted corpora to build_dir/corpus; otherwise the .spacy
+    files in data/ are used as they are.
+
+    Args:
+        pos_train_conllu (str): CoNLL-U file of the POS training set.
+        pos_test_conllu (str): CoNLL-U file of the POS test set.
+        ner_dataset (str): Name of the HuggingFace NER dataset.
+        output_path (str): Directory of the combined pipeline.
+        lemma_dict_path (str): Path to the lemma dictionary.
+        build_dir (str): Directory for the stamps, the step logs and the
+            converted corpora.
+
+    Returns:
+        list: Steps as dicts with the name, command, inputs, outputs and the
+            names of the steps they depend on.
+    """
+    steps = []
+    producers = {}
+
+    def add(name, command, inputs, outputs):
+        steps.append(
+            {
+                "name": name,
+                "command": [sys.executable] + command,
+                "inputs": inputs,
+                "outputs": outputs,
+                "deps": sorted(
+                    {producers[path] for path in inputs if path in producers}
+                ),
+            }
+        )
+        for path in outputs:
+            producers[path] = name
+
+    # Converted corpora go to the build directory, the .spacy files in data/
+    # are only read
+    corpora = {
+        task: {split: f"data/{task}/{split}.spacy" for split in ["train", "test"]}
+        for task in ["pos", "ner"]
+    }
+    # Converted splits are written as shard directories, which the training
+    # and evaluation scripts read shard by shard
+    if (ROOT / pos_train_conllu).exists() and (ROOT / pos_test_conllu).exists():
+        for split, conllu in [("train", pos_train_conllu), ("test", pos_test_conllu)]:
+            corpora["pos"][split] = f"{build_dir}/corpus/pos/{split}"
+            add(
+                f"pos_preprocess_{split}",
+                [
+                    "pos/preprocess.py",
+                    "--input_file",
+                    conllu,
+                    "--output_file",
+                    corpora["pos"][split],
+                ],
+                ["pos/preprocess.py", conllu],
+                [corpora["pos"][split]],
+            )
+    if ner_dataset:
+        corpora["ner"] = {
+            split: f"{build_dir}/corpus/ner/{split}" for split in ["train", "test"]
+        }
+        add(
+            "ner_preprocess",
+            [
+                "ner/preprocess.py",
+                "--dataset_name",
+                ner_dataset,
+                "--train_output",
+                corpora["ner"]["train"],
+                "--test_output",
+                corpora["ner"]["test"],
+            ],
+            ["ner/preprocess.py", "training"],
+            [corpora["ner"]["train"], corpora["ner"]["test"]],
+        )
+
+    for task in ["pos", "ner"]:
+        add(
+            f"{task}_train",
+            [
+                f"{task}/train.py",
+                "--train_path",
+                corpora[task]["train"],
+                "--output_dir",
+                f"models/{task}",
+            ],
+            [f"{task}/train.py", "training", corpora[task]["train"]],
+            [f"models/{task}"],
+        )
+        # The scores printed by the evaluation are kept as its output
+        add(
+            f"{task}_evaluate",
+            [
+                f"{task}/evaluate.py",
+                "--model_path",
+                f"models/{task}",
+                "--validation_path",
+                corpora[task]["test"],
+            ],
+            [
+                f"{task}/evaluate.py",
+                "training",
+                f"models/{task}",
+                corpora[task]["test"],
+            ],
+            [f"{build_dir}/logs/{task}_evaluate.log"],
+        )
+
+    add(
+        "package",
+        [
+            "package.py",
+            "--pos_model_path",
+            "models/pos",
+            "--ner_model_path",
+            "models/ner",
+            "--lemma_dict_path",
+            lemma_dict_path,
+            "--output_path",
+            output_path,
+            "--variants",
+            *VARIANTS,
+        ],
+        [
+            "package.py",
+            "lemmatizer",
+            "models/pos",
+            "models/ner",
+            lemma_dict_path,
+        ],
+        [output_path] + [f"{output_path}_{variant}" for variant in VARIANTS],
+    )
+    return steps
+
+
+class Stamps:
+    """
+    Content hashes of the finished steps, saved as JSON in the build directory.
+
+    File hashes are cached by size and modification time, so unchanged files
+    (e.g. large model weights) are not read again on every build.
+
+    Args:
+        path (Path): Path of the stamp file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        data = json.loads(path.read_text()) if path.exists() else {}
+        self.steps = data.get("steps", {})
+        self.file_hashes = data.get("file_hashes", {})
+
+    def hash_file(self, path):
+        stat = path.stat()
+        key = str(path)
+        cached = self.file_hashes.get(key)
+        if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+        digest = hashlib.sha256()
+        with open(path, "rb") as file:
+            for block in iter(lambda: file.read(1 << 20), b""):
+                digest.update(block)
+        self.file_hashes[key] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+        return digest.hexdigest()
+
+    def hash_paths(self, paths):
+        """
+        Args:
+            paths (list): Files or directories, relative to the repository.
+
+        Returns:
+            str: Hash of the names and contents of all files, or None if a
+                path does not exist.
+        """
+        digest = hashlib.sha256()
+        for name in paths:
+            path = ROOT / name
+            if not path.exists():
+                return None
+            files = sorted(path.rglob("*")) if path.is_dir() else [path]
+            for file in files:
+                if file.is_file() and "__pycache__" not in file.parts:
+                    digest.update(str(file.relative_to(path)).encode("utf-8"))
+                    digest.update(self.hash_file(file).encode("ascii"))
+        return digest.hexdigest()
+
+    def input_key(self, step):
+        inputs = self.hash_paths(step["inputs"])
+        if inputs is None:
+            return None
+        digest = hashlib.sha256(json.dumps(step["command"][1:]).encode("utf-8"))
+        digest.update(inputs.encode("ascii"))
+        return digest.hexdigest()
+
+    def is_current(self, step):
+        stamp = self.steps.get(step["name"])
+        return (
+            stamp is not None
+            and stamp["inputs"] == self.input_key(step)
+            and stamp["outputs"] == self.hash_paths(step["outputs"])
+        )
+
+    def record(self, step):
+        self.steps[step["name"]] = {
+            "inputs": self.input_key(step),
+            "outputs": self.hash_paths(step["outputs"]),
+        }
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        tmp_path.write_text(
+            json.dumps({"steps": self.steps, "file_hashes": self.file_hashes}, indent=2)
+        )
+        os.replace(tmp_path, self.path)
+
+
+def build(steps, build_dir=".build", jobs=2, force=(), dry_run=False):
+    """
+    Run the steps that are out of date, in dependency order, with up to jobs
+    steps running at once. A step is checked once its dependencies are done,
+    so if a rerun dependency wrote the same outputs as before, the steps
+    after it are still skipped.
+
+    Args:
+        steps (list): Steps from build_steps.
+        build_dir (str): Directory for the stamps and the step logs.
+        jobs (int): Maximum number of steps running in parallel.
+        force (list): Names of steps to rerun even if they are up to date.
+        dry_run (bool): Only print the steps that would run (assuming every
+            rerun step changes its outputs).
+
+    Returns:
+        bool: True if every step is up to date or ran successfully.
+    """
+    build_dir = ROOT / build_dir
+    stamps = Stamps(build_dir / "stamps.json")
+
+    if dry_run:
+        outdated = set()
+        for step in steps:
+            if (
+                step["name"] in force
+                or any(dep in outdated for dep in step["deps"])
+                or not stamps.is_current(step)
+            ):
+                outdated.add(step["name"])
+                print(f"[would run] {step['name']}: {' '.join(step['command'][1:])}")
+            else:
+                print(f"[up to date] {step['name']}")
+        return True
+
+    (build_dir / "logs").mkdir(parents=True, exist_ok=True)
+    pending = list(steps)
+    running = {}
+    finished = set()
+    failed = False
+    while pending or running:
+        # Start every step whose dependencies are done, unless a step failed
+        for step in list(pending):
+            if failed or len(running) >= jobs:
+                break
+            if not all(dep in finished for dep in step["deps"]):
+                continue
+            pending.remove(step)
+            if step["name"] not in force and stamps.is_current(step):
+                print(f"[up to date] {step['name']}")
+                finished.add(step["name"])
+                continue
+            print(f"[start] {step['name']}")
+            log = open(build_dir / "logs" / f"{step['name']}.log", "w")
+            process = subprocess.Popen(
+                step["command"], cwd=ROOT, stdout=log, stderr=subprocess.STDOUT
+            )
+            running[step["name"]] = (step, process, log, time.perf_counter())
+        if not running:
+            break
+
+        time.sleep(0.2)
+        for name, (step, process, log, start) in list(running.items()):
+            if process.poll() is None:
+                continue
+            log.close()
+            del running[name]
+            elapsed = time.perf_counter() - start
+            if process.returncode:
+                failed = True
+                print(
+                    f"[failed] {name} after {elapsed:.0f}s, "
+                    f"see {build_dir / 'logs' / f'{name}.log'}"
+                )
+                continue
+            print(f"[done] {name} in {elapsed:.0f}s")
+            finished.add(name)
+            stamps.record(step)
+            stamps.save()
+    stamps.save()
+    return not failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Rebuild the pipeline, rerunning only the steps whose inputs changed."
+    )
+    parser.add_argument(
+        "--pos_train_conllu",
+        default="data/pos/fa_seraji-ud-train.conllu",
+        help="CoNLL-U file of the POS training set (converted if present).",
+    )
+    parser.add_argument(
+        "--pos_test_conllu",
+        default="data/pos/fa_seraji-ud-test.conllu",
+        help="CoNLL-U file of the POS test set (converted if present).",
+    )
+    parser.add_argument(
+        "--ner_dataset",
+        default=None,
+        help="HuggingFace NER dataset to convert (defaults to the existing data/ner files).",
+    )
+    parser.add_argument(
+        "--lemma_dict_path",
+        default="data/lemmatizer/lemma_dict.txt",
+        help="Path to the lemma dictionary.",
+    )
+    parser.add_argument(
+        "--output_path",
+        default="fa_core_web_sm",
+        help="Directory to save the combined pipeline.",
+    )
+    parser.add_argument(
+        "--build_dir", default=".build", help="Directory for stamps and step logs."
+    )
+    parser.add_argument(
+        "--jobs", type=int, default=2, help="Maximum number of steps run in parallel."
+    )
+    parser.add_argument(
+        "--force", nargs="+", default=[], help="Steps to rerun even if up to date."
+    )
+    parser.add_argument(
+        "--dry_run", action="store_true", help="Only list the steps that would run."
+    )
+    args = parser.parse_args()
+
+    steps = build_steps(
+        pos_train_conllu=args.pos_train_conllu,
+        pos_test_conllu=args.pos_test_conllu,
+        ner_dataset=args.ner_dataset,
+        output_path=args.output_path,
+        lemma_dict_path=args.lemma_dict_path,
+        build_dir=args.build_dir,
+    )
+    unknown = set(args.force) - {step["name"] for step in steps}
+    if unknown:
+        parser.error(f"Unknown steps: {', '.join(sorted(unknown))}")
+    if not build(
+        steps,
+        build_dir=args.build_dir,
+        jobs=args.jobs,
+        force=args.force,
+        dry_run=args.dry_run,
+    ):
+        sys.exit(1)
@@ -0,0 +1,83 @@
+"""
+Import FastText vectors from a .vec text file into a ready-to-load SpaCy pipeline
+directory, whose vocab/ is reused by the training and packaging scripts.
+"""
+
+from itertools import islice
+from pathlib import Path
+import argparse
+import numpy
+import spacy
+from spacy.vectors import Vectors
+
+
+def import_vectors(vec_path, output_dir, chunk_size=50000, name="fa_pipeline.vectors"):
+    """
+    Stream a .vec file into a preallocated matrix and save it as a blank pipeline.
+
+    Args:
+        vec_path (str): Path to the FastText .vec file (e.g. cc.fa.300.vec).
+        output_dir (str): Directory to save the pipeline; vectors go to vocab/.
+        chunk_size (int): Number of lines parsed at a time.
+        name (str): Name of the vectors table.
+
+    Returns:
+        Language: The blank pipeline holding the vectors.
+    """
+    nlp = spacy.blank("fa")
+    strings = nlp.vocab.strings
+
+    with open(vec_path, "r", encoding="utf-8", errors="replace") as file:
+        n_rows, width = (int(value) for value in file.readline().split())
+        data = numpy.zeros((n_rows, width), dtype="float32")
+        keys = numpy.zeros(n_rows, dtype="uint64")
+        n_read = 0
+        while True:
+            lines = list(islice(file, chunk_size))
+            if not lines:
+                break
+            words = []
+            values = []
+            for line in lines:
+                parts = line.rstrip().rsplit(" ", width)
+                if len(parts) != width + 1:
+                    continue  # Skip malformed lines
+                words.append(parts[0])
+                values.append(" ".join(parts[1:]))
+            rows = numpy.fromstring(" ".join(values), dtype="float32", sep=" ")
+            end = n_read + len(words)
+            data[n_read:end] = rows.reshape(len(words), width)
+            keys[n_read:end] = [strings.add(word) for word in words]
+            n_read = end
+            print(f"Imported {n_read} / {n_rows} vectors")
+
+    # Build the table in one call instead of a set_vector call per word
+    nlp.vocab.vectors = Vectors(
+        strings=strings, data=data[:n_read], keys=keys[:n_read], name=name
+    )
+
+    output_path = Path(output_dir)
+    output_path.mkdir(parents=True, exist_ok=True)
+    nlp.to_disk(output_path)
+    return nlp
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Import FastText .vec vectors into a SpaCy vectors directory."
+    )
+    parser.add_argument(
+        "--vec_path", required=True, help="Path to the FastText .vec file."
+    )
+    parser.add_argument(
+        "--output_dir",
+        default="fasttext",
+        help="Directory to save the vectors pipeline (vectors go to vocab/).",
+    )
+    parser.add_argument(
+        "--chunk_size", type=int, default=50000, help="Lines parsed at a time."
+    )
+    args = parser.parse_args()
+
+    nlp = import_vectors(args.vec_path, args.output_dir, chunk_size=args.chunk_size)
+    print(f"Vectors {nlp.vocab.vectors.shape} saved to: {args.output_dir}")
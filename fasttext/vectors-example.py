@@ -1,3 +1,6 @@
+from pathlib import Path
+import sys
+
 import spacy
 
 nlp = spacy.blank("fa")
@@ -27,3 +30,27 @@ sentence2 = nlp("شکوفایی هنرهای تجسمی در دهه‌های ا
 # Calculate sentence similarity
 similarity = sentence1.similarity(sentence2)
 print(f"Sentence Similarity: {similarity}")
+
+
+def print_neighbours(vocab, words, k=5):
+    """
+    Print the nearest neighbours of several words, found in one batched query.
+
+    Args:
+        vocab (Vocab): Vocabulary with the vectors.
+        words (list): Query words.
+        k (int): Number of neighbours per word.
+    """
+    try:
+        from lemmatizer.search import VectorSearch
+    except ImportError:
+        # Run as a script, only fasttext/ is on the path, not the repository
+        sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+        from lemmatizer.search import VectorSearch
+
+    search = VectorSearch(vocab, dtype="float16")
+    for word, neighbours in zip(words, search.most_similar(words, k=k)):
+        print(f"{word}: {', '.join(neighbour for neighbour, _ in neighbours)}")
+
+
+print_neighbours(nlp.vocab, ["ایران", "کشور", "مدرسه"])
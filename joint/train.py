@@ -0,0 +1,285 @@
+"""
+Train the tagger and NER on one shared tok2vec layer, so the combined pipeline
+embeds and convolves every token once instead of once per component.
+"""
+
+import itertools
+import random
+from pathlib import Path
+from spacy.training import Example
+from spacy.tokens import Doc
+from spacy.util import compounding, fix_random_seed
+import spacy
+import argparse
+import sys
+
+# Run as a script, only the script's directory is on the path, not the repository
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from training.corpus import read_docs  # noqa: E402
+from training.parallel import length_bucketed_batches  # noqa: E402
+
+# Shared embedding layer; same hyperparameters as the separate POS/NER models
+TOK2VEC_CONFIG = {
+    "model": {
+        "@architectures": "spacy.HashEmbedCNN.v2",
+        "pretrained_vectors": None,
+        "width": 96,
+        "depth": 4,
+        "embed_size": 2000,
+        "window_size": 1,
+        "maxout_pieces": 3,
+        "subword_features": True,
+    }
+}
+
+LISTENER = {"@architectures": "spacy.Tok2VecListener.v1", "width": 96, "upstream": "*"}
+
+TAGGER_CONFIG = {
+    "model": {
+        "@architectures": "spacy.Tagger.v2",
+        "nO": None,
+        "normalize": False,
+        "tok2vec": LISTENER,
+    }
+}
+
+NER_CONFIG = {
+    "model": {
+        "@architectures": "spacy.TransitionBasedParser.v2",
+        "state_type": "ner",
+        "extra_state_tokens": False,
+        "hidden_width": 64,
+        "maxout_pieces": 2,
+        "use_upper": True,
+        "nO": None,
+        "tok2vec": LISTENER,
+    }
+}
+
+
+def load_examples(data_path, nlp, task):
+    """
+    Build gold-tokenized training examples for one task.
+
+    Args:
+        data_path (str): Path to the .spacy file or shard directory of the dataset.
+        nlp (Language): SpaCy language object.
+        task (str): "tagger" to keep the tags, "ner" to keep the entities.
+
+    Returns:
+        list: Examples carrying only the annotation of the given task.
+    """
+    examples = []
+    for doc in read_docs(data_path, nlp.vocab):
+        words = [token.text for token in doc]
+        spaces = [bool(token.whitespace_) for token in doc]
+        predicted = Doc(nlp.vocab, words=words, spaces=spaces)
+        if task == "tagger":
+            annotations = {"tags": [token.tag_ for token in doc]}
+        else:
+            annotations = {
+                "entities": [
+                    (ent.start_char, ent.end_char, ent.label_) for ent in doc.ents
+                ]
+            }
+        examples.append(Example.from_dict(predicted, annotations))
+    return examples
+
+
+def mixed_batches(pos_examples, ner_examples, batch_sizes):
+    """
+    Split the examples of both tasks into length-bucketed batches that each
+    hold some of both.
+
+    The shared tok2vec only backpropagates through its last listener, the
+    NER's, and the NER skips batches without entity annotation, so a batch of
+    POS examples alone would never pass the tagger's gradient on to tok2vec.
+    The word budget of each batch is therefore split between the tasks by
+    their share of the words, and their batches are paired up shortest with
+    shortest. Batches left over after pairing are added to the pairs in turn.
+
+    Args:
+        pos_examples (list): Examples with tags.
+        ner_examples (list): Examples with entities.
+        batch_sizes (iterator): Word budget of each successive batch.
+
+    Returns:
+        list: Batches of examples, in random order.
+    """
+    pos_words = sum(len(example) for example in pos_examples)
+    ner_words = sum(len(example) for example in ner_examples)
+    pos_share = pos_words / max(1, pos_words + ner_words)
+    pos_sizes, ner_sizes = itertools.tee(batch_sizes)
+    pos_batches = length_bucketed_batches(
+        pos_examples, (size * pos_share for size in pos_sizes)
+    )
+    ner_batches = length_bucketed_batches(
+        ner_examples, (size * (1 - pos_share) for size in ner_sizes)
+    )
+    n_batches = min(len(pos_batches), len(ner_batches))
+    if n_batches == 0:
+        return pos_batches + ner_batches
+
+    # Buckets are sorted by length, so their first example is their shortest
+    pos_batches.sort(key=lambda batch: len(batch[0]))
+    ner_batches.sort(key=lambda batch: len(batch[0]))
+    batches = [pos_batches[i] + ner_batches[i] for i in range(n_batches)]
+    leftovers = pos_batches[n_batches:] + ner_batches[n_batches:]
+    for i, batch in enumerate(leftovers):
+        batches[i % n_batches].extend(batch)
+    random.shuffle(batches)
+    return batches
+
+
+def train_joint_model(
+    pos_train_path,
+    ner_train_path,
+    output_dir,
+    iterations,
+    batch_size=1000,
+    seed=0,
+):
+    """
+    Train a tagger and NER that share one tok2vec component.
+
+    Args:
+        pos_train_path (str): POS training dataset (.spacy file or shard directory).
+        ner_train_path (str): NER training dataset (.spacy file or shard directory).
+        output_dir (str): Directory to save the trained model.
+        iterations (int): Number of training iterations.
+        batch_size (int): Maximum number of words per minibatch.
+        seed (int): Random seed.
+
+    Returns:
+        Language: The trained pipeline.
+    """
+    fix_random_seed(seed)
+
+    nlp = spacy.blank("fa")
+    nlp.add_pipe("tok2vec", config=TOK2VEC_CONFIG)
+    tagger = nlp.add_pipe("tagger", config=TAGGER_CONFIG)
+    ner = nlp.add_pipe("ner", config=NER_CONFIG)
+
+    pos_examples = load_examples(pos_train_path, nlp, "tagger")
+    ner_examples = load_examples(ner_train_path, nlp, "ner")
+
+    # Sorted, as set order changes with the string hash seed of each run
+    tags = {tag for eg in pos_examples for tag in eg.get_aligned("TAG", True)}
+    for tag in sorted(tags - {None}):
+        tagger.add_label(tag)
+    labels = {ent.label_ for eg in ner_examples for ent in eg.reference.ents}
+    for label in sorted(labels):
+        ner.add_label(label)
+
+    # Batches grow from 100 words up to batch_size, as in the models' configs
+    batch_sizes = compounding(min(100, batch_size), batch_size, 1.001)
+
+    optimizer = nlp.initialize()
+    for iteration in range(iterations):
+        print(f"Starting iteration {iteration + 1}")
+        losses = {}
+        # Each component skips the examples without its annotation: the tagger
+        # masks the missing tags and the NER leaves out docs without entities
+        for batch in mixed_batches(pos_examples, ner_examples, batch_sizes):
+            nlp.update(batch, drop=0.3, sgd=optimizer, losses=losses)
+        print(f"Losses at iteration {iteration + 1}: {losses}")
+
+    output_path = Path(output_dir)
+    output_path.mkdir(parents=True, exist_ok=True)
+    nlp.to_disk(output_path)
+    print(f"Model saved to {output_dir}")
+    return nlp
+
+
+def compare_with_baselines(
+    nlp, pos_test_path, ner_test_path, pos_model_path, ner_model_path, tolerance
+):
+    """
+    Score the joint model against the separate POS and NER models.
+
+    Args:
+        nlp (Language): The joint pipeline.
+        pos_test_path (str): POS test dataset (.spacy file or shard directory).
+        ner_test_path (str): NER test dataset (.spacy file or shard directory).
+        pos_model_path (str): Path to the separately trained POS model.
+        ner_model_path (str): Path to the separately trained NER model.
+        tolerance (float): Largest accepted drop of tag accuracy or NER F1.
+
+    Returns:
+        bool: True if both scores are within the tolerance of the baselines.
+    """
+    within_tolerance = True
+    for name, score, test_path, model_path in [
+        ("tagger", "tag_acc", pos_test_path, pos_model_path),
+        ("ner", "ents_f", ner_test_path, ner_model_path),
+    ]:
+        baseline_nlp = spacy.load(model_path)
+        baseline_examples = load_examples(test_path, baseline_nlp, name)
+        baseline = baseline_nlp.evaluate(baseline_examples)[score]
+        joint = nlp.evaluate(load_examples(test_path, nlp, name))[score]
+        ok = joint >= baseline - tolerance
+        within_tolerance = within_tolerance and ok
+        print(
+            f"{score}: joint {joint:.4f}, baseline {baseline:.4f} "
+            f"({'within' if ok else 'OUTSIDE'} tolerance {tolerance})"
+        )
+    return within_tolerance
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Train a tagger and NER model with a shared tok2vec."
+    )
+    parser.add_argument(
+        "--pos_train_path", required=True, help="Path to the POS training data."
+    )
+    parser.add_argument(
+        "--ner_train_path", required=True, help="Path to the NER training data."
+    )
+    parser.add_argument(
+        "--output_dir", required=True, help="Directory to save the trained model."
+    )
+    parser.add_argument(
+        "--iterations", type=int, default=25, help="Number of training iterations."
+    )
+    parser.add_argument(
+        "--batch_size",
+        type=int,
+        default=1000,
+        help="Maximum number of words per minibatch.",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Random seed.")
+    parser.add_argument("--pos_test_path", help="POS test data for the comparison.")
+    parser.add_argument("--ner_test_path", help="NER test data for the comparison.")
+    parser.add_argument(
+        "--pos_model_path", default="models/pos", help="Separately trained POS model."
+    )
+    parser.add_argument(
+        "--ner_model_path", default="models/ner", help="Separately trained NER model."
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.01,
+        help="Largest accepted drop of tag accuracy or NER F1 versus the baselines.",
+    )
+    args = parser.parse_args()
+
+    nlp = train_joint_model(
+        args.pos_train_path,
+        args.ner_train_path,
+        args.output_dir,
+        args.iterations,
+        batch_size=args.batch_size,
+        seed=args.seed,
+    )
+    if args.pos_test_path and args.ner_test_path:
+        if not compare_with_baselines(
+            nlp,
+            args.pos_test_path,
+            args.ner_test_path,
+            args.pos_model_path,
+            args.ner_model_path,
+            args.tolerance,
+        ):
+            sys.exit(1)
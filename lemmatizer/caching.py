@@ -0,0 +1,175 @@
+"""
+Result cache that answers repeated texts without running the pipeline.
+"""
+
+from spacy.tokens import Doc
+from spacy.util import minibatch
+from pathlib import Path
+import hashlib
+import sqlite3
+
+from lemmatizer.lemmatizer import LRUCache
+from lemmatizer.pipeline import LazyPipeline
+
+
+def pipeline_fingerprint(nlp) -> str:
+    """
+    Identify a pipeline by its name, version and config, so cached results
+    are not reused after the pipeline is rebuilt or reconfigured.
+
+    Args:
+        nlp (Language): Loaded pipeline.
+
+    Returns:
+        str: Hash of the pipeline's meta and config.
+    """
+    digest = hashlib.sha256()
+    digest.update(f"{nlp.meta.get('name')}-{nlp.meta.get('version')}".encode("utf-8"))
+    digest.update(nlp.config.to_str().encode("utf-8"))
+    digest.update(" ".join(nlp.pipe_names).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class DocCache:
+    """
+    Cache of serialized Docs keyed by a hash of their text, held in an LRU
+    memory tier and optionally in an SQLite file shared between processes.
+
+    Every entry belongs to a pipeline fingerprint; opening the disk tier with
+    a different fingerprint (a new meta version or config) clears it.
+
+    Args:
+        fingerprint (str): Fingerprint of the pipeline, see pipeline_fingerprint.
+        maxsize (int): Maximum number of Docs kept in memory.
+        path (str): Optional SQLite file for the on-disk tier.
+    """
+
+    def __init__(self, fingerprint, maxsize=10000, path=None):
+        self.fingerprint = fingerprint
+        self.memory = LRUCache(maxsize)
+        self.disk = None
+        self.disk_hits = 0
+        if path is not None:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self.disk = sqlite3.connect(path, timeout=30, check_same_thread=False)
+            with self.disk:
+                self.disk.execute(
+                    "CREATE TABLE IF NOT EXISTS docs (key TEXT PRIMARY KEY, data BLOB)"
+                )
+                self.disk.execute(
+                    "CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)"
+                )
+                row = self.disk.execute(
+                    "SELECT value FROM meta WHERE name = 'fingerprint'"
+                ).fetchone()
+                if row is None or row[0] != fingerprint:
+                    self.disk.execute("DELETE FROM docs")
+                    self.disk.execute(
+                        "INSERT OR REPLACE INTO meta VALUES ('fingerprint', ?)",
+                        (fingerprint,),
+                    )
+
+    @staticmethod
+    def key(text: str) -> str:
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+    def get(self, key):
+        data = self.memory.get(key)
+        if data is None and self.disk is not None:
+            row = self.disk.execute(
+                "SELECT data FROM docs WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                data = row[0]
+                self.disk_hits += 1
+                self.memory.put(key, data)
+        return data
+
+    def put(self, key, data):
+        self.memory.put(key, data)
+        if self.disk is not None:
+            with self.disk:
+                self.disk.execute(
+                    "INSERT OR REPLACE INTO docs VALUES (?, ?)", (key, data)
+                )
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            with self.disk:
+                self.disk.execute("DELETE FROM docs")
+
+    @property
+    def stats(self) -> dict:
+        stats = self.memory.stats
+        stats["disk_hits"] = self.disk_hits
+        stats["misses"] -= self.disk_hits
+        return stats
+
+
+class CachedPipeline:
+    """
+    Pipeline handle that returns cached results for texts it has already
+    processed. A hit is restored from the serialized Doc (tags, entities,
+    lemmas, NORM and the normalizer's extensions) without tokenizing or
+    running any component; only the misses of a batch go through the
+    pipeline.
+
+    Texts are cached as given, not normalized: the normalizer keeps
+    ``doc.text`` and its offsets as the original input, so texts that only
+    differ before normalization still need their own Docs.
+
+    Args:
+        nlp (Language): Loaded pipeline (or a LazyPipeline).
+        maxsize (int): Maximum number of Docs kept in memory.
+        cache_path (str): Optional SQLite file for the on-disk tier.
+    """
+
+    def __init__(self, nlp, maxsize=10000, cache_path=None):
+        self.nlp = nlp
+        if isinstance(nlp, LazyPipeline):
+            nlp = nlp.nlp
+        self.vocab = nlp.vocab
+        self.cache = DocCache(pipeline_fingerprint(nlp), maxsize, cache_path)
+
+    def _restore(self, data):
+        return Doc(self.vocab).from_bytes(data)
+
+    def __call__(self, text):
+        key = DocCache.key(text)
+        data = self.cache.get(key)
+        if data is not None:
+            return self._restore(data)
+        doc = self.nlp(text)
+        self.cache.put(key, doc.to_bytes(exclude=["tensor"]))
+        return doc
+
+    def pipe(self, texts, batch_size=1000, **kwargs):
+        for batch in minibatch(texts, size=batch_size):
+            keys = [DocCache.key(text) for text in batch]
+            found = {}
+            misses = {}
+            for key, text in zip(keys, batch):
+                if key in found or key in misses:
+                    # A repeat within the batch is served from the first
+                    # occurrence's Doc, so it counts as a hit
+                    self.cache.memory.hits += 1
+                    continue
+                data = self.cache.get(key)
+                if data is None:
+                    misses[key] = text
+                else:
+                    found[key] = data
+            processed = dict(
+                zip(
+                    misses,
+                    self.nlp.pipe(misses.values(), batch_size=batch_size, **kwargs),
+                )
+            )
+            for key, doc in processed.items():
+                found[key] = doc.to_bytes(exclude=["tensor"])
+                self.cache.put(key, found[key])
+            for key in keys:
+                # Repeats within the batch get their own copy of the Doc
+                doc = processed.pop(key, None)
+                yield doc if doc is not None else self._restore(found[key])
@@ -1,14 +1,442 @@
 import spacy
+from spacy.attrs import IDX, LEMMA, LENGTH, NORM, ORTH, TAG
 from spacy.language import Language
+from spacy.tokens import Doc
+from spacy.util import minibatch
 from pathlib import Path
+from collections import Counter, OrderedDict
+import argparse
+import mmap
+import numpy
+import re
+import shutil
+import struct
+import zlib
 
+# Affixes are tried in list order; the first stem found in the dictionary wins.
+# They are matched against normalized words (see NORMALIZATION_TABLE), so they
+# must not contain diacritics, kashida or Arabic letter variants.
+SUFFIXES = [
+    "ها",
+    "ی",
+    "تر",
+    "ترین",
+    "انه",
+    "یی",
+    "آسا",
+    "آگین",
+    "او",
+    "اومند",
+    "اور",
+    "ا",
+    "گین",
+    "اده",
+    "ار",
+    "اک",
+    "ال",
+    "اله",
+    "ان",
+    "انه",
+    "یک",
+    "ین",
+    "ینه",
+    "انی",
+    "بان",
+    "بد",
+    "تر",
+    "ترین",
+    "چه",
+    "دان",
+    "دیس",
+    "زار",
+    "سار",
+    "سان",
+    "وش",
+    "سیر",
+    "فام",
+    "وند",
+    "کده",
+    "گار",
+    "گاه",
+    "گاه",
+    "گر",
+    "گری",
+    "گون",
+    "لاخ",
+    "مان",
+    "مند",
+    "نا",
+    "ناک",
+    "ند",
+    "نده",
+    "وار",
+    "وار",
+    "واره",
+    "واری",
+    "ور",
+    "ه",
+    "ی",
+    "گرا",
+    "شده",
+    "گوش",
+    "مندی",
+    "گر",
+    "گین",
+    "ری",
+    "ور",
+    "یده",
+    "کار",
+    "یابی",
+    "یافته",
+    "ده",
+    "ش",
+    "ساز",
+    "نامه",
+    "شده",
+    "خوار",
+    "بند",
+    "ساز",
+    "ساز",
+    "جوی",
+    "شناس",
+    "خوار",
+    "شناس",
+    "ند",
+    "آور",
+    "طلب",
+    "آورده",
+    "آوری",
+    "جویی",
+    "گر",
+    "ناکی",
+    "گونه",
+    "گون",
+    "ای",
+    "یی",
+    "شان",
+    "یگر",
+    "یانه",
+    "تار",
+    "گره",
+    "لگن",
+    "گان",
+    "پذیر",
+    "کن",
+    "پوی",
+    "زن",
+    "گون",
+    "نی",
+    "گانه",
+    "شناس",
+    "پذیر",
+    "پرداز",
+    "حس",
+    "هایت",
+    "هایم",
+    "هایش",
+    "م",
+    "ن",
+    "ی",
+]
 
-def load_lemma_dictionary(file_path: str) -> dict:
+PREFIXES = [
+    "با",
+    "بی",
+    "نا",
+    "دی",
+    "به",
+    "اندر",
+    "ب",
+    "باز",
+    "بر",
+    "بس",
+    "بیش",
+    "پاد",
+    "پت",
+    "پرا",
+    "پس",
+    "پسا",
+    "پی",
+    "پیرا",
+    "پیش",
+    "ترا",
+    "تک",
+    "در",
+    "دژ",
+    "دش",
+    "می",
+    "سر",
+    "فر",
+    "فرا",
+    "فرو",
+    "نا",
+    "ن",
+    "وا",
+    "ور",
+    "هم",
+    "هو",
+    "ی",
+    "آ",
+    "پیش",
+    "پرا",
+    "ده",
+    "تا",
+    "همه",
+    "نیز",
+    "نا",
+    "ره",
+    "به",
+    "دگر",
+    "در",
+    "زیر",
+]
+
+
+# Key marking the end of an affix inside an AffixTrie node. Node keys are
+# otherwise single characters, so the empty string can never collide.
+_END = ""
+
+
+class AffixTrie:
+    """
+    Character trie over a list of affixes, compiled once and walked per word.
+
+    Suffixes are stored reversed so that a single walk from the end of a word
+    visits every suffix it ends with. Each affix remembers its position in the
+    original list, so matches come back in the same order a linear
+    ``endswith``/``startswith`` scan would try them.
+    """
+
+    def __init__(self, affixes, reverse=False):
+        """
+        Args:
+            affixes (list): Affixes in priority order. Duplicates are ignored.
+            reverse (bool): Store affixes reversed (for suffixes).
+        """
+        self.reverse = reverse
+        self.root = {}
+        self.size = 0
+        for affix in affixes:
+            node = self.root
+            for char in reversed(affix) if reverse else affix:
+                node = node.setdefault(char, {})
+            if _END not in node:
+                node[_END] = self.size
+                self.size += 1
+
+    def match(self, word: str) -> list:
+        """
+        Find every affix the word starts (or ends) with.
+
+        Args:
+            word (str): Input word.
+
+        Returns:
+            list: Lengths of the matching affixes, in priority order.
+        """
+        node = self.root
+        found = []
+        for depth, char in enumerate(reversed(word) if self.reverse else word, 1):
+            node = node.get(char)
+            if node is None:
+                break
+            rank = node.get(_END)
+            if rank is not None:
+                found.append((rank, depth))
+        found.sort()
+        return [length for _, length in found]
+
+
+class AffixIndex:
+    """
+    Compiled suffix and prefix tries used by ``lemmatize``.
+
+    Args:
+        suffixes (list): Suffixes in priority order.
+        prefixes (list): Prefixes in priority order.
+        combine_affixes (bool): Also try stripping a prefix and a suffix
+            together when neither alone yields a dictionary entry.
+        max_affix_combinations (int): Upper bound on prefix+suffix stems
+            probed per word when ``combine_affixes`` is set.
+    """
+
+    def __init__(
+        self,
+        suffixes=SUFFIXES,
+        prefixes=PREFIXES,
+        combine_affixes=False,
+        max_affix_combinations=8,
+    ):
+        self.suffixes = AffixTrie(suffixes, reverse=True)
+        self.prefixes = AffixTrie(prefixes)
+        self.combine_affixes = combine_affixes
+        self.max_affix_combinations = max_affix_combinations
+
+
+DEFAULT_AFFIXES = AffixIndex()
+
+
+class LRUCache:
+    """
+    Size-bounded mapping that evicts the least recently used entry.
+
+    Args:
+        maxsize (int): Maximum number of entries kept.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        value = self.data.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self.data[key] = value
+        if len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self.data.clear()
+
+    def __len__(self):
+        return len(self.data)
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "size": len(self.data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class ClockCache(LRUCache):
+    """
+    Size-bounded mapping with CLOCK (second chance) eviction.
+
+    Hits only set a reference bit instead of reordering entries, which makes
+    them cheaper than LRU hits at the cost of a less exact recency order.
+
+    Args:
+        maxsize (int): Maximum number of entries kept.
+    """
+
+    def __init__(self, maxsize):
+        super().__init__(maxsize)
+        self.data = {}
+        self.slots = {}  # key -> position on the clock
+        self.keys = []
+        self.referenced = []
+        self.hand = 0
+
+    def get(self, key):
+        value = self.data.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.referenced[self.slots[key]] = True
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        if key in self.data:
+            self.data[key] = value
+            return
+        if len(self.keys) < self.maxsize:
+            self.slots[key] = len(self.keys)
+            self.keys.append(key)
+            self.referenced.append(False)
+            self.data[key] = value
+            return
+        # Advance the hand, clearing reference bits, until an unreferenced
+        # entry is found; that slot is reused for the new key.
+        while self.referenced[self.hand]:
+            self.referenced[self.hand] = False
+            self.hand = (self.hand + 1) % self.maxsize
+        old_key = self.keys[self.hand]
+        del self.data[old_key]
+        del self.slots[old_key]
+        self.evictions += 1
+        self.keys[self.hand] = key
+        self.slots[key] = self.hand
+        self.data[key] = value
+        self.hand = (self.hand + 1) % self.maxsize
+
+    def clear(self):
+        self.data.clear()
+        self.slots.clear()
+        self.keys.clear()
+        self.referenced.clear()
+        self.hand = 0
+
+
+CACHE_POLICIES = {"lru": LRUCache, "clock": ClockCache}
+
+
+# Coarse (UD) POS for the Bijankhan-style tags in the dictionary's third column
+DICTIONARY_POS = {
+    "N": "NOUN",
+    "IDEN": "NOUN",
+    "ADJ": "ADJ",
+    "ADV": "ADV",
+    "V": "VERB",
+    "PR": "PRON",
+    "PREM": "DET",
+    "PRENUM": "NUM",
+    "POSNUM": "NUM",
+    "PREP": "ADP",
+    "POSTP": "ADP",
+    "CONJ": "CCONJ",
+    "SUBR": "SCONJ",
+    "PART": "PART",
+    "PSUS": "INTJ",
+    "ADR": "INTJ",
+    "PUNC": "PUNCT",
+}
+
+# Tagger labels looked up under another coarse POS in the dictionary
+TAG_ALIASES = {"AUX": "VERB", "PROPN": "NOUN"}
+
+# Tags whose tokens go through suffix/prefix stripping. Tokens with any other
+# tag resolve through the POS index alone or keep their surface form.
+AFFIX_TAGS = ["NOUN", "PROPN", "ADJ", "ADV", "VERB", "AUX", "PRON", "X"]
+
+
+def pos_key(word: str, pos: str) -> str:
+    """
+    Build the dictionary key of a (word, coarse POS) pair.
+
+    Args:
+        word (str): Word form.
+        pos (str): Coarse POS tag.
+
+    Returns:
+        str: Key of the pair in a lemma dictionary loaded with POS entries.
+    """
+    return f"{word}\t{pos}"
+
+
+def load_lemma_dictionary(file_path: str, with_pos: bool = False) -> dict:
     """
     Load a lemma dictionary from a file.
 
     Args:
         file_path (str): Path to the lemma dictionary file.
+        with_pos (bool): Also add ``pos_key(word, pos)`` entries built from
+            the POS column.
 
     Returns:
         dict: A dictionary where keys are words and values are their lemmas.
@@ -20,9 +448,33 @@ def load_lemma_dictionary(file_path: str) -> dict:
             if len(parts) == 3:
                 word, lemma, pos_tag = parts
                 lemma_dict[word] = lemma
+                if with_pos and pos_tag in DICTIONARY_POS:
+                    lemma_dict[pos_key(word, DICTIONARY_POS[pos_tag])] = lemma
     return lemma_dict
 
 
+# Character-level normalization: Arabic letter variants and digits map to
+# their Persian forms, ZWNJ to a space, and kashida and diacritics are
+# dropped. Every character maps to at most one character, so normalizing a
+# whole text and slicing out a token equals normalizing the token alone.
+NORMALIZATION_TABLE = str.maketrans(
+    {
+        "ئ": "ی",
+        "ي": "ی",
+        "ى": "ی",
+        "ك": "ک",
+        "ؤ": "و",
+        "إ": "ا",
+        "\u200c": " ",  # Zero Width Non-Joiner
+        "\u0640": None,  # Kashida
+        **{chr(code): None for code in range(0x064B, 0x0653)},  # Harakat
+        "\u0670": None,  # Superscript alef
+        **{chr(0x0660 + digit): chr(0x06F0 + digit) for digit in range(10)},
+    }
+)
+_DELETED_CHARS = re.compile("[\u0640\u064b-\u0652\u0670]")
+
+
 def normalize_text(word: str) -> str:
     """
     Normalize Persian text to standard form.
@@ -33,276 +485,544 @@ def normalize_text(word: str) -> str:
     Returns:
         str: Normalized word.
     """
-    word = (
-        word.replace("ئ", "ی").replace("ک", "ک").replace("گ", "گ")
-    )  # Example normalization
-    word = word.replace("ؤ", "و").replace("إ", "ا")  # More normalization rules
-    word = word.replace("\u200C", " ")  # Replace Zero Width Non-Joiner
-    return word
+    return word.translate(NORMALIZATION_TABLE)
 
 
-def remove_suffixes(word: str, dictionary: dict) -> str:
+def normalize_text_with_offsets(text: str) -> tuple:
+    """
+    Normalize a text and map the normalized characters back to the original.
+
+    Args:
+        text (str): Input text.
+
+    Returns:
+        tuple: The normalized text and an array holding, for each position in
+            it plus its end, the corresponding position in ``text``.
+    """
+    deleted = [match.start() for match in _DELETED_CHARS.finditer(text)]
+    offsets = numpy.delete(numpy.arange(len(text) + 1), deleted)
+    return text.translate(NORMALIZATION_TABLE), offsets
+
+
+def remove_suffixes(word: str, dictionary: dict, affixes=None) -> str:
     """
     Try removing each suffix and check if it exists in the dictionary.
 
     Args:
         word (str): Input word.
         dictionary (dict): Lemma dictionary.
+        affixes (AffixIndex): Compiled affixes. Defaults to DEFAULT_AFFIXES.
 
     Returns:
         str: Lemmatized word or the original word.
     """
-    suffixes = [
-        "ها",
-        "ی",
-        "تر",
-        "ترین",
-        "انه",
-        "یی",
-        "آسا",
-        "آگین",
-        "او",
-        "اومند",
-        "اور",
-        "ا",
-        "گین",
-        "اده",
-        "ار",
-        "اک",
-        "ال",
-        "اله",
-        "ُم",
-        "ان",
-        "انه",
-        "یک",
-        "ین",
-        "ینه",
-        "انی",
-        "بان",
-        "بد",
-        "تر",
-        "ترین",
-        "چه",
-        "دان",
-        "دیس",
-        "زار",
-        "سار",
-        "سان",
-        "ِستان",
-        "وش",
-        "سیر",
-        "ِش",
-        "فام",
-        "َک",
-        "وند",
-        "کده",
-        "گار",
-        "گاه",
-        "گاه",
-        "گر",
-        "گری",
-        "گون",
-        "لاخ",
-        "مان",
-        "مند",
-        "نا",
-        "ناک",
-        "ند",
-        "نده",
-        "وار",
-        "وار",
-        "واره",
-        "واری",
-        "ور",
-        "ه",
-        "ی",
-        "گرا",
-        "شده",
-        "گوش",
-        "مندی",
-        "گر",
-        "گین",
-        "ری",
-        "ور",
-        "یده",
-        "کار",
-        "یابی",
-        "یافته",
-        "ده",
-        "ش",
-        "ساز",
-        "نامه",
-        "شده",
-        "خوار",
-        "بند",
-        "ساز",
-        "ساز",
-        "جوی",
-        "شناس",
-        "خوار",
-        "شناس",
-        "ند",
-        "آور",
-        "طلب",
-        "آورده",
-        "آوری",
-        "جویی",
-        "گر",
-        "ناکی",
-        "گونه",
-        "گون",
-        "ای",
-        "یی",
-        "شان",
-        "یگر",
-        "یانه",
-        "ه‌ای",
-        "تار",
-        "گره",
-        "لگن",
-        "گان",
-        "پذیر",
-        "کن",
-        "پوی",
-        "زن",
-        "گون",
-        "نی",
-        "گانه",
-        "شناس",
-        "پذیر",
-        "پرداز",
-        "حس",
-        "هایت",
-        "هایم",
-        "هایش",
-        "م",
-        "ن",
-        "ی",
-        "می",
-    ]
-
-    for suffix in suffixes:
-        if word.endswith(suffix):
-            modified_word = word[: -len(suffix)].strip()
-            lemma = dictionary.get(modified_word, None)
-            if lemma:
-                return lemma
+    affixes = affixes or DEFAULT_AFFIXES
+    for length in affixes.suffixes.match(word):
+        modified_word = word[:-length].strip()
+        lemma = dictionary.get(modified_word, None)
+        if lemma:
+            return lemma
     return word
 
 
-def remove_prefixes(word: str, dictionary: dict) -> str:
+def remove_prefixes(word: str, dictionary: dict, affixes=None) -> str:
     """
     Try removing each prefix and check if it exists in the dictionary.
 
     Args:
         word (str): Input word.
         dictionary (dict): Lemma dictionary.
+        affixes (AffixIndex): Compiled affixes. Defaults to DEFAULT_AFFIXES.
+
+    Returns:
+        str: Lemmatized word or the original word.
+    """
+    affixes = affixes or DEFAULT_AFFIXES
+    for length in affixes.prefixes.match(word):
+        modified_word = word[length:].strip()
+        lemma = dictionary.get(modified_word, None)
+        if lemma:
+            return lemma
+    return word
+
+
+def remove_affixes(word: str, dictionary: dict, affixes=None) -> str:
+    """
+    Try removing a prefix and a suffix together and check the dictionary.
+
+    At most ``affixes.max_affix_combinations`` stems are probed, prefixes
+    taking precedence over suffixes.
+
+    Args:
+        word (str): Input word.
+        dictionary (dict): Lemma dictionary.
+        affixes (AffixIndex): Compiled affixes. Defaults to DEFAULT_AFFIXES.
 
     Returns:
         str: Lemmatized word or the original word.
     """
-    prefixes = [
-        "با",
-        "بی",
-        "نا",
-        "دی",
-        "به",
-        "اندر",
-        "ب",
-        "باز",
-        "بر",
-        "بس",
-        "بیش",
-        "پاد",
-        "پت",
-        "پرا",
-        "پس",
-        "پسا",
-        "پی",
-        "پیرا",
-        "پیش",
-        "ترا",
-        "تک",
-        "در",
-        "دژ",
-        "دش",
-        "سر",
-        "فر",
-        "فرا",
-        "فرو",
-        "نا",
-        "ن",
-        "وا",
-        "ور",
-        "هم",
-        "هو",
-        "ی",
-        "آ",
-        "پیش",
-        "پرا",
-        "ده",
-        "تا",
-        "همه",
-        "نیز",
-        "نا",
-        "ره",
-        "به",
-        "دگر",
-        "در",
-        "زیر",
-    ]
-
-    for prefix in prefixes:
-        if word.startswith(prefix):
-            modified_word = word[len(prefix) :].strip()
+    affixes = affixes or DEFAULT_AFFIXES
+    prefix_lengths = affixes.prefixes.match(word)
+    if not prefix_lengths:
+        return word
+    suffix_lengths = affixes.suffixes.match(word)
+    budget = affixes.max_affix_combinations
+    for prefix_length in prefix_lengths:
+        for suffix_length in suffix_lengths:
+            if prefix_length + suffix_length >= len(word):
+                continue
+            if budget <= 0:
+                return word
+            budget -= 1
+            modified_word = word[prefix_length:-suffix_length].strip()
             lemma = dictionary.get(modified_word, None)
             if lemma:
                 return lemma
     return word
 
 
-def lemmatize(word: str, dictionary: dict) -> str:
+def lemmatize(
+    word: str,
+    dictionary: dict,
+    affixes=None,
+    normalized_word: str = None,
+    counts: Counter = None,
+) -> str:
     """
     Lemmatize the word based on POS and search in the dictionary.
 
     Args:
         word (str): Input word.
         dictionary (dict): Lemma dictionary.
+        affixes (AffixIndex): Compiled affixes. Defaults to DEFAULT_AFFIXES.
+        normalized_word (str): ``normalize_text(word)``, if already known.
+        counts (Counter): If given, the lookup path that produced the lemma
+            ("dictionary", "suffix", "prefix", "prefix_suffix" or
+            "not_found") is counted in it.
 
     Returns:
         str: Lemmatized word or the original word.
     """
-    normalized_word = normalize_text(word)
+    affixes = affixes or DEFAULT_AFFIXES
+    if normalized_word is None:
+        normalized_word = normalize_text(word)
+    path = "not_found"
     lemma = dictionary.get(normalized_word, None)
     if lemma:
+        path = "dictionary"
+    else:
+        lemma = remove_suffixes(normalized_word, dictionary, affixes)
+        if lemma != normalized_word:
+            path = "suffix"
+        else:
+            lemma = remove_prefixes(normalized_word, dictionary, affixes)
+            if lemma != normalized_word:
+                path = "prefix"
+            elif affixes.combine_affixes:
+                lemma = remove_affixes(normalized_word, dictionary, affixes)
+                if lemma != normalized_word:
+                    path = "prefix_suffix"
+    if counts is not None:
+        counts[path] += 1
+    return word if path == "not_found" else lemma
+
+
+# Compiled lemma dictionary layout (all integers little-endian uint32):
+#   header   magic, entry count, bucket count
+#   entries  (word offset, word length, lemma offset, lemma length) per entry,
+#            sorted by word; offsets point into the string pool
+#   buckets  open-addressing hash index of entry number + 1 (0 = empty),
+#            keyed by the CRC-32 of the UTF-8 word
+#   pool     UTF-8 words and (deduplicated) lemmas
+LEMMA_DICT_MAGIC = b"FALEMMA1"
+_HEADER = struct.Struct("<8sII")
+_ENTRY = struct.Struct("<4I")
+_BUCKET = struct.Struct("<I")
+
+
+def write_lemma_dictionary(lemma_dict: dict, file_path: str) -> None:
+    """
+    Compile a lemma dictionary into the binary format read by
+    MappedLemmaDictionary.
+
+    Args:
+        lemma_dict (dict): Mapping of words to lemmas.
+        file_path (str): Path of the compiled file to write.
+    """
+    items = sorted(
+        (word.encode("utf-8"), lemma.encode("utf-8"))
+        for word, lemma in lemma_dict.items()
+    )
+    n_buckets = 1
+    while n_buckets < 2 * len(items):
+        n_buckets *= 2
+    mask = n_buckets - 1
+
+    pool = bytearray()
+    lemma_offsets = {}
+    entries = []
+    buckets = [0] * n_buckets
+    for index, (word, lemma) in enumerate(items):
+        word_offset = len(pool)
+        pool += word
+        if lemma not in lemma_offsets:
+            lemma_offsets[lemma] = len(pool)
+            pool += lemma
+        entries.append((word_offset, len(word), lemma_offsets[lemma], len(lemma)))
+        slot = zlib.crc32(word) & mask
+        while buckets[slot]:
+            slot = (slot + 1) & mask
+        buckets[slot] = index + 1
+
+    with open(file_path, "wb") as file:
+        file.write(_HEADER.pack(LEMMA_DICT_MAGIC, len(items), n_buckets))
+        for entry in entries:
+            file.write(_ENTRY.pack(*entry))
+        file.write(struct.pack(f"<{n_buckets}I", *buckets))
+        file.write(pool)
+
+
+def compile_lemma_dictionary(input_file: str, output_file: str) -> None:
+    """
+    Compile a tab-separated lemma dictionary file into the binary format.
+
+    Args:
+        input_file (str): Path to the lemma dictionary file.
+        output_file (str): Path of the compiled file to write.
+    """
+    lemma_dict = load_lemma_dictionary(input_file, with_pos=True)
+    write_lemma_dictionary(lemma_dict, output_file)
+
+
+class MappedLemmaDictionary:
+    """
+    Read-only, memory-mapped view of a compiled lemma dictionary.
+
+    Supports the ``get``/``in``/``len`` subset of the dict interface used by
+    ``lemmatize``. Opening is constant time and processes mapping the same
+    file share its pages through the OS page cache.
+
+    Args:
+        file_path (str): Path to a file written by write_lemma_dictionary.
+    """
+
+    def __init__(self, file_path):
+        self.path = str(file_path)
+        with open(self.path, "rb") as file:
+            self.buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.size, n_buckets = _HEADER.unpack_from(self.buffer, 0)
+        if magic != LEMMA_DICT_MAGIC:
+            raise ValueError(f"{self.path} is not a compiled lemma dictionary")
+        self.mask = n_buckets - 1
+        self.buckets_offset = _HEADER.size + _ENTRY.size * self.size
+        self.pool_offset = self.buckets_offset + _BUCKET.size * n_buckets
+
+    def _find(self, word: bytes):
+        buffer = self.buffer
+        pool = self.pool_offset
+        slot = zlib.crc32(word) & self.mask
+        while True:
+            (index,) = _BUCKET.unpack_from(buffer, self.buckets_offset + 4 * slot)
+            if not index:
+                return None
+            entry_offset = _HEADER.size + _ENTRY.size * (index - 1)
+            entry = _ENTRY.unpack_from(buffer, entry_offset)
+            word_offset, word_length = entry[0] + pool, entry[1]
+            if buffer[word_offset : word_offset + word_length] == word:
+                return entry
+            slot = (slot + 1) & self.mask
+
+    def get(self, word: str, default=None):
+        entry = self._find(word.encode("utf-8"))
+        if entry is None:
+            return default
+        lemma_offset = entry[2] + self.pool_offset
+        return self.buffer[lemma_offset : lemma_offset + entry[3]].decode("utf-8")
+
+    def __contains__(self, word):
+        return self._find(word.encode("utf-8")) is not None
+
+    def __len__(self):
+        return self.size
+
+    def __reduce__(self):
+        # Workers re-map the file rather than receiving a pickled copy
+        return (MappedLemmaDictionary, (self.path,))
+
+
+def lemmatize_tagged(
+    word: str,
+    tag: str,
+    dictionary: dict,
+    affixes=None,
+    affix_tags=AFFIX_TAGS,
+    normalized_word: str = None,
+    counts: Counter = None,
+) -> str:
+    """
+    Lemmatize a word using the tag assigned to it by the tagger.
+
+    The (word, tag) pair is looked up first. Words with a tag outside
+    ``affix_tags`` are returned unchanged when that lookup misses; the others,
+    and untagged words, fall back to ``lemmatize``.
+
+    Args:
+        word (str): Input word.
+        tag (str): Coarse POS tag of the word, or "" if untagged.
+        dictionary (dict): Lemma dictionary loaded with POS entries.
+        affixes (AffixIndex): Compiled affixes. Defaults to DEFAULT_AFFIXES.
+        affix_tags (list): Tags that may go through affix stripping.
+        normalized_word (str): ``normalize_text(word)``, if already known.
+        counts (Counter): If given, the lookup path is counted in it, as in
+            ``lemmatize``, plus "pos_dictionary" and "skipped_tag".
+
+    Returns:
+        str: Lemmatized word or the original word.
+    """
+    if normalized_word is None:
+        normalized_word = normalize_text(word)
+    if not tag:
+        return lemmatize(word, dictionary, affixes, normalized_word, counts)
+    lemma = dictionary.get(pos_key(normalized_word, TAG_ALIASES.get(tag, tag)))
+    if lemma:
+        if counts is not None:
+            counts["pos_dictionary"] += 1
         return lemma
-    lemma = remove_suffixes(normalized_word, dictionary)
-    if lemma != normalized_word:
-        return lemma
-    lemma = remove_prefixes(normalized_word, dictionary)
-    if lemma != normalized_word:
-        return lemma
-    return word
+    if tag not in affix_tags:
+        if counts is not None:
+            counts["skipped_tag"] += 1
+        return word
+    return lemmatize(word, dictionary, affixes, normalized_word, counts)
+
+
+if not Doc.has_extension("normalized_text"):
+    Doc.set_extension("normalized_text", default=None)
+if not Doc.has_extension("normalized_offsets"):
+    Doc.set_extension("normalized_offsets", default=None)
+
+
+@Language.factory(
+    "persian_normalizer",
+    assigns=["token.norm", "doc._.normalized_text", "doc._.normalized_offsets"],
+)
+def create_normalizer(nlp, name):
+    class NormalizerComponent:
+        """
+        Normalize the doc text once and store each token's normalized form as
+        its NORM. ``doc.text`` is left untouched, so token and entity offsets
+        stay valid; ``doc._.normalized_text`` holds the normalized text and
+        ``doc._.normalized_offsets`` maps its positions back to ``doc.text``.
+
+        NORM is a feature of the tagger and NER models, so add this component
+        after them.
+        """
+
+        def __call__(self, doc):
+            normalized, offsets = normalize_text_with_offsets(doc.text)
+            doc._.normalized_text = normalized
+            doc._.normalized_offsets = offsets
+            if not len(doc):
+                return doc
+            starts = doc.to_array(IDX).astype("int64")
+            ends = starts + doc.to_array(LENGTH)
+            strings = doc.vocab.strings
+            norms = [
+                strings.add(normalized[start:end])
+                for start, end in zip(
+                    numpy.searchsorted(offsets, starts).tolist(),
+                    numpy.searchsorted(offsets, ends).tolist(),
+                )
+            ]
+            doc.from_array([NORM], numpy.array(norms, dtype="uint64").reshape(-1, 1))
+            return doc
+
+    return NormalizerComponent()
 
 
 # Register the factory with spaCy
-@Language.factory("rule_based_lemmatizer")
-def create_lemmatizer(nlp, name, lemma_dict_path):
+@Language.factory("rule_based_lemmatizer", assigns=["token.lemma"])
+def create_lemmatizer(
+    nlp,
+    name,
+    lemma_dict_path=None,
+    combine_affixes=False,
+    max_affix_combinations=8,
+    cache_size=50000,
+    cache_policy="lru",
+    affix_tags=AFFIX_TAGS,
+):
     class LemmatizerComponent:
 
         def __init__(self, dictionary_path):
+            # Loaded on first use, so a pipeline restored with from_disk
+            # never parses the source dictionary
+            self._lemma_dict = None
+            self.dictionary_path = None
+            # Compile the affix tries once per component, not once per token
+            self.affixes = AffixIndex(
+                combine_affixes=combine_affixes,
+                max_affix_combinations=max_affix_combinations,
+            )
+            self.affix_tags = frozenset(affix_tags)
+            # (surface form, tag) -> lemma; a cache_size of 0 disables caching
+            if cache_policy not in CACHE_POLICIES:
+                raise ValueError(
+                    f"Unknown cache_policy {cache_policy!r}, "
+                    f"expected one of {sorted(CACHE_POLICIES)}"
+                )
+            self.cache = (
+                CACHE_POLICIES[cache_policy](cache_size) if cache_size > 0 else None
+            )
+            # Lookup path counters, only kept while the pipeline is instrumented
+            self.path_counts = None
+            if dictionary_path:
+                self.load_dictionary(dictionary_path)
+
+        def load_dictionary(self, dictionary_path):
+            """
+            Use a lemma dictionary file (.txt or compiled .bin). Saving the
+            pipeline copies it into the pipeline directory, so the path is
+            only needed while building.
+
+            Args:
+                dictionary_path (str): Path to the dictionary, relative to
+                    this module's directory if not absolute.
+            """
             # Ensure the path works after packaging
-            package_path = Path(
-                __file__
-            ).parent  # Get the directory of the current file
-            full_path = (
-                package_path / dictionary_path
-            ).resolve()  # Combine and resolve the full path
-            self.lemma_dict = load_lemma_dictionary(full_path.as_posix())
+            package_path = Path(__file__).parent
+            self.dictionary_path = (package_path / dictionary_path).resolve()
+            self._lemma_dict = None
+            if self.cache is not None:
+                self.cache.clear()
+
+        @property
+        def lemma_dict(self):
+            if self._lemma_dict is None:
+                if self.dictionary_path is None:
+                    raise ValueError(
+                        "rule_based_lemmatizer has no lemma dictionary: set "
+                        "lemma_dict_path or call load_dictionary"
+                    )
+                if self.dictionary_path.suffix == ".bin":
+                    self._lemma_dict = MappedLemmaDictionary(self.dictionary_path)
+                else:
+                    self._lemma_dict = load_lemma_dictionary(
+                        self.dictionary_path.as_posix(), with_pos=True
+                    )
+            return self._lemma_dict
+
+        @property
+        def cache_stats(self):
+            """Hit, miss and eviction counters of the lemma cache."""
+            return self.cache.stats if self.cache is not None else {}
+
+        def lemmatize(self, word, tag="", normalized_word=None):
+            if self.cache is None:
+                return lemmatize_tagged(
+                    word,
+                    tag,
+                    self.lemma_dict,
+                    self.affixes,
+                    self.affix_tags,
+                    normalized_word,
+                    self.path_counts,
+                )
+            lemma = self.cache.get((word, tag))
+            if lemma is None:
+                lemma = lemmatize_tagged(
+                    word,
+                    tag,
+                    self.lemma_dict,
+                    self.affixes,
+                    self.affix_tags,
+                    normalized_word,
+                    self.path_counts,
+                )
+                self.cache.put((word, tag), lemma)
+            return lemma
 
         def __call__(self, doc):
-            for token in doc:
-                token.lemma_ = lemmatize(token.text, self.lemma_dict)
+            self.set_lemmas([doc])
             return doc
 
+        def pipe(self, docs, batch_size=1000):
+            for batch in minibatch(docs, size=batch_size):
+                self.set_lemmas(batch)
+                yield from batch
+
+        def set_lemmas(self, docs):
+            """
+            Lemmatize each distinct (word, tag) type in the docs once and
+            write the LEMMA attribute back to every doc in bulk. Docs that went
+            through persian_normalizer are not normalized again.
+
+            Args:
+                docs (list): Docs sharing one vocab.
+            """
+            if not docs:
+                return
+            strings = docs[0].vocab.strings
+            arrays = []
+            for doc in docs:
+                array = doc.to_array([ORTH, TAG, NORM])
+                # NORM is only the normalized form after persian_normalizer ran
+                if doc._.normalized_text is None:
+                    array[:, 2] = 0
+                arrays.append(array)
+            types, inverse = numpy.unique(
+                numpy.concatenate(arrays), axis=0, return_inverse=True
+            )
+            lemma_hashes = numpy.fromiter(
+                (
+                    strings.add(
+                        self.lemmatize(
+                            strings[orth], strings[tag], strings[norm] if norm else None
+                        )
+                    )
+                    for orth, tag, norm in types.tolist()
+                ),
+                dtype="uint64",
+                count=len(types),
+            )
+            lemmas = lemma_hashes[inverse.ravel()]
+            start = 0
+            for doc, array in zip(docs, arrays):
+                end = start + len(array)
+                if end > start:
+                    doc.from_array([LEMMA], lemmas[start:end].reshape(-1, 1))
+                start = end
+
+        def to_disk(self, path, exclude=tuple()):
+            path = Path(path)
+            path.mkdir(parents=True, exist_ok=True)
+            output_file = path / "lemma_dict.bin"
+            lemma_dict = self.lemma_dict
+            if isinstance(lemma_dict, MappedLemmaDictionary):
+                if Path(lemma_dict.path).resolve() != output_file.resolve():
+                    shutil.copyfile(lemma_dict.path, output_file)
+            else:
+                write_lemma_dictionary(lemma_dict, output_file)
+
+        def from_disk(self, path, exclude=tuple()):
+            self._lemma_dict = MappedLemmaDictionary(Path(path) / "lemma_dict.bin")
+            if self.cache is not None:
+                self.cache.clear()
+            return self
+
     return LemmatizerComponent(lemma_dict_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compile a lemma dictionary into a memory-mappable binary file."
+    )
+    parser.add_argument(
+        "--input_file", required=True, help="Path to the lemma dictionary file."
+    )
+    parser.add_argument(
+        "--output_file", required=True, help="Path to the compiled output file."
+    )
+    args = parser.parse_args()
+
+    compile_lemma_dictionary(args.input_file, args.output_file)
+    print(f"Compiled lemma dictionary saved to: {args.output_file}")
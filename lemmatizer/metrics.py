@@ -0,0 +1,241 @@
+"""
+Opt-in per-component timing of a loaded pipeline, with Prometheus export.
+"""
+
+from spacy.util import minibatch
+from collections import Counter
+from bisect import bisect_left
+import time
+import numpy
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+
+class PipelineMetrics:
+    """
+    Per-component latency histograms and doc/token counts of an instrumented
+    pipeline, plus the cache and lookup path counters of its lemmatizers.
+
+    Args:
+        buckets (tuple): Upper bounds of the latency buckets, in seconds.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.components = {}
+        self.lemmatizers = {}
+
+    def observe(self, name, seconds, n_docs, n_tokens):
+        """
+        Record one call of a component (one doc, or one batch through pipe).
+
+        Args:
+            name (str): Component name.
+            seconds (float): Time spent in the call.
+            n_docs (int): Number of docs processed.
+            n_tokens (int): Number of tokens processed.
+        """
+        stats = self.components.get(name)
+        if stats is None:
+            stats = self.components[name] = {
+                "bucket_counts": [0] * (len(self.buckets) + 1),
+                "sum": 0.0,
+                "count": 0,
+                "docs": 0,
+                "tokens": 0,
+            }
+        stats["bucket_counts"][bisect_left(self.buckets, seconds)] += 1
+        stats["sum"] += seconds
+        stats["count"] += 1
+        stats["docs"] += n_docs
+        stats["tokens"] += n_tokens
+
+    def reset(self):
+        """Clear the recorded timings and lookup path counts."""
+        self.components = {}
+        for lemmatizer in self.lemmatizers.values():
+            if lemmatizer.path_counts is not None:
+                lemmatizer.path_counts.clear()
+
+    def snapshot(self) -> dict:
+        """
+        Returns:
+            dict: Per component, the cumulative latency histogram (keyed by
+                bucket upper bound), its sum and count, and the docs and
+                tokens processed; per lemmatizer, its cache statistics and
+                lookup path counts.
+        """
+        components = {}
+        for name, stats in self.components.items():
+            cumulative = numpy.cumsum(stats["bucket_counts"]).tolist()
+            bounds = [str(bound) for bound in self.buckets] + ["+Inf"]
+            components[name] = {
+                "latency_seconds": {
+                    "buckets": dict(zip(bounds, cumulative)),
+                    "sum": stats["sum"],
+                    "count": stats["count"],
+                },
+                "docs": stats["docs"],
+                "tokens": stats["tokens"],
+            }
+        lemmatizers = {
+            name: {
+                "cache": lemmatizer.cache_stats,
+                "lookup_paths": dict(lemmatizer.path_counts or {}),
+            }
+            for name, lemmatizer in self.lemmatizers.items()
+        }
+        return {"components": components, "lemmatizers": lemmatizers}
+
+    def to_prometheus(self, prefix="fa_pipeline") -> str:
+        """
+        Export a snapshot in the Prometheus text exposition format.
+
+        Args:
+            prefix (str): Prefix of the metric names.
+
+        Returns:
+            str: The metrics, one sample per line.
+        """
+        snapshot = self.snapshot()
+        lines = [
+            f"# HELP {prefix}_component_latency_seconds Time per component call.",
+            f"# TYPE {prefix}_component_latency_seconds histogram",
+        ]
+        for name, stats in snapshot["components"].items():
+            latency = stats["latency_seconds"]
+            for bound, count in latency["buckets"].items():
+                lines.append(
+                    f"{prefix}_component_latency_seconds_bucket"
+                    f'{{component="{name}",le="{bound}"}} {count}'
+                )
+            lines.append(
+                f'{prefix}_component_latency_seconds_sum{{component="{name}"}} '
+                f"{latency['sum']}"
+            )
+            lines.append(
+                f'{prefix}_component_latency_seconds_count{{component="{name}"}} '
+                f"{latency['count']}"
+            )
+        for key in ("docs", "tokens"):
+            lines.append(f"# TYPE {prefix}_component_{key}_total counter")
+            for name, stats in snapshot["components"].items():
+                lines.append(
+                    f'{prefix}_component_{key}_total{{component="{name}"}} {stats[key]}'
+                )
+        lemmatizers = snapshot["lemmatizers"]
+        for key in ("hits", "misses", "evictions"):
+            lines.append(f"# TYPE {prefix}_lemmatizer_cache_{key}_total counter")
+            for name, stats in lemmatizers.items():
+                if key in stats["cache"]:
+                    lines.append(
+                        f"{prefix}_lemmatizer_cache_{key}_total"
+                        f'{{component="{name}"}} {stats["cache"][key]}'
+                    )
+        lines.append(f"# TYPE {prefix}_lemmatizer_cache_size gauge")
+        for name, stats in lemmatizers.items():
+            if "size" in stats["cache"]:
+                lines.append(
+                    f'{prefix}_lemmatizer_cache_size{{component="{name}"}} '
+                    f'{stats["cache"]["size"]}'
+                )
+        lines.append(f"# TYPE {prefix}_lemmatizer_lookups_total counter")
+        for name, stats in lemmatizers.items():
+            for path, count in sorted(stats["lookup_paths"].items()):
+                lines.append(
+                    f"{prefix}_lemmatizer_lookups_total"
+                    f'{{component="{name}",path="{path}"}} {count}'
+                )
+        return "\n".join(lines) + "\n"
+
+
+class InstrumentedComponent:
+    """
+    Wrapper timing each call of a pipeline component (or the tokenizer) into
+    a PipelineMetrics. Any other attribute is read from the wrapped component.
+
+    Args:
+        name (str): Component name.
+        component: The wrapped component.
+        metrics (PipelineMetrics): Where the timings are recorded.
+    """
+
+    def __init__(self, name, component, metrics):
+        self.name = name
+        self.component = component
+        self.metrics = metrics
+
+    def __getattr__(self, attr):
+        return getattr(self.component, attr)
+
+    def __call__(self, doc):
+        start = time.perf_counter()
+        doc = self.component(doc)
+        self.metrics.observe(self.name, time.perf_counter() - start, 1, len(doc))
+        return doc
+
+    def pipe(self, docs, batch_size=1000, **kwargs):
+        for batch in minibatch(docs, size=batch_size):
+            start = time.perf_counter()
+            if hasattr(self.component, "pipe"):
+                batch = list(
+                    self.component.pipe(batch, batch_size=batch_size, **kwargs)
+                )
+            else:
+                batch = [self.component(doc) for doc in batch]
+            self.metrics.observe(
+                self.name,
+                time.perf_counter() - start,
+                len(batch),
+                sum(len(doc) for doc in batch),
+            )
+            yield from batch
+
+
+def instrument_pipeline(nlp, metrics=None):
+    """
+    Time the tokenizer and every pipe of a loaded pipeline, and turn on the
+    lookup path counters of its lemmatizers. Pipelines that are not
+    instrumented run without any overhead.
+
+    Args:
+        nlp (Language): Loaded pipeline.
+        metrics (PipelineMetrics): Where to record. Defaults to a new one.
+
+    Returns:
+        PipelineMetrics: The metrics being recorded.
+    """
+    if isinstance(nlp.tokenizer, InstrumentedComponent):
+        return nlp.tokenizer.metrics
+    metrics = metrics or PipelineMetrics()
+    nlp.tokenizer = InstrumentedComponent("tokenizer", nlp.tokenizer, metrics)
+    # Language has no public API to swap a component in place
+    nlp._components = [
+        (name, InstrumentedComponent(name, proc, metrics))
+        for name, proc in nlp._components
+    ]
+    for name, proc in nlp._components:
+        if hasattr(proc.component, "path_counts"):
+            proc.component.path_counts = Counter()
+            metrics.lemmatizers[name] = proc.component
+    return metrics
+
+
+def uninstrument_pipeline(nlp):
+    """
+    Remove the wrappers added by ``instrument_pipeline``.
+
+    Args:
+        nlp (Language): Instrumented pipeline.
+    """
+    if not isinstance(nlp.tokenizer, InstrumentedComponent):
+        return
+    nlp.tokenizer = nlp.tokenizer.component
+    nlp._components = [
+        (name, proc.component if isinstance(proc, InstrumentedComponent) else proc)
+        for name, proc in nlp._components
+    ]
+    for _, proc in nlp._components:
+        if hasattr(proc, "path_counts"):
+            proc.path_counts = None
@@ -0,0 +1,110 @@
+"""
+Load the saved pipeline, fully or only the components a process needs.
+"""
+
+import spacy
+from pathlib import Path
+
+# Importing these modules registers the "persian_normalizer",
+# "rule_based_lemmatizer" and "lazy_vectors" factories
+import lemmatizer.lemmatizer  # noqa: F401
+from lemmatizer.vectors import load_mapped_vectors
+
+# Factories of the components that listeners can share, see Tok2VecListener
+UPSTREAM_FACTORIES = ("tok2vec", "transformer", "curated_transformer")
+
+
+def listened_components(config, components):
+    """
+    Find the components (e.g. a shared tok2vec) whose output the listeners of
+    the given components read. Without them the listeners get no input.
+
+    Args:
+        config (Config): Config of the saved pipeline.
+        components (list): Names of the components.
+
+    Returns:
+        list: Names of the upstream components, in pipeline order.
+    """
+    upstreams = set()
+    sections = [config["components"][name] for name in components]
+    while sections:
+        section = sections.pop()
+        for value in section.values():
+            if isinstance(value, dict):
+                sections.append(value)
+        if "Listener" in section.get("@architectures", ""):
+            upstreams.add(section.get("upstream", "*"))
+    return [
+        name
+        for name in config["nlp"]["pipeline"]
+        if name in upstreams
+        or (
+            "*" in upstreams
+            and config["components"][name].get("factory") in UPSTREAM_FACTORIES
+        )
+    ]
+
+
+def load_pipeline(path, components=None, vectors=False, exclude=tuple(), **kwargs):
+    """
+    Load a saved pipeline with only the components a process needs.
+
+    Args:
+        path (str): Path to the saved pipeline (e.g. fa_core_web_sm).
+        components (list): Names of the components to load. Defaults to all.
+            Components they listen to (a shared tok2vec) are loaded as well.
+        vectors (bool): Whether to attach the word vectors, memory-mapped.
+        exclude (list): Further names passed to ``spacy.load``.
+        **kwargs: Passed on to ``spacy.load``.
+
+    Returns:
+        Language: The loaded pipeline.
+    """
+    path = Path(path)
+    exclude = list(exclude)
+    if components is not None:
+        config = spacy.util.load_config(path / "config.cfg")
+        # A shared tok2vec is loaded along with the components listening to it
+        kept = set(components) | set(listened_components(config, components))
+        exclude += [name for name in config["nlp"]["pipeline"] if name not in kept]
+    nlp = spacy.load(path, exclude=exclude + ["vectors"], **kwargs)
+    has_vectors = (path / "vocab" / "vectors").exists() or (
+        path / "vectors_quantized"
+    ).exists()
+    if vectors and has_vectors:
+        load_mapped_vectors(nlp.vocab, path)
+    return nlp
+
+
+class LazyPipeline:
+    """
+    Pipeline handle that loads nothing until the first text is processed.
+
+    Args:
+        path (str): Path to the saved pipeline.
+        components (list): Names of the components to load. Defaults to all.
+        vectors (bool): Whether to attach the word vectors, memory-mapped.
+        **kwargs: Passed on to ``load_pipeline``.
+    """
+
+    def __init__(self, path, components=None, vectors=False, **kwargs):
+        self.path = path
+        self.components = components
+        self.vectors = vectors
+        self.kwargs = kwargs
+        self._nlp = None
+
+    @property
+    def nlp(self):
+        if self._nlp is None:
+            self._nlp = load_pipeline(
+                self.path, self.components, self.vectors, **self.kwargs
+            )
+        return self._nlp
+
+    def __call__(self, text):
+        return self.nlp(text)
+
+    def pipe(self, texts, **kwargs):
+        return self.nlp.pipe(texts, **kwargs)
@@ -0,0 +1,326 @@
+"""
+Batched nearest-neighbour search over the word vectors, exact or through an
+IVF index.
+"""
+
+from pathlib import Path
+import numpy
+
+from lemmatizer.vectors import MappedKeyIndex
+
+
+class VectorSearch:
+    """
+    Batched exact (or IVF-approximate) nearest-neighbour search over the rows
+    of a vector table by cosine similarity.
+
+    The rows are L2-normalized once into a matrix stored as float32, float16
+    or int8 (scaled by 127); queries are scored against it block by block, so
+    the score matrix of a batch never exceeds block_size columns, and the
+    top k of each block are merged with ``argpartition``. A row shared by
+    several words (after pruning) is returned as one of them.
+
+    Args:
+        vocab (Vocab): Vocab holding the vectors (possibly memory-mapped or
+            quantized, see load_mapped_vectors).
+        dtype (str): "float32", "float16" or "int8" storage of the matrix.
+        block_size (int): Rows of the matrix scored at a time.
+        index (IVFIndex): Optional approximate index over the matrix.
+    """
+
+    def __init__(self, vocab, dtype="float32", block_size=8192, index=None):
+        if dtype not in ("float32", "float16", "int8"):
+            raise ValueError(f"Unknown dtype {dtype!r}")
+        self.strings = vocab.strings
+        self.block_size = block_size
+        vectors = vocab.vectors
+        key2row = self.key2row = vectors.key2row
+        if isinstance(key2row, MappedKeyIndex):
+            keys, rows = key2row.keys_array, key2row.rows_array
+        else:
+            keys = numpy.fromiter(key2row.keys(), dtype="uint64", count=len(key2row))
+            rows = numpy.fromiter(key2row.values(), dtype="int64", count=len(key2row))
+        # One key per table row; rows without any key are left out
+        order = numpy.argsort(rows, kind="stable")
+        self.rows, first = numpy.unique(rows[order], return_index=True)
+        self.keys = numpy.asarray(keys)[order][first]
+
+        self.scale = 127.0 if dtype == "int8" else 1.0
+        self.matrix = numpy.empty((len(self.rows), vectors.shape[1]), dtype=dtype)
+        for start in range(0, len(self.rows), 65536):
+            block = numpy.asarray(
+                vectors.data[self.rows[start : start + 65536]], dtype="float32"
+            )
+            norms = numpy.linalg.norm(block, axis=1, keepdims=True)
+            block /= numpy.where(norms == 0, 1, norms)
+            if dtype == "int8":
+                block = numpy.rint(block * self.scale)
+            self.matrix[start : start + len(block)] = block
+        if index is not None and len(index.list_rows) != len(self.rows):
+            raise ValueError("The index was built for a different vector table")
+        self.index = index
+
+    def lookup(self, words):
+        """
+        Args:
+            words (list): Words to look up.
+
+        Returns:
+            numpy.ndarray: Position of each word's row in the matrix, or -1.
+        """
+        table_rows = numpy.array(
+            [self.key2row.get(self.strings[word], -1) for word in words],
+            dtype="int64",
+        ).reshape(-1)
+        positions = numpy.searchsorted(self.rows, table_rows)
+        positions = numpy.minimum(positions, len(self.rows) - 1)
+        return numpy.where(self.rows[positions] == table_rows, positions, -1)
+
+    def scores(self, positions, queries):
+        """
+        Args:
+            positions (slice or numpy.ndarray): Rows of the matrix to score.
+            queries (numpy.ndarray): Normalized float32 queries.
+
+        Returns:
+            numpy.ndarray: Cosine similarity of every query to every row.
+        """
+        rows = numpy.asarray(self.matrix[positions], dtype="float32")
+        return queries @ rows.T / self.scale
+
+    def search(self, queries, k=10, exclude=None, n_probe=None):
+        """
+        Find the k rows most similar to each query vector.
+
+        Args:
+            queries (numpy.ndarray): Query vectors, one per row.
+            k (int): Number of neighbours.
+            exclude (numpy.ndarray): Position to leave out for each query
+                (e.g. the query word itself), or -1.
+            n_probe (int): Search only this many IVF lists; None (or no
+                index) searches exhaustively.
+
+        Returns:
+            tuple: Positions and scores of the neighbours, both of shape
+                (n_queries, k) and best first.
+        """
+        queries = numpy.atleast_2d(numpy.asarray(queries, dtype="float32"))
+        norms = numpy.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / numpy.where(norms == 0, 1, norms)
+        if exclude is None:
+            exclude = numpy.full(len(queries), -1)
+        k = min(k, len(self.rows))
+        if n_probe and self.index is not None:
+            return self._search_ivf(queries, k, exclude, n_probe)
+
+        best_ids = numpy.empty((len(queries), 0), dtype="int64")
+        best_scores = numpy.empty((len(queries), 0), dtype="float32")
+        for start in range(0, len(self.rows), self.block_size):
+            end = min(start + self.block_size, len(self.rows))
+            scores = self.scores(slice(start, end), queries)
+            hit = (exclude >= start) & (exclude < end)
+            scores[hit.nonzero()[0], exclude[hit] - start] = -numpy.inf
+            top = numpy.argpartition(-scores, min(k, end - start) - 1, axis=1)
+            top = top[:, :k]
+            best_ids = numpy.concatenate([best_ids, top + start], axis=1)
+            best_scores = numpy.concatenate(
+                [best_scores, numpy.take_along_axis(scores, top, axis=1)], axis=1
+            )
+            if best_ids.shape[1] > k:
+                keep = numpy.argpartition(-best_scores, k - 1, axis=1)[:, :k]
+                best_ids = numpy.take_along_axis(best_ids, keep, axis=1)
+                best_scores = numpy.take_along_axis(best_scores, keep, axis=1)
+        order = numpy.argsort(-best_scores, axis=1)
+        return (
+            numpy.take_along_axis(best_ids, order, axis=1),
+            numpy.take_along_axis(best_scores, order, axis=1),
+        )
+
+    def _search_ivf(self, queries, k, exclude, n_probe):
+        ids = numpy.zeros((len(queries), k), dtype="int64")
+        best = numpy.full((len(queries), k), -numpy.inf, dtype="float32")
+        for i, candidates in enumerate(self.index.candidates(queries, n_probe)):
+            candidates = candidates[candidates != exclude[i]]
+            if not len(candidates):
+                continue
+            scores = self.scores(candidates, queries[i : i + 1])[0]
+            n = min(k, len(candidates))
+            top = numpy.argpartition(-scores, n - 1)[:n]
+            top = top[numpy.argsort(-scores[top])]
+            ids[i, :n] = candidates[top]
+            best[i, :n] = scores[top]
+        return ids, best
+
+    def most_similar(self, words, k=10, n_probe=None):
+        """
+        Find the k most similar words of each word, leaving out the word
+        itself.
+
+        Args:
+            words (list): Query words.
+            k (int): Number of neighbours per word.
+            n_probe (int): IVF lists searched; None searches exhaustively.
+
+        Returns:
+            list: For each word, (word, similarity) pairs, best first; empty
+                for words without a vector.
+        """
+        positions = self.lookup(words)
+        found = positions >= 0
+        results = [[] for _ in words]
+        if not found.any():
+            return results
+        queries = numpy.asarray(self.matrix[positions[found]], dtype="float32")
+        ids, scores = self.search(queries, k, positions[found], n_probe)
+        for i, row_ids, row_scores in zip(found.nonzero()[0], ids, scores):
+            results[i] = [
+                (self.strings[int(self.keys[row_id])], float(score))
+                for row_id, score in zip(row_ids.tolist(), row_scores.tolist())
+                if score > -numpy.inf
+            ]
+        return results
+
+
+class IVFIndex:
+    """
+    Inverted file index for approximate search: the rows of a VectorSearch
+    matrix are clustered with spherical k-means, and a query only scores the
+    rows of the n_probe clusters whose centroids are closest to it.
+
+    Args:
+        centroids (numpy.ndarray): Normalized centroid of each list.
+        list_offsets (numpy.ndarray): Start of each list in list_rows, plus
+            the end of the last one.
+        list_rows (numpy.ndarray): Matrix positions, grouped by list.
+    """
+
+    def __init__(self, centroids, list_offsets, list_rows):
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.list_rows = list_rows
+
+    @classmethod
+    def build(cls, search, n_lists=None, n_iter=10, sample_size=100000, seed=0):
+        """
+        Args:
+            search (VectorSearch): Search whose matrix is indexed.
+            n_lists (int): Number of lists. Defaults to the square root of
+                the number of rows.
+            n_iter (int): k-means iterations.
+            sample_size (int): Rows the centroids are trained on.
+            seed (int): Random seed.
+
+        Returns:
+            IVFIndex: The index.
+        """
+        n_rows = len(search.rows)
+        n_lists = min(n_lists or int(numpy.sqrt(n_rows)), n_rows)
+        rng = numpy.random.default_rng(seed)
+        sample = numpy.sort(rng.choice(n_rows, min(sample_size, n_rows), False))
+        points = numpy.asarray(search.matrix[sample], dtype="float32") / search.scale
+        centroids = points[rng.choice(len(points), n_lists, replace=False)]
+        for _ in range(n_iter):
+            labels = cls._assign(points, centroids, search.block_size)
+            sums = numpy.zeros_like(centroids)
+            numpy.add.at(sums, labels, points)
+            # Empty lists restart from a random point
+            empty = numpy.bincount(labels, minlength=n_lists) == 0
+            sums[empty] = points[rng.choice(len(points), int(empty.sum()))]
+            norms = numpy.linalg.norm(sums, axis=1, keepdims=True)
+            centroids = sums / numpy.where(norms == 0, 1, norms)
+
+        labels = numpy.concatenate(
+            [
+                cls._assign(
+                    numpy.asarray(search.matrix[start : start + 65536], "float32"),
+                    centroids,
+                    search.block_size,
+                )
+                for start in range(0, n_rows, 65536)
+            ]
+        )
+        list_rows = numpy.argsort(labels, kind="stable")
+        list_offsets = numpy.concatenate(
+            [[0], numpy.cumsum(numpy.bincount(labels, minlength=n_lists))]
+        )
+        return cls(centroids.astype("float32"), list_offsets, list_rows)
+
+    @staticmethod
+    def _assign(points, centroids, block_size):
+        return numpy.concatenate(
+            [
+                numpy.argmax(points[start : start + block_size] @ centroids.T, axis=1)
+                for start in range(0, len(points), block_size)
+            ]
+        )
+
+    def candidates(self, queries, n_probe):
+        """
+        Args:
+            queries (numpy.ndarray): Normalized float32 queries.
+            n_probe (int): Number of lists searched per query.
+
+        Yields:
+            numpy.ndarray: Matrix positions to score for each query.
+        """
+        n_probe = min(n_probe, len(self.centroids))
+        probes = numpy.argpartition(-(queries @ self.centroids.T), n_probe - 1, axis=1)
+        for lists in probes[:, :n_probe]:
+            yield numpy.concatenate(
+                [
+                    self.list_rows[self.list_offsets[i] : self.list_offsets[i + 1]]
+                    for i in lists
+                ]
+            )
+
+    def save(self, path):
+        """
+        Args:
+            path (str): Directory to write the index to (e.g. vectors_ivf/ in
+                the pipeline directory).
+        """
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        numpy.save(path / "centroids.npy", self.centroids)
+        numpy.save(path / "list_offsets.npy", self.list_offsets)
+        numpy.save(path / "list_rows.npy", self.list_rows)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Args:
+            path (str): Directory written by save; the lists are memory-mapped.
+
+        Returns:
+            IVFIndex: The index.
+        """
+        path = Path(path)
+        return cls(
+            numpy.load(path / "centroids.npy"),
+            numpy.load(path / "list_offsets.npy"),
+            numpy.load(path / "list_rows.npy", mmap_mode="r"),
+        )
+
+
+def recall_at_k(search, words, k=10, n_probe=8):
+    """
+    Measure how many of the exact k nearest neighbours the IVF index finds.
+
+    Args:
+        search (VectorSearch): Search with an index.
+        words (list): Query words.
+        k (int): Number of neighbours.
+        n_probe (int): IVF lists searched per query.
+
+    Returns:
+        float: Mean fraction of the exact neighbours found.
+    """
+    exact = search.most_similar(words, k)
+    approximate = search.most_similar(words, k, n_probe=n_probe)
+    recalls = [
+        len({word for word, _ in found} & {word for word, _ in expected})
+        / len(expected)
+        for expected, found in zip(exact, approximate)
+        if expected
+    ]
+    return float(numpy.mean(recalls)) if recalls else 0.0
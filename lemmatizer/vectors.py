@@ -0,0 +1,236 @@
+"""
+Memory-mapped and quantized vector tables, and the lazy_vectors component
+that attaches them to pipelines saved without vectors.
+"""
+
+from spacy.language import Language
+from pathlib import Path
+import numpy
+import srsly
+
+
+class MappedKeyIndex:
+    """
+    Read-only key -> row mapping over sorted key and row arrays.
+
+    Used as ``Vectors.key2row`` so the key index, like the vector data, can be
+    memory-mapped instead of being unpacked into a per-process dict.
+
+    Args:
+        keys (numpy.ndarray): Sorted uint64 vector keys.
+        rows (numpy.ndarray): Row of each key in the vectors table.
+    """
+
+    def __init__(self, keys, rows):
+        self.keys_array = keys
+        self.rows_array = rows
+
+    def _find(self, key):
+        key = numpy.uint64(key)
+        index = int(numpy.searchsorted(self.keys_array, key))
+        if index < len(self.keys_array) and self.keys_array[index] == key:
+            return index
+        return None
+
+    def get(self, key, default=None):
+        index = self._find(key)
+        return default if index is None else int(self.rows_array[index])
+
+    def __getitem__(self, key):
+        index = self._find(key)
+        if index is None:
+            raise KeyError(key)
+        return int(self.rows_array[index])
+
+    def __contains__(self, key):
+        return self._find(key) is not None
+
+    def __len__(self):
+        return len(self.keys_array)
+
+    def __iter__(self):
+        return iter(self.keys_array.tolist())
+
+    def keys(self):
+        return self.keys_array.tolist()
+
+    def values(self):
+        return self.rows_array.tolist()
+
+    def items(self):
+        return zip(self.keys_array.tolist(), self.rows_array.tolist())
+
+    def copy(self):
+        return dict(self.items())
+
+
+class QuantizedVectorTable(numpy.ndarray):
+    """
+    Read-only vector table stored as float16, or as int8 codes with one scale
+    per row, that dequantizes rows to float32 when they are indexed.
+
+    Used as ``Vectors.data``, so ``similarity`` and ``vector`` work unchanged.
+    It subclasses ndarray because spaCy checks the table's array type, but
+    whole-array numpy operations see the raw codes; only indexing dequantizes.
+
+    Args:
+        codes (numpy.ndarray): float16 rows, or int8 codes.
+        scales (numpy.ndarray): float32 scale of each int8 row, or None.
+    """
+
+    def __new__(cls, codes, scales=None):
+        table = numpy.asarray(codes).view(cls)
+        table.scales = scales
+        return table
+
+    def __array_finalize__(self, obj):
+        self.scales = getattr(obj, "scales", None)
+
+    @property
+    def codes(self):
+        return self.view(numpy.ndarray)
+
+    @property
+    def nbytes(self):
+        codes_size = self.codes.nbytes
+        return codes_size + (0 if self.scales is None else self.scales.nbytes)
+
+    def __getitem__(self, index):
+        rows = numpy.array(self.codes[index], dtype="float32")
+        if self.scales is not None:
+            scales = numpy.asarray(self.scales[index], dtype="float32")
+            rows *= scales[..., None] if rows.ndim > 1 else scales
+        return rows
+
+
+def quantize_vectors(data, mode, batch_size=65536):
+    """
+    Quantize a float32 vector table.
+
+    Args:
+        data (numpy.ndarray): The vector table.
+        mode (str): "float16", or "int8" for int8 codes with per-row scales.
+        batch_size (int): Rows converted at a time, bounding peak memory.
+
+    Returns:
+        QuantizedVectorTable: The quantized table.
+    """
+    if mode == "float16":
+        return QuantizedVectorTable(numpy.asarray(data, dtype="float16"))
+    if mode != "int8":
+        raise ValueError(f"Unknown quantization mode {mode!r}")
+    codes = numpy.empty(data.shape, dtype="int8")
+    scales = numpy.empty(data.shape[0], dtype="float32")
+    for start in range(0, data.shape[0], batch_size):
+        rows = numpy.asarray(data[start : start + batch_size], dtype="float32")
+        batch_scales = numpy.abs(rows).max(axis=1) / 127
+        batch_scales[batch_scales == 0] = 1
+        codes[start : start + batch_size] = numpy.rint(rows / batch_scales[:, None])
+        scales[start : start + batch_size] = batch_scales
+    return QuantizedVectorTable(codes, scales)
+
+
+def save_quantized_vectors(vectors, path, mode):
+    """
+    Quantize a vectors table and save it with its key index.
+
+    Args:
+        vectors (Vectors): The vectors table.
+        path (str): Directory to write the table to.
+        mode (str): "float16" or "int8", see quantize_vectors.
+
+    Returns:
+        QuantizedVectorTable: The quantized table.
+    """
+    path = Path(path)
+    table = quantize_vectors(vectors.data, mode)
+    save_vector_index(vectors, path)
+    numpy.save(path / "codes.npy", table.codes)
+    if table.scales is not None:
+        numpy.save(path / "scales.npy", table.scales)
+    return table
+
+
+def save_vector_index(vectors, path):
+    """
+    Save the key index of a vectors table as sorted, memory-mappable arrays.
+
+    Args:
+        vectors (Vectors): The vectors table.
+        path (str): Directory to write keys.npy and rows.npy to.
+    """
+    if vectors.mode != "default":
+        raise ValueError(f"Cannot map vectors in {vectors.mode!r} mode")
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    keys = numpy.fromiter(vectors.key2row.keys(), dtype="uint64")
+    rows = numpy.fromiter(vectors.key2row.values(), dtype="int64")
+    order = numpy.argsort(keys)
+    numpy.save(path / "keys.npy", keys[order])
+    numpy.save(path / "rows.npy", rows[order])
+
+
+def load_mapped_vectors(vocab, path):
+    """
+    Attach the vectors of a saved pipeline to a vocab without reading them.
+
+    The vector table and its key index are opened with mmap, so processes
+    using the same pipeline share one page-cached copy. The float table is
+    mapped copy-on-write, since ``Vectors.most_similar`` normalizes its
+    queries in place and those are often rows of the table; written pages
+    become private to the process and the file is never changed. The table
+    is either a quantized one (``vectors_quantized/``) or the .npy file spaCy
+    writes to ``vocab/vectors`` with the index from ``vectors_index/``.
+    Pipelines saved without the index fall back to ``vocab/key2row``.
+
+    Args:
+        vocab (Vocab): Vocab to attach the vectors to.
+        path (str): Path to the saved pipeline.
+    """
+    path = Path(path)
+    vectors = vocab.vectors
+    quantized_path = path / "vectors_quantized"
+    if quantized_path.exists():
+        scales_path = quantized_path / "scales.npy"
+        vectors.data = QuantizedVectorTable(
+            numpy.load(quantized_path / "codes.npy", mmap_mode="r"),
+            numpy.load(scales_path, mmap_mode="r") if scales_path.exists() else None,
+        )
+        index_path = quantized_path
+    else:
+        vectors.data = numpy.load(path / "vocab" / "vectors", mmap_mode="c")
+        index_path = path / "vectors_index"
+    if index_path.exists():
+        keys = numpy.load(index_path / "keys.npy", mmap_mode="r")
+        rows = numpy.load(index_path / "rows.npy", mmap_mode="r")
+        vectors.key2row = MappedKeyIndex(keys, rows)
+    else:
+        vectors.key2row = srsly.read_msgpack(path / "vocab" / "key2row")
+
+
+@Language.factory("lazy_vectors", default_config={"vectors_path": None})
+def create_lazy_vectors(nlp, name, vectors_path):
+    class LazyVectorsComponent:
+        """
+        Attach the word vectors of another saved pipeline to the vocab, so
+        pipelines packaged without vectors still answer ``.vector`` and
+        ``.similarity``. The vectors are memory-mapped with
+        load_mapped_vectors, so nothing is read from disk until a vector is
+        used.
+
+        The vectors are attached to the vocab rather than to each doc, so
+        docs restored from bytes (``nlp.pipe`` with ``n_process > 1``,
+        DocBin, CachedPipeline) have them as well. Save pipelines holding
+        this component with ``exclude=["vectors"]`` to keep them vector-free.
+        """
+
+        def __init__(self, vocab, vectors_path):
+            self.vocab = vocab
+            self.vectors_path = vectors_path
+            if vectors_path:
+                load_mapped_vectors(vocab, vectors_path)
+
+        def __call__(self, doc):
+            return doc
+
+    return LazyVectorsComponent(nlp.vocab, vectors_path)
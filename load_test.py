@@ -0,0 +1,260 @@
+"""
+Load-test serve.py with many concurrent clients.
+
+Without --host, a server is started for each --max_batch_sizes value in turn
+(1 disables micro-batching), so the throughput gain of batching is shown side
+by side.
+"""
+
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import numpy
+
+
+def load_texts(path, limit=None):
+    """
+    Args:
+        path (str): CoNLL-U file whose "# text = " lines are used.
+        limit (int): Maximum number of texts.
+
+    Returns:
+        list: Sentences to send.
+    """
+    with open(path, "r", encoding="utf-8") as file:
+        texts = [
+            line[len("# text = ") :].strip()
+            for line in file
+            if line.startswith("# text = ")
+        ]
+    return texts[:limit]
+
+
+async def client(host, port, texts, latencies):
+    """Send the texts one request at a time over a kept-alive connection."""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for text in texts:
+            body = json.dumps({"text": text}, ensure_ascii=False).encode("utf-8")
+            start = time.perf_counter()
+            writer.write(
+                f"POST /annotate HTTP/1.1\r\nHost: {host}\r\n"
+                f"Content-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body
+            )
+            await writer.drain()
+            status = await reader.readline()
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                if name.lower() == "content-length":
+                    length = int(value)
+            await reader.readexactly(length)
+            if b" 200 " not in status:
+                raise RuntimeError(f"Request failed: {status.decode().strip()}")
+            latencies.append(time.perf_counter() - start)
+    finally:
+        writer.close()
+
+
+async def run_load(host, port, texts, concurrency):
+    """
+    Returns:
+        dict: Requests per second and latency percentiles in ms.
+    """
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(
+            client(host, port, texts[i::concurrency], latencies)
+            for i in range(concurrency)
+        )
+    )
+    elapsed = time.perf_counter() - start
+    latencies = numpy.array(latencies) * 1000
+    return {
+        "requests_per_sec": len(latencies) / elapsed,
+        "latency_ms": {
+            f"p{q}": float(numpy.percentile(latencies, q)) for q in (50, 90, 99)
+        },
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(args, max_batch_size, port):
+    """Start serve.py and wait until it answers /health."""
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            str(Path(__file__).parent / "serve.py"),
+            "--pipeline_path",
+            args.pipeline_path,
+            "--port",
+            str(port),
+            "--n_workers",
+            str(args.n_workers),
+            "--max_batch_size",
+            str(max_batch_size),
+            "--max_delay",
+            str(args.max_delay),
+        ]
+    )
+    deadline = time.time() + args.startup_timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("The server exited during startup.")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1) as sock:
+                sock.sendall(b"GET /health HTTP/1.1\r\nConnection: close\r\n\r\n")
+                if b"200 OK" in sock.recv(1024):
+                    return process
+        except OSError:
+            time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError("The server did not start in time.")
+
+
+def descendant_pids(pid):
+    """
+    Args:
+        pid (int): Process ID.
+
+    Returns:
+        list: IDs of the running descendants of the process, read from /proc
+            (empty where there is no /proc).
+    """
+    children = {}
+    for stat_path in Path("/proc").glob("[0-9]*/stat"):
+        try:
+            # Fields after the command name: state, parent PID, ...
+            fields = stat_path.read_text().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        if fields[0] != "Z":
+            children.setdefault(int(fields[1]), []).append(int(stat_path.parent.name))
+    pids = []
+    pending = [pid]
+    while pending:
+        for child in children.get(pending.pop(), []):
+            pids.append(child)
+            pending.append(child)
+    return pids
+
+
+def is_running(pid):
+    try:
+        with open(f"/proc/{pid}/stat") as file:
+            return file.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except OSError:
+        return False
+
+
+def stop_server(process, timeout=30):
+    """
+    Send SIGTERM to the server and check that its worker processes exit with
+    it. Leftover workers are killed and reported as an error.
+    """
+    workers = descendant_pids(process.pid)
+    process.terminate()
+    process.wait(timeout)
+    deadline = time.time() + timeout
+    running = [pid for pid in workers if is_running(pid)]
+    while running and time.time() < deadline:
+        time.sleep(0.1)
+        running = [pid for pid in running if is_running(pid)]
+    for pid in running:
+        os.kill(pid, signal.SIGKILL)
+    if running:
+        raise RuntimeError(
+            f"The server left {len(running)} worker processes running after SIGTERM."
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-test the HTTP server.")
+    parser.add_argument(
+        "--host", default=None, help="Host of a running server (skips startup)."
+    )
+    parser.add_argument(
+        "--port", type=int, default=8080, help="Port of the running server."
+    )
+    parser.add_argument(
+        "--pipeline_path",
+        default="fa_core_web_sm",
+        help="Pipeline for the servers started by this script.",
+    )
+    parser.add_argument(
+        "--texts_path",
+        default="data/pos/fa_seraji-ud-test.conllu",
+        help="CoNLL-U file providing the request texts.",
+    )
+    parser.add_argument(
+        "--n_requests", type=int, default=2000, help="Number of requests."
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=64, help="Number of concurrent clients."
+    )
+    parser.add_argument(
+        "--max_batch_sizes",
+        type=int,
+        nargs="+",
+        default=[1, 32],
+        help="Server batch sizes to compare.",
+    )
+    parser.add_argument(
+        "--n_workers", type=int, default=1, help="Server worker processes."
+    )
+    parser.add_argument(
+        "--max_delay", type=float, default=0.005, help="Server batching delay."
+    )
+    parser.add_argument(
+        "--startup_timeout",
+        type=float,
+        default=120,
+        help="Seconds to wait for a server.",
+    )
+    args = parser.parse_args()
+
+    texts = load_texts(args.texts_path)
+    texts = (texts * (args.n_requests // len(texts) + 1))[: args.n_requests]
+
+    if args.host:
+        result = asyncio.run(run_load(args.host, args.port, texts, args.concurrency))
+        print(json.dumps(result, indent=2))
+    else:
+        results = {}
+        for max_batch_size in args.max_batch_sizes:
+            port = free_port()
+            server = start_server(args, max_batch_size, port)
+            try:
+                results[max_batch_size] = asyncio.run(
+                    run_load("127.0.0.1", port, texts, args.concurrency)
+                )
+            finally:
+                stop_server(server)
+            result = results[max_batch_size]
+            print(
+                f"max_batch_size={max_batch_size}: "
+                f"{result['requests_per_sec']:.0f} requests/sec, "
+                f"p50 {result['latency_ms']['p50']:.1f} ms, "
+                f"p99 {result['latency_ms']['p99']:.1f} ms"
+            )
+        baseline = results[args.max_batch_sizes[0]]["requests_per_sec"]
+        for max_batch_size, result in results.items():
+            gain = result["requests_per_sec"] / baseline
+            print(f"max_batch_size={max_batch_size}: {gain:.2f}x throughput")
@@ -1,45 +1,85 @@
 import spacy
-from spacy.tokens import DocBin
-from spacy.training import Example
-from spacy.scorer import Scorer
+from spacy.scorer import PRFScore
+from collections import defaultdict
+from pathlib import Path
 from tqdm import tqdm
 import argparse
+import sys
 
+# Run as a script, only the script's directory is on the path, not the repository
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from training.corpus import read_docs  # noqa: E402
+from training.evaluation import gold_tokenized  # noqa: E402
 
-def evaluate_ner_model(model_path, validation_path):
+
+def evaluate_ner_model(model_path, validation_path, batch_size=256, n_process=1):
     """
     Args:
         model_path (str): Path to the trained SpaCy model.
-        validation_path (str): Path to the validation dataset in `.spacy` format.
+        validation_path (str): Path to the validation dataset in `.spacy` format
+            (or its shard directory).
+        batch_size (int): Number of Docs per batch passed to nlp.pipe.
+        n_process (int): Number of processes used by nlp.pipe.
+
+    Returns:
+        dict: NER precision, recall, F1-score (overall and per type) and
+            token-level accuracy.
     """
     nlp = spacy.load(model_path)
-    doc_bin = DocBin().from_disk(validation_path)
-    validation_docs = list(doc_bin.get_docs(nlp.vocab))
 
-    scorer = Scorer()
-    examples = []
+    # Predict on the gold tokens, so gold and predicted tokens always line up.
+    # Both streams read the shards one at a time, in the same order.
+    gold_docs = read_docs(validation_path, nlp.vocab)
+    pred_docs = nlp.pipe(
+        gold_tokenized(read_docs(validation_path, nlp.vocab), nlp.vocab),
+        batch_size=batch_size,
+        n_process=n_process,
+    )
+
+    # Scores are accumulated per Doc instead of keeping every Example
+    scores_per_type = defaultdict(PRFScore)
     total_tokens = 0
     correct_tokens = 0
 
     print("Evaluating the model...")
-    for doc in tqdm(validation_docs):
-        pred_doc = nlp(doc.text)
-        example = Example(doc, pred_doc)
-        examples.append(example)
+    for gold_doc, pred_doc in tqdm(zip(gold_docs, pred_docs)):
+        # Tokens without gold annotation are not scored (as in spaCy's Scorer)
+        missing = {token.i for token in gold_doc if token.ent_iob == 0}
+        gold_ents = {(ent.label_, ent.start, ent.end) for ent in gold_doc.ents}
+        pred_ents = {
+            (ent.label_, ent.start, ent.end)
+            for ent in pred_doc.ents
+            if not missing.intersection(range(ent.start, ent.end))
+        }
+        for label in {label for label, _, _ in gold_ents | pred_ents}:
+            gold = {ent for ent in gold_ents if ent[0] == label}
+            pred = {ent for ent in pred_ents if ent[0] == label}
+            scores_per_type[label].score_set(pred, gold)
 
         # Count token-level accuracy (exact match for entities)
-        for token_true, token_pred in zip(doc, pred_doc):
+        for token_true, token_pred in zip(gold_doc, pred_doc):
             total_tokens += 1
             if token_true.ent_type_ == token_pred.ent_type_:
                 correct_tokens += 1
 
-    results = scorer.score(examples)
-
+    totals = PRFScore()
+    for scores in scores_per_type.values():
+        totals += scores
+    results = {
+        "ents_p": totals.precision,
+        "ents_r": totals.recall,
+        "ents_f": totals.fscore,
+        "ents_per_type": {
+            label: scores.to_dict() for label, scores in scores_per_type.items()
+        },
+        "token_acc": correct_tokens / total_tokens if total_tokens else 0.0,
+    }
 
     print("\nEvaluation Results:")
     print(f'NER Precision: {results.get("ents_p", 0.0):.3f}')
     print(f'NER Recall   : {results.get("ents_r", 0.0):.3f}')
     print(f'NER F1-Score : {results.get("ents_f", 0.0):.3f}')
+    print(f'Token Accuracy: {results.get("token_acc", 0.0):.3f}')
 
     if "ents_per_type" in results:
         print("\nDetailed Scores Per Entity Type:")
@@ -47,6 +87,7 @@ def evaluate_ner_model(model_path, validation_path):
             print(
                 f'  {entity}: Precision: {scores.get("p", 0.0):.3f}, Recall: {scores.get("r", 0.0):.3f}, F1-Score: {scores.get("f", 0.0):.3f}'
             )
+    return results
 
 
 if __name__ == "__main__":
@@ -59,8 +100,19 @@ if __name__ == "__main__":
     parser.add_argument(
         "--validation_path",
         required=True,
-        help="Path to the validation dataset (.spacy format).",
+        help="Path to the validation dataset (.spacy file or shard directory).",
+    )
+    parser.add_argument(
+        "--batch_size", type=int, default=256, help="Docs per batch for nlp.pipe."
+    )
+    parser.add_argument(
+        "--n_process", type=int, default=1, help="Processes used by nlp.pipe."
     )
     args = parser.parse_args()
 
-    evaluate_ner_model(args.model_path, args.validation_path)
+    evaluate_ner_model(
+        args.model_path,
+        args.validation_path,
+        batch_size=args.batch_size,
+        n_process=args.n_process,
+    )
@@ -3,13 +3,19 @@ Converts datasets into SpaCy-compatible format for NER after downloading and sav
 """
 
 from datasets import load_dataset
-from spacy.tokens import DocBin
-from collections import Counter
+from spacy.tokens import Doc, DocBin
+from collections import Counter, deque
 import matplotlib.pyplot as plt
 from pathlib import Path
 import spacy
 import argparse
+import multiprocessing
+import os
+import sys
 
+# Run as a script, only the script's directory is on the path, not the repository
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from training.corpus import read_docs  # noqa: E402
 
 # Hard-coded tag mapping
 TAG_MAPPING = {
@@ -29,39 +35,117 @@ TAG_MAPPING = {
 }
 
 
-def convert_to_spacy_format(dataset_split, nlp, tag_mapping):
+def tokens_to_doc(vocab, tokens, ner_tags, tag_mapping):
     """
-    Convert a HuggingFace dataset split to SpaCy DocBin format.
+    Build a Doc directly from the dataset tokens and tags, so no
+    re-tokenization or character offset arithmetic is needed.
+
+    Each tagged token becomes a one-token entity labelled with its tag
+    (e.g. "B-PER"), matching the labels the NER model is trained on.
 
     Args:
-        dataset_split: An iterable HuggingFace dataset split (e.g., 'train', 'test').
-        nlp: SpaCy NLP pipeline (blank model).
+        vocab (Vocab): Vocab of the Doc.
+        tokens (list): Words of the sentence.
+        ner_tags (list): Tag ID of each word.
         tag_mapping (dict): Mapping from tag IDs to tag labels.
 
     Returns:
-        DocBin: SpaCy-compatible binary data.
+        Doc: The sentence with its entities.
+    """
+    spaces = [True] * len(tokens)
+    if spaces:
+        spaces[-1] = False
+    ents = [f"B-{tag_mapping[tag]}" if tag != 0 else "O" for tag in ner_tags]
+    return Doc(vocab, words=tokens, spaces=spaces, ents=ents)
+
+
+# Vocab of a conversion worker process, created by init_worker
+_worker_vocab = None
+
+
+def init_worker():
+    global _worker_vocab
+    _worker_vocab = spacy.blank("fa").vocab
+
+
+def convert_chunk(chunk, tag_mapping=TAG_MAPPING):
+    """
+    Convert a chunk of the dataset in a worker process.
+
+    Args:
+        chunk (dict): Columns "tokens" and "ner_tags" of consecutive examples.
+        tag_mapping (dict): Mapping from tag IDs to tag labels.
+
+    Returns:
+        bytes: The serialized DocBin of the chunk.
     """
     doc_bin = DocBin()
-    for example in dataset_split:
-        tokens = example["tokens"]
-        ner_tags = example["ner_tags"]
-        doc = nlp.make_doc(" ".join(tokens))
-        entities = []
-        start = 0
-        for token, tag in zip(tokens, ner_tags):
-            end = start + len(token)
-            if tag != 0:  # Skip "O" tags
-                label = tag_mapping[tag]
-                entities.append((start, end, label))
-            start = end + 1  # Account for space
-        spans = [
-            doc.char_span(start, end, label=label)
-            for start, end, label in entities
-            if doc.char_span(start, end)
-        ]
-        doc.ents = spans
-        doc_bin.add(doc)
-    return doc_bin
+    for tokens, ner_tags in zip(chunk["tokens"], chunk["ner_tags"]):
+        doc_bin.add(tokens_to_doc(_worker_vocab, tokens, ner_tags, tag_mapping))
+    return doc_bin.to_bytes()
+
+
+def convert_split(
+    dataset_split,
+    output_path,
+    tag_mapping=TAG_MAPPING,
+    shard_size=10000,
+    n_process=None,
+):
+    """
+    Convert a dataset split in parallel, chunk by chunk.
+
+    Chunks are read from the locally cached (memory-mapped) dataset and at most
+    two per process are in flight, so memory stays flat. If ``output_path`` is
+    a directory, every chunk is written as a shard as soon as it is converted;
+    if it is a .spacy file, the shards are merged into it at the end.
+
+    Args:
+        dataset_split (Dataset): HuggingFace dataset split.
+        output_path (str): Output .spacy file or shard directory.
+        tag_mapping (dict): Mapping from tag IDs to tag labels.
+        shard_size (int): Number of examples per chunk.
+        n_process (int): Number of worker processes. Defaults to all cores.
+
+    Returns:
+        int: Number of converted examples.
+    """
+    output_path = Path(output_path)
+    shard_dir = None if output_path.suffix == ".spacy" else output_path
+    if shard_dir is None:
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        merged = DocBin()
+    else:
+        shard_dir.mkdir(parents=True, exist_ok=True)
+        # Shards left by an earlier, longer run would be read with the new ones
+        for stale_shard in shard_dir.glob("*.spacy"):
+            stale_shard.unlink()
+
+    def write(data):
+        if shard_dir is None:
+            merged.merge(DocBin().from_bytes(data))
+        else:
+            (shard_dir / f"{n_shards:05d}.spacy").write_bytes(data)
+
+    n_process = n_process or os.cpu_count()
+    chunks = dataset_split.iter(batch_size=shard_size)
+    n_examples = 0
+    n_shards = 0
+    with multiprocessing.Pool(n_process, initializer=init_worker) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.apply_async(convert_chunk, (chunk, tag_mapping)))
+            n_examples += len(chunk["tokens"])
+            # Write finished chunks in order, and wait once enough are queued
+            while len(pending) >= 2 * n_process or (pending and pending[0].ready()):
+                write(pending.popleft().get())
+                n_shards += 1
+        while pending:
+            write(pending.popleft().get())
+            n_shards += 1
+    if shard_dir is None:
+        merged.to_disk(output_path)
+    return n_examples
 
 
 def explore_dataset(train_path):
@@ -69,18 +153,18 @@ def explore_dataset(train_path):
     Explore the training dataset to extract statistics and visualize label distribution.
 
     Args:
-        train_path (str): Path to the training dataset in .spacy format.
+        train_path (str): Path to the training dataset in .spacy format (or its
+            shard directory).
     """
     # Load the .spacy dataset
     nlp = spacy.blank("fa")
-    doc_bin = DocBin().from_disk(train_path)
-    docs = list(doc_bin.get_docs(nlp.vocab))
 
     # Extract statistics
-    total_samples = len(docs)
+    total_samples = 0
     label_counts = Counter()
 
-    for doc in docs:
+    for doc in read_docs(train_path, nlp.vocab):
+        total_samples += 1
         for ent in doc.ents:
             label_counts[ent.label_] += 1
 
@@ -115,40 +199,49 @@ if __name__ == "__main__":
         "--train_output",
         type=str,
         required=True,
-        help="Path to save the training dataset in .spacy format.",
+        help="Path to save the training dataset (.spacy file or shard directory).",
     )
     parser.add_argument(
         "--test_output",
         type=str,
         required=True,
-        help="Path to save the test dataset in .spacy format.",
+        help="Path to save the test dataset (.spacy file or shard directory).",
+    )
+    parser.add_argument(
+        "--cache_dir",
+        type=str,
+        default=None,
+        help="Directory where the HuggingFace dataset is cached.",
+    )
+    parser.add_argument(
+        "--shard_size", type=int, default=10000, help="Examples per shard."
+    )
+    parser.add_argument(
+        "--n_process",
+        type=int,
+        default=None,
+        help="Number of worker processes (defaults to all cores).",
     )
     args = parser.parse_args()
 
-    # Load the HuggingFace dataset
-    dataset = load_dataset(args.dataset_name)
+    # Load the HuggingFace dataset; it is cached locally and memory-mapped
+    dataset = load_dataset(args.dataset_name, cache_dir=args.cache_dir)
 
-    # Convert dataset splits to lists
-    train_split = list(dataset["train"]) if "train" in dataset else []
-    test_split = list(dataset["test"]) if "test" in dataset else []
-
-    if not train_split or not test_split:
+    if "train" not in dataset or "test" not in dataset:
         raise ValueError("Dataset must contain 'train' and 'test' splits.")
 
-    # Initialize SpaCy pipeline
-    nlp = spacy.blank("fa")
-
     # Convert datasets
-    train_doc_bin = convert_to_spacy_format(train_split, nlp, TAG_MAPPING)
-    test_doc_bin = convert_to_spacy_format(test_split, nlp, TAG_MAPPING)
-
-    # Save datasets
-    train_path = Path(args.train_output)
-    test_path = Path(args.test_output)
-    train_path.parent.mkdir(parents=True, exist_ok=True)
-    test_path.parent.mkdir(parents=True, exist_ok=True)
+    for split, output_path in [
+        ("train", args.train_output),
+        ("test", args.test_output),
+    ]:
+        n_examples = convert_split(
+            dataset[split],
+            output_path,
+            shard_size=args.shard_size,
+            n_process=args.n_process,
+        )
+        print(f"Converted {n_examples} {split} examples to {output_path}")
 
-    train_doc_bin.to_disk(train_path)
-    test_doc_bin.to_disk(test_path)
     print("Datasets converted and saved successfully.")
-    explore_dataset(train_path)
+    explore_dataset(args.train_output)
@@ -1,11 +1,19 @@
-import random
 from spacy.training import Example
-from spacy.tokens import DocBin
+from spacy.util import compounding, fix_random_seed
 from pathlib import Path
 import spacy
 import argparse
-from gensim.models import KeyedVectors
-
+import multiprocessing
+import sys
+
+# Run as a script, only the script's directory is on the path, not the repository
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from training.corpus import read_docs  # noqa: E402
+from training.parallel import (  # noqa: E402
+    length_bucketed_batches,
+    train_data_parallel,
+    uses_vectors,
+)
 
 # Hard-coded tag mapping
 TAG_MAPPING = {
@@ -25,7 +33,18 @@ TAG_MAPPING = {
 }
 
 
-def train_ner_model(train_path, output_dir, iterations):
+DEFAULT_VECTORS_PATH = "persian_spacy/fasttext/vocab"
+
+
+def train_ner_model(
+    train_path,
+    output_dir,
+    iterations,
+    vectors_path=DEFAULT_VECTORS_PATH,
+    batch_size=1000,
+    n_workers=1,
+    seed=0,
+):
     """
     Train a Named Entity Recognition (NER) model using SpaCy.
 
@@ -33,49 +52,72 @@ def train_ner_model(train_path, output_dir, iterations):
         train_path (str): Path to the training dataset in .spacy format.
         output_dir (str): Directory to save the trained model.
         iterations (int): Number of training iterations.
+        vectors_path (str): Vectors directory written by fasttext/import_vectors.py.
+        batch_size (int): Maximum number of words per minibatch.
+        n_workers (int): Number of worker processes; 1 trains in this process.
+        seed (int): Random seed.
     """
+    fix_random_seed(seed)
+
     # Initialize a blank SpaCy model
     nlp = spacy.blank("fa")
 
-    embedding_path = "persian_spacy/fasttext/cc.fa.300.vec"
-
-    fasttext_model = KeyedVectors.load_word2vec_format(embedding_path, binary=False)
-    print("FastText embeddings loaded successfully!")
-
-
-    # Add FastText vectors to spaCy's vocabulary
-    for word in fasttext_model.index_to_key:
-        vector = fasttext_model[word]
-        nlp.vocab.set_vector(word, vector)
-
     ner = nlp.add_pipe("ner", last=True)
 
+    # Static vectors are only needed if a component's model reads them
+    if uses_vectors(nlp):
+        nlp.vocab.vectors.from_disk(vectors_path)
+        print("FastText embeddings loaded successfully!")
+    else:
+        print("No component uses static vectors; skipping FastText embeddings.")
+
     for label in TAG_MAPPING.values():
         if label != "O":
             ner.add_label(label)
 
-    train_doc_bin = DocBin().from_disk(train_path)
+    # Build the training examples once
+    train_examples = [
+        Example.from_dict(
+            doc,
+            {
+                "entities": [
+                    (ent.start_char, ent.end_char, ent.label_) for ent in doc.ents
+                ]
+            },
+        )
+        for doc in read_docs(train_path, nlp.vocab)
+    ]
+
+    # Batches grow from 100 words up to batch_size, as in the models' configs
+    batch_sizes = compounding(min(100, batch_size), batch_size, 1.001)
 
     # Train the model
     optimizer = nlp.begin_training()
-    for iteration in range(iterations):
-        print(f"Starting iteration {iteration + 1}")
-        losses = {}
-        # Load the training data
-        train_examples = list(train_doc_bin.get_docs(nlp.vocab))
-        random.shuffle(train_examples)
-        # Update the model
-        for doc in train_examples:
-            example = Example.from_dict(
-                doc,
-                {
-                    "entities": [
-                        (ent.start_char, ent.end_char, ent.label_) for ent in doc.ents
-                    ]
-                },
+    if n_workers > 1 and "fork" not in multiprocessing.get_all_start_methods():
+        print("Data-parallel training needs fork(); training in one process.")
+        n_workers = 1
+    if n_workers > 1:
+        print(f"Training on {n_workers} worker processes")
+        for iteration, losses in enumerate(
+            train_data_parallel(
+                nlp,
+                optimizer,
+                train_examples,
+                batch_sizes,
+                iterations,
+                n_workers,
+                seed=seed,
             )
-            nlp.update([example], drop=0.3, losses=losses)
-        print(f"Losses at iteration {iteration + 1}: {losses}")
+        ):
+            print(f"Losses at iteration {iteration + 1}: {losses}")
+    else:
+        for iteration in range(iterations):
+            print(f"Starting iteration {iteration + 1}")
+            losses = {}
+            # Update the model
+            for batch in length_bucketed_batches(train_examples, batch_sizes):
+                nlp.update(batch, drop=0.3, losses=losses)
+            print(f"Losses at iteration {iteration + 1}: {losses}")
 
     # Save the trained model
     output_path = Path(output_dir)
@@ -97,6 +139,32 @@ if __name__ == "__main__":
     parser.add_argument(
         "--iterations", type=int, default=25, help="Number of training iterations."
     )
+    parser.add_argument(
+        "--vectors_path",
+        default=DEFAULT_VECTORS_PATH,
+        help="Vectors directory written by fasttext/import_vectors.py.",
+    )
+    parser.add_argument(
+        "--batch_size",
+        type=int,
+        default=1000,
+        help="Maximum number of words per minibatch.",
+    )
+    parser.add_argument(
+        "--n_workers",
+        type=int,
+        default=1,
+        help="Number of worker processes for data-parallel training.",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Random seed.")
     args = parser.parse_args()
 
-    train_ner_model(args.train_path, args.output_dir, args.iterations)
+    train_ner_model(
+        args.train_path,
+        args.output_dir,
+        args.iterations,
+        args.vectors_path,
+        batch_size=args.batch_size,
+        n_workers=args.n_workers,
+        seed=args.seed,
+    )
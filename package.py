@@ -1,341 +1,319 @@
-import spacy
-from pathlib import Path
-from spacy.language import Language
-
-# Paths to your trained models and resources
-pos_model_path = "/Users/atenahli/Documents/persian-spacy/persian_spacy/models/pos"
-ner_model_path = "/Users/atenahli/Documents/persian-spacy/persian_spacy/models/ner"
-lemma_dict_path = "lemma_dict.txt"
-vectors_path = "/Users/atenahli/Documents/persian-spacy/persian_spacy/fasttext/vocab"
-
-
-def load_lemma_dictionary(file_path: str) -> dict:
-    """
-    Load a lemma dictionary from a file.
-
-    Args:
-        file_path (str): Path to the lemma dictionary file.
-
-    Returns:
-        dict: A dictionary where keys are words and values are their lemmas.
-    """
-    lemma_dict = {}
-    with open(file_path, "r", encoding="utf-8") as file:
-        for line in file:
-            parts = line.strip().split("\t")  # Assuming tab-separated values
-            if len(parts) == 3:
-                word, lemma, pos_tag = parts
-                lemma_dict[word] = lemma
-    return lemma_dict
+"""
+Build the combined Persian pipeline (tagger, NER, normalizer and lemmatizer).
 
+Importing this module has no side effects; run it as a script or call
+``build_pipeline`` to assemble and save the pipeline.
+"""
 
-def normalize_text(word: str) -> str:
+import spacy
+from spacy.strings import StringStore
+from pathlib import Path
+import argparse
+import numpy
+
+# Importing the lemmatizer registers the "persian_normalizer" and
+# "rule_based_lemmatizer" factories, and the vectors module "lazy_vectors"
+import lemmatizer.lemmatizer  # noqa: F401
+from lemmatizer.pipeline import listened_components
+from lemmatizer.search import IVFIndex, VectorSearch, recall_at_k
+from lemmatizer.vectors import save_quantized_vectors, save_vector_index
+
+# Slim variants saved next to the full pipeline, as <output_path>_<variant>,
+# with the components they keep. None of them holds the word vectors.
+VARIANTS = {
+    "tagger": ["tagger"],
+    "ner": ["ner"],
+    "slim": ["tagger", "ner", "persian_normalizer", "rule_based_lemmatizer"],
+}
+
+
+def similarity_drift(reference, vocab):
     """
-    Normalize Persian text to standard form.
+    Compare pairwise cosine similarities of held-out words before and after
+    the vector table was pruned or quantized.
 
     Args:
-        word (str): Input word.
+        reference (dict): Words mapped to their original vectors.
+        vocab (Vocab): Vocab holding the compressed vectors.
 
     Returns:
-        str: Normalized word.
+        dict: Mean and maximum absolute change of the pairwise similarities.
     """
-    word = (
-        word.replace("ئ", "ی").replace("ک", "ک").replace("گ", "گ")
-    )  # Example normalization
-    word = word.replace("ؤ", "و").replace("إ", "ا")  # More normalization rules
-    word = word.replace("\u200C", " ")  # Replace Zero Width Non-Joiner
-    return word
-
-
-def remove_suffixes(word: str, dictionary: dict) -> str:
-    """
-    Try removing each suffix and check if it exists in the dictionary.
-
-    Args:
-        word (str): Input word.
-        dictionary (dict): Lemma dictionary.
 
-    Returns:
-        str: Lemmatized word or the original word.
-    """
-    suffixes = [
-        "ها",
-        "ی",
-        "تر",
-        "ترین",
-        "انه",
-        "یی",
-        "آسا",
-        "آگین",
-        "او",
-        "اومند",
-        "اور",
-        "ا",
-        "گین",
-        "اده",
-        "ار",
-        "اک",
-        "ال",
-        "اله",
-        "ُم",
-        "ان",
-        "انه",
-        "یک",
-        "ین",
-        "ینه",
-        "انی",
-        "بان",
-        "بد",
-        "تر",
-        "ترین",
-        "چه",
-        "دان",
-        "دیس",
-        "زار",
-        "سار",
-        "سان",
-        "ِستان",
-        "وش",
-        "سیر",
-        "ِش",
-        "فام",
-        "َک",
-        "وند",
-        "کده",
-        "گار",
-        "گاه",
-        "گاه",
-        "گر",
-        "گری",
-        "گون",
-        "لاخ",
-        "مان",
-        "مند",
-        "نا",
-        "ناک",
-        "ند",
-        "نده",
-        "وار",
-        "وار",
-        "واره",
-        "واری",
-        "ور",
-        "ه",
-        "ی",
-        "گرا",
-        "شده",
-        "گوش",
-        "مندی",
-        "گر",
-        "گین",
-        "ری",
-        "ور",
-        "یده",
-        "کار",
-        "یابی",
-        "یافته",
-        "ده",
-        "ش",
-        "ساز",
-        "نامه",
-        "شده",
-        "خوار",
-        "بند",
-        "ساز",
-        "ساز",
-        "جوی",
-        "شناس",
-        "خوار",
-        "شناس",
-        "ند",
-        "آور",
-        "طلب",
-        "آورده",
-        "آوری",
-        "جویی",
-        "گر",
-        "ناکی",
-        "گونه",
-        "گون",
-        "ای",
-        "یی",
-        "شان",
-        "یگر",
-        "یانه",
-        "ه‌ای",
-        "تار",
-        "گره",
-        "لگن",
-        "گان",
-        "پذیر",
-        "کن",
-        "پوی",
-        "زن",
-        "گون",
-        "نی",
-        "گانه",
-        "شناس",
-        "پذیر",
-        "پرداز",
-        "حس",
-        "هایت",
-        "هایم",
-        "هایش",
-        "م",
-        "ن",
-        "ی",
-    ]
+    def cosine_matrix(rows):
+        rows = numpy.asarray(rows, dtype="float32")
+        norms = numpy.linalg.norm(rows, axis=1, keepdims=True)
+        rows = rows / numpy.where(norms == 0, 1, norms)
+        return rows @ rows.T
 
-    for suffix in suffixes:
-        if word.endswith(suffix):
-            modified_word = word[: -len(suffix)].strip()
-            lemma = dictionary.get(modified_word, None)
-            if lemma:
-                return lemma
-    return word
+    before = cosine_matrix(list(reference.values()))
+    after = cosine_matrix([vocab.get_vector(word) for word in reference])
+    drift = numpy.abs(after - before)[numpy.triu_indices(len(reference), k=1)]
+    if not len(drift):
+        return {"mean": 0.0, "max": 0.0}
+    return {"mean": float(drift.mean()), "max": float(drift.max())}
 
 
-def remove_prefixes(word: str, dictionary: dict) -> str:
+def save_variant(nlp, components, output_path, vectors_path=None):
     """
-    Try removing each prefix and check if it exists in the dictionary.
+    Save a copy of the pipeline with only some of its components and without
+    the word vectors.
 
     Args:
-        word (str): Input word.
-        dictionary (dict): Lemma dictionary.
+        nlp (Language): The combined pipeline.
+        components (list): Names of the components to keep; components they
+            listen to (a shared tok2vec) are kept along with them.
+        output_path (str): Directory to save the variant.
+        vectors_path (str): Saved pipeline holding the vectors. If given, the
+            variant attaches them to its vocab (memory-mapped) when loaded.
 
     Returns:
-        str: Lemmatized word or the original word.
+        Language: The variant.
     """
-    prefixes = [
-        "با",
-        "بی",
-        "نا",
-        "دی",
-        "به",
-        "اندر",
-        "ب",
-        "باز",
-        "بر",
-        "بس",
-        "بیش",
-        "پاد",
-        "پت",
-        "پرا",
-        "پس",
-        "پسا",
-        "پی",
-        "پیرا",
-        "پیش",
-        "ترا",
-        "تک",
-        "در",
-        "دژ",
-        "دش",
-        "می",
-        "سر",
-        "فر",
-        "فرا",
-        "فرو",
-        "نا",
-        "ن",
-        "وا",
-        "ور",
-        "هم",
-        "هو",
-        "ی",
-        "آ",
-        "پیش",
-        "پرا",
-        "ده",
-        "تا",
-        "همه",
-        "نیز",
-        "نا",
-        "ره",
-        "به",
-        "دگر",
-        "در",
-        "زیر",
-    ]
-
-    for prefix in prefixes:
-        if word.startswith(prefix):
-            modified_word = word[len(prefix) :].strip()
-            lemma = dictionary.get(modified_word, None)
-            if lemma:
-                return lemma
-    return word
-
-
-def lemmatize(word: str, dictionary: dict) -> str:
+    kept = set(components) | set(listened_components(nlp.config, components))
+    variant = spacy.blank("fa")
+    # Sourcing a component copies every string of the full vocab, one per
+    # vector key included; the variant only keeps those of a blank pipeline
+    # and the components' labels
+    strings = set(variant.vocab.strings)
+    for name in nlp.pipe_names:
+        if name in kept:
+            variant.add_pipe(name, source=nlp)
+            strings.update(getattr(variant.get_pipe(name), "labels", ()))
+    if vectors_path:
+        variant.add_pipe(
+            "lazy_vectors",
+            config={"vectors_path": Path(vectors_path).resolve().as_posix()},
+        )
+    # lazy_vectors maps the vectors into the vocab; they stay out of the variant
+    variant.to_disk(output_path, exclude=["vectors"])
+    StringStore(sorted(strings)).to_disk(Path(output_path) / "vocab" / "strings.json")
+    return variant
+
+
+def build_pipeline(
+    pos_model_path,
+    ner_model_path,
+    lemma_dict_path,
+    output_path,
+    vectors_path=None,
+    prune_vectors=None,
+    quantize_vectors=None,
+    similarity_words=None,
+    joint_model_path=None,
+    variants=(),
+    ivf_lists=None,
+    ivf_probes=8,
+):
     """
-    Lemmatize the word based on POS and search in the dictionary.
+    Combine the trained models and the rule-based components into one pipeline.
 
     Args:
-        word (str): Input word.
-        dictionary (dict): Lemma dictionary.
+        pos_model_path (str): Path to the trained POS model.
+        ner_model_path (str): Path to the trained NER model.
+        lemma_dict_path (str): Path to the lemma dictionary (.txt or compiled .bin).
+        output_path (str): Directory to save the combined pipeline.
+        vectors_path (str): Optional vocab directory holding FastText vectors.
+        prune_vectors (int): Keep only this many of the most frequent vector
+            rows; pruned words are remapped to their nearest kept row.
+        quantize_vectors (str): Store the vectors as "float16" or "int8".
+        similarity_words (str): File with one held-out word per line used to
+            report the similarity drift caused by pruning or quantization.
+        joint_model_path (str): Model from joint/train.py whose tagger and NER
+            share one tok2vec; used instead of the separate POS and NER models.
+        variants (list): Names of VARIANTS to save next to the pipeline.
+        ivf_lists (int): Build an approximate nearest-neighbour index over
+            the vectors with this many lists, saved to vectors_ivf/.
+        ivf_probes (int): Lists searched per query when reporting the
+            index's recall@10 against the exact search.
 
     Returns:
-        str: Lemmatized word or the original word.
+        Language: The combined pipeline.
     """
-    normalized_word = normalize_text(word)
-    lemma = dictionary.get(normalized_word, None)
-    if lemma:
-        return lemma
-    lemma = remove_suffixes(normalized_word, dictionary)
-    if lemma != normalized_word:
-        return lemma
-    lemma = remove_prefixes(normalized_word, dictionary)
-    if lemma != normalized_word:
-        return lemma
-    return word
-
-
-# Register the factory with spaCy
-@Language.factory("rule_based_lemmatizer")
-def create_lemmatizer(nlp, name, lemma_dict_path):
-    class LemmatizerComponent:
-
-        def __init__(self, dictionary_path):
-            # Ensure the path works after packaging
-            package_path = Path(
-                __file__
-            ).parent  # Get the directory of the current file
-            full_path = (
-                package_path / dictionary_path
-            ).resolve()  # Combine and resolve the full path
-            self.lemma_dict = load_lemma_dictionary(full_path.as_posix())
-
-        def __call__(self, doc):
-            for token in doc:
-                token.lemma_ = lemmatize(token.text, self.lemma_dict)
-            return doc
-
-    return LemmatizerComponent(lemma_dict_path)
-
-
-# Create a blank pipeline for Persian
-nlp = spacy.blank("fa")
-
-# Load FastText vectors into the pipeline
-nlp.vocab.from_disk(vectors_path)
-
-# Add pretrained POS tagger
-pos_nlp = spacy.load(pos_model_path)
-nlp.add_pipe("tagger", source=pos_nlp)
-
-# Add pretrained NER
-ner_nlp = spacy.load(ner_model_path)
-nlp.add_pipe("ner", source=ner_nlp)
-
-# Add rule-based lemmatizer
-nlp.add_pipe("rule_based_lemmatizer", config={"lemma_dict_path": lemma_dict_path})
-
-# Analyze the pipeline to confirm components
-print(nlp.analyze_pipes())
-
-# Save the combined pipeline
-output_path = Path("./fa_core_web_sm")
-output_path.mkdir(exist_ok=True, parents=True)
-nlp.to_disk(output_path)
-print(f"Pipeline saved to {output_path}")
+    # Create a blank pipeline for Persian
+    nlp = spacy.blank("fa")
+
+    # Load FastText vectors into the pipeline
+    reference = {}
+    if vectors_path:
+        nlp.vocab.from_disk(vectors_path)
+        original_size = nlp.vocab.vectors.data.nbytes
+        if similarity_words:
+            with open(similarity_words, "r", encoding="utf-8") as file:
+                words = [line.strip() for line in file if line.strip()]
+            reference = {
+                word: nlp.vocab.get_vector(word).copy()
+                for word in words
+                if nlp.vocab.has_vector(word)
+            }
+        # fastText files list words by frequency, so the first rows are kept
+        if prune_vectors:
+            nlp.vocab.prune_vectors(prune_vectors)
+
+    if joint_model_path:
+        # Shared tok2vec first, so the tagger and NER listeners connect to it
+        joint_nlp = spacy.load(joint_model_path)
+        for name in ["tok2vec", "tagger", "ner"]:
+            nlp.add_pipe(name, source=joint_nlp)
+    else:
+        # Add pretrained POS tagger
+        pos_nlp = spacy.load(pos_model_path)
+        nlp.add_pipe("tagger", source=pos_nlp)
+
+        # Add pretrained NER
+        ner_nlp = spacy.load(ner_model_path)
+        nlp.add_pipe("ner", source=ner_nlp)
+
+    # Normalize each text once for the lemmatizer (after the models, which use NORM)
+    nlp.add_pipe("persian_normalizer")
+
+    # Add rule-based lemmatizer; the dictionary is compiled into the pipeline
+    # directory on save, so the saved config holds no path and the source
+    # file is not needed at load time
+    lemmatizer_pipe = nlp.add_pipe("rule_based_lemmatizer")
+    lemmatizer_pipe.load_dictionary(Path(lemma_dict_path).resolve())
+
+    # Save the combined pipeline
+    output_path = Path(output_path)
+    output_path.mkdir(exist_ok=True, parents=True)
+    if vectors_path and quantize_vectors:
+        # Quantized tables are only read through load_pipeline/load_mapped_vectors
+        nlp.to_disk(output_path, exclude=["vectors"])
+        table = save_quantized_vectors(
+            nlp.vocab.vectors, output_path / "vectors_quantized", quantize_vectors
+        )
+        nlp.vocab.vectors.data = table
+    else:
+        nlp.to_disk(output_path)
+        # Sorted key index so loaders can memory-map the vectors instead of
+        # reading them (see load_mapped_vectors)
+        if vectors_path:
+            save_vector_index(nlp.vocab.vectors, output_path / "vectors_index")
+
+    if vectors_path and (prune_vectors or quantize_vectors):
+        compressed_size = nlp.vocab.vectors.data.nbytes
+        print(
+            f"Vectors: {original_size / 2**20:.1f} MB -> "
+            f"{compressed_size / 2**20:.1f} MB "
+            f"({1 - compressed_size / original_size:.1%} saved)"
+        )
+        if reference:
+            drift = similarity_drift(reference, nlp.vocab)
+            print(
+                f"Similarity drift over {len(reference)} held-out words: "
+                f"mean {drift['mean']:.4f}, max {drift['max']:.4f}"
+            )
+
+    if vectors_path and ivf_lists:
+        search = VectorSearch(nlp.vocab)
+        search.index = IVFIndex.build(search, n_lists=ivf_lists)
+        search.index.save(output_path / "vectors_ivf")
+        rng = numpy.random.default_rng(0)
+        words = [
+            nlp.vocab.strings[int(key)]
+            for key in rng.choice(search.keys, min(1000, len(search.keys)), False)
+        ]
+        recall = recall_at_k(search, words, k=10, n_probe=ivf_probes)
+        print(
+            f"IVF index with {len(search.index.centroids)} lists: "
+            f"recall@10 {recall:.3f} searching {ivf_probes} lists"
+        )
+
+    for variant in variants:
+        variant_path = f"{output_path}_{variant}"
+        save_variant(
+            nlp,
+            VARIANTS[variant],
+            variant_path,
+            vectors_path=output_path if vectors_path else None,
+        )
+        print(f"Saved the {variant} variant to {variant_path}")
+    return nlp
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Build the combined Persian SpaCy pipeline."
+    )
+    parser.add_argument(
+        "--pos_model_path", default="models/pos", help="Path to the trained POS model."
+    )
+    parser.add_argument(
+        "--ner_model_path", default="models/ner", help="Path to the trained NER model."
+    )
+    parser.add_argument(
+        "--joint_model_path",
+        default=None,
+        help="Model with a shared tok2vec (joint/train.py) replacing the POS and NER models.",
+    )
+    parser.add_argument(
+        "--lemma_dict_path",
+        default="data/lemmatizer/lemma_dict.txt",
+        help="Path to the lemma dictionary.",
+    )
+    parser.add_argument(
+        "--vectors_path",
+        default=None,
+        help="Optional vocab directory holding FastText vectors.",
+    )
+    parser.add_argument(
+        "--prune_vectors",
+        type=int,
+        default=None,
+        help="Keep only this many of the most frequent vector rows.",
+    )
+    parser.add_argument(
+        "--quantize_vectors",
+        choices=["float16", "int8"],
+        default=None,
+        help="Store the vectors as float16, or int8 with per-row scales.",
+    )
+    parser.add_argument(
+        "--similarity_words",
+        default=None,
+        help="File of held-out words (one per line) for the similarity drift report.",
+    )
+    parser.add_argument(
+        "--output_path",
+        default="fa_core_web_sm",
+        help="Directory to save the combined pipeline.",
+    )
+    parser.add_argument(
+        "--variants",
+        nargs="+",
+        choices=sorted(VARIANTS),
+        default=[],
+        help="Vector-free variants to save as <output_path>_<variant>.",
+    )
+    parser.add_argument(
+        "--ivf_lists",
+        type=int,
+        default=None,
+        help="Build an approximate nearest-neighbour index with this many lists.",
+    )
+    parser.add_argument(
+        "--ivf_probes",
+        type=int,
+        default=8,
+        help="Lists searched per query when reporting the index's recall@10.",
+    )
+    args = parser.parse_args()
+
+    nlp = build_pipeline(
+        args.pos_model_path,
+        args.ner_model_path,
+        args.lemma_dict_path,
+        args.output_path,
+        vectors_path=args.vectors_path,
+        prune_vectors=args.prune_vectors,
+        quantize_vectors=args.quantize_vectors,
+        similarity_words=args.similarity_words,
+        joint_model_path=args.joint_model_path,
+        variants=args.variants,
+        ivf_lists=args.ivf_lists,
+        ivf_probes=args.ivf_probes,
+    )
+
+    # Analyze the pipeline to confirm components
+    print(nlp.analyze_pipes())
+    print(f"Pipeline saved to {args.output_path}")
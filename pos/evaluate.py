@@ -1,55 +1,91 @@
 """
-Script for evaluating a trained POS tagging model using SpaCy's built-in evaluation function.
+Script for evaluating a trained POS tagging model by its tag accuracy on the gold tokens.
 """
 
 import spacy
-from spacy.tokens import DocBin
-from spacy.scorer import Scorer
-from spacy.training import Example
+from pathlib import Path
 from tqdm import tqdm
 import argparse
+import sys
 
+# Run as a script, only the script's directory is on the path, not the repository
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from training.corpus import read_docs  # noqa: E402
+from training.evaluation import gold_tokenized  # noqa: E402
 
-def evaluate_model(model_path, validation_path):
+
+def evaluate_model(model_path, validation_path, batch_size=256, n_process=1):
     """
-    Evaluate the trained POS tagging model using SpaCy's built-in evaluation function.
+    Evaluate the trained POS tagging model by its tag accuracy on the gold tokens.
 
     Args:
         model_path (str): Path to the trained SpaCy model.
-        validation_path (str): Path to the SpaCy validation data file.
+        validation_path (str): Path to the SpaCy validation data file (or its
+            shard directory).
+        batch_size (int): Number of Docs per batch passed to nlp.pipe.
+        n_process (int): Number of processes used by nlp.pipe.
+
+    Returns:
+        dict: Tag accuracy under "tag_acc".
     """
     nlp = spacy.load(model_path)  # Load the trained SpaCy model
-    validation_doc_bin = DocBin().from_disk(validation_path)  # Load validation data
-    validation_docs = list(validation_doc_bin.get_docs(nlp.vocab))  # Extract Docs
 
-    scorer = Scorer()
-    examples = []
+    # Tag the gold tokens in batches; the tokenizer is skipped. Both streams
+    # read the shards one at a time, in the same order.
+    gold_docs = read_docs(validation_path, nlp.vocab)
+    pred_docs = nlp.pipe(
+        gold_tokenized(read_docs(validation_path, nlp.vocab), nlp.vocab),
+        batch_size=batch_size,
+        n_process=n_process,
+    )
+
+    # Count matches as we go instead of keeping every Example
+    total_tokens = 0
+    correct_tokens = 0
 
     print("Evaluating the model on validation data...")
-    for doc in tqdm(validation_docs, total=len(validation_docs)):
-        pred_doc = nlp(doc.text)  # Predict using the trained model
-        examples.append(Example(doc, pred_doc))
+    for gold_doc, pred_doc in tqdm(zip(gold_docs, pred_docs)):
+        for gold_token, pred_token in zip(gold_doc, pred_doc):
+            if gold_token.tag_:  # Tokens without a gold tag are not scored
+                total_tokens += 1
+                correct_tokens += gold_token.tag_ == pred_token.tag_
 
     # Get overall evaluation results
-    results = scorer.score(examples)
+    results = {}
+    if total_tokens:
+        results["tag_acc"] = correct_tokens / total_tokens
     print("\nEvaluation Results:")
 
     if "tag_acc" in results:
         print(f'Accuracy : {results["tag_acc"]:.5f}')
     else:
         print("Warning: 'tag_acc' not found in results.")
+    return results
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
-        description="Evaluate a trained POS tagging model using SpaCy's evaluation function."
+        description="Evaluate a trained POS tagging model by its tag accuracy."
     )
     parser.add_argument(
         "--model_path", required=True, help="Path to the trained model."
     )
     parser.add_argument(
-        "--validation_path", required=True, help="Path to the validation SpaCy file."
+        "--validation_path",
+        required=True,
+        help="Path to the validation data (.spacy file or shard directory).",
+    )
+    parser.add_argument(
+        "--batch_size", type=int, default=256, help="Docs per batch for nlp.pipe."
+    )
+    parser.add_argument(
+        "--n_process", type=int, default=1, help="Processes used by nlp.pipe."
     )
     args = parser.parse_args()
 
-    evaluate_model(args.model_path, args.validation_path)
+    evaluate_model(
+        args.model_path,
+        args.validation_path,
+        batch_size=args.batch_size,
+        n_process=args.n_process,
+    )
@@ -4,55 +4,161 @@ Script for preprocessing datasets and converting CoNLL-U files to SpaCy format.
 
 import spacy
 from spacy.tokens import Doc, DocBin
-import pyconll
+from collections import deque
+from pathlib import Path
 import argparse
+import multiprocessing
+import os
 
 
-def conllu_to_spacy_aligned(input_file, output_file):
+def read_sentence_chunks(input_file, chunk_size=10000):
     """
-    Convert a CoNLL-U formatted file to SpaCy training format using pyconll.
+    Stream a CoNLL-U file as chunks of raw sentence blocks, without parsing.
 
     Args:
-        input_file (str): Path to the input CoNLL-U file.
-        output_file (str): Path to save the converted SpaCy binary file.
+        input_file (str): Path to the CoNLL-U file.
+        chunk_size (int): Number of sentences per chunk.
+
+    Yields:
+        list: Sentence blocks (the lines of one sentence joined) of a chunk.
     """
-    nlp = spacy.blank("fa")  # Create a blank SpaCy model for Persian
-    doc_bin = DocBin()
+    chunk = []
+    lines = []
+    with open(input_file, "r", encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                lines.append(line)
+                continue
+            if lines:
+                chunk.append("".join(lines))
+                lines = []
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+    if lines:
+        chunk.append("".join(lines))
+    if chunk:
+        yield chunk
+
+
+def sentence_to_doc(vocab, sentence):
+    """
+    Build a Doc from one CoNLL-U sentence, reading only the ID, FORM, LEMMA
+    and UPOS columns.
 
-    # Load the CoNLL-U data using pyconll
-    try:
-        conllu_data = pyconll.load.iter_from_file(input_file)
-    except Exception as e:
-        raise RuntimeError(f"Error reading CoNLL-U file: {e}")
+    Syntactic words are used as tokens; the words of a multiword token (e.g.
+    "19-20") are joined without a space. Empty nodes and words without a UPOS
+    tag are skipped.
 
-    for sentence in conllu_data:
-        words = []
-        pos_tags = []
+    Args:
+        vocab (Vocab): Vocab of the Doc.
+        sentence (str): Lines of the sentence.
 
-        # Iterate through tokens and extract words and POS tags
-        for token in sentence:
-            if token.form is None or token.upos is None:
-                continue
+    Returns:
+        Doc: The sentence with UPOS as tag and POS, and the lemmas, or None if
+            it has no tagged words.
+    """
+    words = []
+    spaces = []
+    tags = []
+    lemmas = []
+    multiword_end = 0
+    for line in sentence.split("\n"):
+        if not line or line.startswith("#"):
+            continue
+        fields = line.split("\t", 4)
+        word_id = fields[0]
+        if "-" in word_id:
+            multiword_end = int(word_id.split("-")[1])
+            continue
+        if "." in word_id or fields[3] == "_":
+            continue
+        words.append(fields[1])
+        spaces.append(int(word_id) >= multiword_end)
+        tags.append(fields[3])
+        lemmas.append(fields[2] if fields[2] != "_" else "")
+    if not words:
+        return None
+    return Doc(vocab, words=words, spaces=spaces, tags=tags, pos=tags, lemmas=lemmas)
 
-            words.append(token.form)
-            pos_tags.append(token.upos)
 
-        if not words or not pos_tags:
-            continue
+# Vocab of a conversion worker process, created by init_worker
+_worker_vocab = None
+
+
+def init_worker():
+    global _worker_vocab
+    _worker_vocab = spacy.blank("fa").vocab
+
+
+def convert_chunk(sentences):
+    """
+    Convert a chunk of sentences in a worker process.
+
+    Args:
+        sentences (list): Sentence blocks from read_sentence_chunks.
+
+    Returns:
+        bytes: The serialized DocBin of the chunk.
+    """
+    doc_bin = DocBin()
+    for sentence in sentences:
+        doc = sentence_to_doc(_worker_vocab, sentence)
+        if doc is not None:
+            doc_bin.add(doc)
+    return doc_bin.to_bytes()
 
-        # Create a SpaCy Doc object
-        doc = Doc(nlp.vocab, words=words)
 
-        # Assign POS tags to tokens
-        for i, token in enumerate(doc):
-            token.tag_ = pos_tags[i]
-            token.pos_ = pos_tags[i]
+def conllu_to_spacy_aligned(input_file, output_file, shard_size=10000, n_process=None):
+    """
+    Convert a CoNLL-U formatted file to SpaCy training format.
+
+    Chunks of sentences are converted in parallel with at most two chunks per
+    process in flight. If ``output_file`` is a directory, every chunk is
+    written as a DocBin shard as soon as it is converted; if it is a .spacy
+    file, the shards are merged into it at the end.
 
-        # Add the processed Doc to the DocBin
-        doc_bin.add(doc)
+    Args:
+        input_file (str): Path to the input CoNLL-U file.
+        output_file (str): Path to save the converted SpaCy binary file (or
+            shard directory).
+        shard_size (int): Number of sentences per chunk.
+        n_process (int): Number of worker processes. Defaults to all cores.
+    """
+    output_path = Path(output_file)
+    shard_dir = None if output_path.suffix == ".spacy" else output_path
+    if shard_dir is None:
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        merged = DocBin()
+    else:
+        shard_dir.mkdir(parents=True, exist_ok=True)
+        # Shards left by an earlier, longer run would be read with the new ones
+        for stale_shard in shard_dir.glob("*.spacy"):
+            stale_shard.unlink()
+
+    def write(data):
+        if shard_dir is None:
+            merged.merge(DocBin().from_bytes(data))
+        else:
+            (shard_dir / f"{n_shards:05d}.spacy").write_bytes(data)
+
+    n_process = n_process or os.cpu_count()
+    n_shards = 0
+    with multiprocessing.Pool(n_process, initializer=init_worker) as pool:
+        pending = deque()
+        for chunk in read_sentence_chunks(input_file, shard_size):
+            pending.append(pool.apply_async(convert_chunk, (chunk,)))
+            # Write finished chunks in order, and wait once enough are queued
+            while len(pending) >= 2 * n_process or (pending and pending[0].ready()):
+                write(pending.popleft().get())
+                n_shards += 1
+        while pending:
+            write(pending.popleft().get())
+            n_shards += 1
 
     # Save the processed data to disk
-    doc_bin.to_disk(output_file)
+    if shard_dir is None:
+        merged.to_disk(output_path)
     print(f"Successfully saved SpaCy binary file to: {output_file}")
 
 
@@ -64,8 +170,24 @@ if __name__ == "__main__":
         "--input_file", required=True, help="Path to the input CoNLL-U file."
     )
     parser.add_argument(
-        "--output_file", required=True, help="Path to the output SpaCy file."
+        "--output_file",
+        required=True,
+        help="Path to the output SpaCy file (or a directory for shards).",
+    )
+    parser.add_argument(
+        "--shard_size", type=int, default=10000, help="Sentences per shard."
+    )
+    parser.add_argument(
+        "--n_process",
+        type=int,
+        default=None,
+        help="Number of worker processes (defaults to all cores).",
     )
     args = parser.parse_args()
 
-    conllu_to_spacy_aligned(args.input_file, args.output_file)
+    conllu_to_spacy_aligned(
+        args.input_file,
+        args.output_file,
+        shard_size=args.shard_size,
+        n_process=args.n_process,
+    )
@@ -1,114 +1,155 @@
 import spacy
-import random
 from pathlib import Path
 from spacy.training import Example
-from spacy.tokens import DocBin
-from gensim.models import KeyedVectors
-from collections import Counter
+from spacy.attrs import TAG
+from spacy.util import compounding, fix_random_seed
 import argparse
+import multiprocessing
+import numpy
+import sys
 
+# Run as a script, only the script's directory is on the path, not the repository
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from training.corpus import read_docs  # noqa: E402
+from training.parallel import (  # noqa: E402
+    length_bucketed_batches,
+    sample_examples,
+    train_data_parallel,
+    uses_vectors,
+)
 
-def balance_data(doc_bin, nlp, rare_tags, common_tag_threshold=15000):
+DEFAULT_VECTORS_PATH = "persian_spacy/fasttext/vocab"
+
+
+def sampling_weights(docs, nlp, rare_tags, common_tag_threshold=15000):
     """
-    Balance training data by oversampling rare tags and downsampling common tags.
+    Weight each doc for balanced sampling: docs with a rare tag are drawn five
+    times as often, and docs with a tag occurring more than
+    common_tag_threshold times half as often, as any other doc.
 
     Args:
-        doc_bin (DocBin): SpaCy DocBin containing training data.
+        docs (list): Training docs.
         nlp (Language): SpaCy language object.
         rare_tags (set): Tags considered rare.
         common_tag_threshold (int): Maximum number of examples for common tags.
 
     Returns:
-        DocBin: Balanced training data.
+        numpy.ndarray: Sampling weight of every doc.
     """
-    docs = list(doc_bin.get_docs(nlp.vocab))
-    tag_counter = Counter()
-
-    # Count tag occurrences before balancing
-    for doc in docs:
-        tag_counter.update([token.tag_ for token in doc])
-
-    # Balance the dataset
-    balanced_docs = []
-    for doc in docs:
-        doc_tags = [token.tag_ for token in doc]
-
-        # Oversample rare tags
-        if any(tag in rare_tags for tag in doc_tags):
-            balanced_docs.extend([doc] * 5)  # Oversample rare tags
-
-        # Downsample common tags
-        elif any(tag_counter[tag] > common_tag_threshold for tag in doc_tags):
-            if random.random() < 0.5:  # Randomly include half of the examples
-                balanced_docs.append(doc)
-        else:
-            balanced_docs.append(doc)
-
-    # Create a new DocBin with balanced docs
-    balanced_doc_bin = DocBin()
-    for doc in balanced_docs:
-        balanced_doc_bin.add(doc)
-
-    return balanced_doc_bin
-
-
-def train_model(train_path, output_dir, rare_tags, common_tag_threshold=15000):
+    lengths = numpy.array([len(doc) for doc in docs])
+    tags = numpy.concatenate(
+        [numpy.zeros(0, dtype="uint64")] + [doc.to_array(TAG) for doc in docs]
+    )
+    # Count every tag once over the whole corpus, then look it up per token
+    _, inverse, counts = numpy.unique(tags, return_inverse=True, return_counts=True)
+    token_doc = numpy.repeat(numpy.arange(len(docs)), lengths)
+    rare_hashes = numpy.array(
+        [nlp.vocab.strings.add(tag) for tag in rare_tags], dtype="uint64"
+    )
+    has_rare = numpy.zeros(len(docs), dtype=bool)
+    has_rare[token_doc[numpy.isin(tags, rare_hashes)]] = True
+    has_common = numpy.zeros(len(docs), dtype=bool)
+    has_common[token_doc[counts[inverse] > common_tag_threshold]] = True
+
+    weights = numpy.ones(len(docs))
+    weights[has_common] = 0.5
+    weights[has_rare] = 5.0
+    return weights
+
+
+def train_model(
+    train_path,
+    output_dir,
+    rare_tags,
+    common_tag_threshold=15000,
+    vectors_path=DEFAULT_VECTORS_PATH,
+    batch_size=1000,
+    n_workers=1,
+    seed=0,
+):
     """
     Train a POS tagging model without validation evaluation.
 
     Args:
-        train_path (str): Path to the SpaCy training data file.
+        train_path (str): Path to the SpaCy training data file (or its shard
+            directory).
         output_dir (str): Directory to save the trained model.
         rare_tags (set): Tags considered rare for oversampling.
         common_tag_threshold (int): Threshold for downsampling common tags.
+        vectors_path (str): Vectors directory written by fasttext/import_vectors.py.
+        batch_size (int): Maximum number of words per minibatch.
+        n_workers (int): Number of worker processes; 1 trains in this process.
+        seed (int): Random seed.
     """
-    nlp = spacy.blank("fa")  # Load blank Persian SpaCy model
-
-    embedding_path = "persian_spacy/fasttext/cc.fa.300.vec"
+    fix_random_seed(seed)
 
-    # Load FastText embeddings
-    fasttext_model = KeyedVectors.load_word2vec_format(embedding_path, binary=False)
-    print("FastText embeddings loaded successfully!")
-
-    # Add FastText vectors to SpaCy's vocabulary
-    for word in fasttext_model.index_to_key:
-        vector = fasttext_model[word]
-        nlp.vocab.set_vector(word, vector)
+    nlp = spacy.blank("fa")  # Load blank Persian SpaCy model
 
     tagger = nlp.add_pipe("tagger", last=True)
 
-    # Load training data
-    train_doc_bin = DocBin().from_disk(train_path)
+    # Static vectors are only needed if a component's model reads them
+    if uses_vectors(nlp):
+        nlp.vocab.vectors.from_disk(vectors_path)
+        print("FastText embeddings loaded successfully!")
+    else:
+        print("No component uses static vectors; skipping FastText embeddings.")
 
-    # Balance training data
-    train_doc_bin = balance_data(train_doc_bin, nlp, rare_tags, common_tag_threshold)
+    # Load training data, decoding every doc once
+    train_docs = list(read_docs(train_path, nlp.vocab))
+
+    # Balance training data by sampling weights rather than copies
+    weights = sampling_weights(train_docs, nlp, rare_tags, common_tag_threshold)
 
     all_tags = set()
-    for doc in train_doc_bin.get_docs(nlp.vocab):
+    for doc in train_docs:
         all_tags.update(token.tag_ for token in doc)
 
     for tag in all_tags:
         tagger.add_label(tag)
 
+    # Build the training examples once
+    train_examples = [
+        Example.from_dict(doc, {"tags": [token.tag_ for token in doc]})
+        for doc in train_docs
+    ]
+
+    # Batches grow from 100 words up to batch_size, as in the models' configs
+    batch_sizes = compounding(min(100, batch_size), batch_size, 1.001)
+
     optimizer = nlp.begin_training()
 
-    for iteration in range(24):  # Train for 24 iterations
-        print(f"Starting iteration {iteration + 1}")
-        losses = {}
-        train_examples = list(train_doc_bin.get_docs(nlp.vocab))
-        random.shuffle(train_examples)
-
-        for doc in train_examples:
-            example = Example.from_dict(
-                doc,
-                {
-                    "tags": [token.tag_ for token in doc],
-                },
+    if n_workers > 1 and "fork" not in multiprocessing.get_all_start_methods():
+        print("Data-parallel training needs fork(); training in one process.")
+        n_workers = 1
+    if n_workers > 1:
+        print(f"Training on {n_workers} worker processes")
+        for iteration, losses in enumerate(
+            train_data_parallel(
+                nlp,
+                optimizer,
+                train_examples,
+                batch_sizes,
+                24,
+                n_workers,
+                seed=seed,
+                weights=weights,
+            )
+        ):
+            print(f"Iteration {iteration + 1} - Training Loss: {losses['tagger']}")
+    else:
+        for iteration in range(24):  # Train for 24 iterations
+            print(f"Starting iteration {iteration + 1}")
+            losses = {}
+
+            # Draw this iteration's examples by weight
+            iteration_examples = sample_examples(
+                train_examples, weights, seed + iteration
             )
-            nlp.update([example], drop=0.3, losses=losses)
+            for batch in length_bucketed_batches(iteration_examples, batch_sizes):
+                nlp.update(batch, drop=0.3, losses=losses)
 
-        # Print the training loss for this iteration
-        print(f"Iteration {iteration + 1} - Training Loss: {losses['tagger']}")
+            # Print the training loss for this iteration
+            print(f"Iteration {iteration + 1} - Training Loss: {losses['tagger']}")
 
     # Save the trained model
     nlp.to_disk(output_dir)
@@ -118,14 +159,43 @@ def train_model(train_path, output_dir, rare_tags, common_tag_threshold=15000):
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Train a POS tagging model.")
     parser.add_argument(
-        "--train_path", required=True, help="Path to the training data."
+        "--train_path",
+        required=True,
+        help="Path to the training data (.spacy file or shard directory).",
     )
     parser.add_argument(
         "--output_dir", required=True, help="Directory to save the trained model."
     )
+    parser.add_argument(
+        "--vectors_path",
+        default=DEFAULT_VECTORS_PATH,
+        help="Vectors directory written by fasttext/import_vectors.py.",
+    )
+    parser.add_argument(
+        "--batch_size",
+        type=int,
+        default=1000,
+        help="Maximum number of words per minibatch.",
+    )
+    parser.add_argument(
+        "--n_workers",
+        type=int,
+        default=1,
+        help="Number of worker processes for data-parallel training.",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Random seed.")
     args = parser.parse_args()
 
     # Rare tags to oversample
     rare_tags = {"INTJ", "X"}
 
-    train_model(args.train_path, args.output_dir, rare_tags, common_tag_threshold=15000)
+    train_model(
+        args.train_path,
+        args.output_dir,
+        rare_tags,
+        common_tag_threshold=15000,
+        vectors_path=args.vectors_path,
+        batch_size=args.batch_size,
+        n_workers=args.n_workers,
+        seed=args.seed,
+    )
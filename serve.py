@@ -0,0 +1,341 @@
+"""
+Serve the pipeline over HTTP on localhost.
+
+Concurrent requests are queued and coalesced into micro-batches (bounded by
+--max_batch_size texts and --max_delay seconds of waiting), which run through
+``nlp.pipe`` on a pool of worker processes. Endpoints:
+
+    POST /annotate  {"text": "..."} -> one annotated doc
+                    {"texts": ["...", ...]} -> {"docs": [...]}
+    GET  /health    {"status": "ok"}
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import asyncio
+import json
+import multiprocessing
+import signal
+
+from annotate import doc_to_json
+
+# Pipeline of a worker process, loaded by init_worker
+_worker_nlp = None
+
+
+def init_worker(pipeline_path, components=None, cache_size=0, cache_path=None):
+    """
+    Load the pipeline once per worker process.
+
+    Args:
+        pipeline_path (str): Path to the pipeline built by package.py.
+        components (list): Components to load. Defaults to all.
+        cache_size (int): Docs kept in the worker's result cache; 0 disables it.
+        cache_path (str): Optional SQLite file shared by the workers' caches.
+    """
+    global _worker_nlp
+    # Importing the pipeline loader registers the "persian_normalizer" and
+    # "rule_based_lemmatizer" factories
+    from lemmatizer.caching import CachedPipeline
+    from lemmatizer.pipeline import load_pipeline
+
+    _worker_nlp = load_pipeline(pipeline_path, components)
+    if cache_size:
+        # Repeated texts are answered from the cache without running the pipeline
+        _worker_nlp = CachedPipeline(_worker_nlp, cache_size, cache_path)
+
+
+def annotate_batch(texts):
+    """
+    Args:
+        texts (list): Texts of one micro-batch.
+
+    Returns:
+        list: Tokens (tag and lemma) and entities of each text.
+    """
+    return [
+        doc_to_json(doc, {})
+        for doc in _worker_nlp.pipe(texts, batch_size=max(len(texts), 1))
+    ]
+
+
+class MicroBatcher:
+    """
+    Queue texts from concurrent requests and run them in batches on a pool of
+    pipeline workers. A batch is sent when it holds max_batch_size texts or
+    its first text has waited max_delay seconds, whichever comes first, and
+    only when a worker is free, so batches grow while the workers are busy.
+
+    Args:
+        executor (Executor): Pool whose workers ran init_worker.
+        n_workers (int): Number of workers in the pool.
+        max_batch_size (int): Maximum number of texts per batch.
+        max_delay (float): Maximum time (seconds) to wait for a batch to fill.
+        max_queue (int): Maximum number of queued texts.
+    """
+
+    def __init__(
+        self, executor, n_workers=1, max_batch_size=32, max_delay=0.005, max_queue=10000
+    ):
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.free_workers = asyncio.Semaphore(n_workers)
+        self.tasks = set()
+
+    async def submit(self, text):
+        """
+        Args:
+            text (str): Text to annotate.
+
+        Returns:
+            dict: The annotated doc.
+
+        Raises:
+            asyncio.QueueFull: If max_queue texts are already waiting.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((text, future))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self.free_workers.acquire()
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.max_batch_size:
+                if not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            task = loop.create_task(self.process(batch))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def process(self, batch):
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(
+                self.executor, annotate_batch, [text for text, _ in batch]
+            )
+        except Exception as error:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+        else:
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            self.free_workers.release()
+
+
+async def route(method, target, body, batcher):
+    """
+    Returns:
+        tuple: HTTP status line and JSON payload of the response.
+    """
+    if target == "/health" and method == "GET":
+        return "200 OK", {"status": "ok"}
+    if target != "/annotate":
+        return "404 Not Found", {"error": f"Unknown path {target}"}
+    if method != "POST":
+        return "405 Method Not Allowed", {"error": "Use POST"}
+    try:
+        request = json.loads(body)
+        if "texts" in request:
+            texts = [str(text) for text in request["texts"]]
+        else:
+            texts = [str(request["text"])]
+    except (ValueError, KeyError, TypeError):
+        return "400 Bad Request", {
+            "error": 'Expected {"text": ...} or {"texts": [...]}'
+        }
+    try:
+        docs = await asyncio.gather(*(batcher.submit(text) for text in texts))
+    except asyncio.QueueFull:
+        return "503 Service Unavailable", {"error": "Too many queued requests"}
+    if "texts" in request:
+        return "200 OK", {"docs": docs}
+    return "200 OK", docs[0]
+
+
+async def handle_connection(reader, writer, batcher):
+    """
+    Serve the HTTP/1.1 requests of one connection (kept alive unless the
+    client asks to close it).
+    """
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            method, target, version = request_line.decode("latin-1").split()
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+            status, payload = await route(method, target, body, batcher)
+            keep_alive = (
+                version == "HTTP/1.1"
+                and headers.get("connection", "").lower() != "close"
+            )
+            data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                f"Content-Type: application/json; charset=utf-8\r\n"
+                f"Content-Length: {len(data)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode(
+                    "latin-1"
+                )
+                + data
+            )
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+        pass  # Client went away or sent a malformed request
+    finally:
+        writer.close()
+
+
+async def serve(
+    pipeline_path,
+    host="127.0.0.1",
+    port=8080,
+    n_workers=1,
+    max_batch_size=32,
+    max_delay=0.005,
+    max_queue=10000,
+    components=None,
+    cache_size=0,
+    cache_path=None,
+):
+    """
+    Start the worker pool and serve until cancelled or sent SIGTERM. On the
+    way out the server stops accepting connections and the worker processes
+    are shut down before returning.
+
+    Args:
+        pipeline_path (str): Path to the pipeline built by package.py.
+        host (str): Interface to listen on.
+        port (int): Port to listen on.
+        n_workers (int): Number of pipeline worker processes.
+        max_batch_size (int): Maximum number of texts per batch.
+        max_delay (float): Maximum time (seconds) to wait for a batch to fill.
+        max_queue (int): Maximum number of queued texts before answering 503.
+        components (list): Components to load. Defaults to all.
+        cache_size (int): Docs kept in each worker's result cache; 0 disables it.
+        cache_path (str): Optional SQLite file shared by the workers' caches.
+    """
+    # Workers are spawned rather than forked from the running event loop
+    executor = ProcessPoolExecutor(
+        n_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_worker,
+        initargs=(pipeline_path, components, cache_size, cache_path),
+    )
+    loop = asyncio.get_running_loop()
+    # Load the pipeline in the workers before accepting requests
+    await asyncio.gather(
+        *(
+            loop.run_in_executor(executor, annotate_batch, ["سلام"])
+            for _ in range(n_workers)
+        )
+    )
+    batcher = MicroBatcher(executor, n_workers, max_batch_size, max_delay, max_queue)
+    batch_task = loop.create_task(batcher.run())
+    server = await asyncio.start_server(
+        lambda reader, writer: handle_connection(reader, writer, batcher), host, port
+    )
+    print(f"Serving on http://{host}:{port} with {n_workers} workers")
+    # SIGTERM would otherwise kill this process and leave the workers behind
+    stop = asyncio.Event()
+    loop.add_signal_handler(signal.SIGTERM, stop.set)
+    try:
+        async with server:
+            await stop.wait()
+    finally:
+        loop.remove_signal_handler(signal.SIGTERM)
+        batch_task.cancel()
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Serve the pipeline over HTTP with micro-batching."
+    )
+    parser.add_argument(
+        "--pipeline_path",
+        default="fa_core_web_sm",
+        help="Path to the pipeline built by package.py.",
+    )
+    parser.add_argument(
+        "--components",
+        nargs="+",
+        default=None,
+        help="Components to load (defaults to all).",
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on.")
+    parser.add_argument("--port", type=int, default=8080, help="Port to listen on.")
+    parser.add_argument(
+        "--n_workers", type=int, default=1, help="Number of pipeline worker processes."
+    )
+    parser.add_argument(
+        "--max_batch_size", type=int, default=32, help="Maximum texts per batch."
+    )
+    parser.add_argument(
+        "--max_delay",
+        type=float,
+        default=0.005,
+        help="Maximum seconds a text waits for its batch to fill.",
+    )
+    parser.add_argument(
+        "--max_queue",
+        type=int,
+        default=10000,
+        help="Maximum queued texts before answering 503.",
+    )
+    parser.add_argument(
+        "--cache_size",
+        type=int,
+        default=0,
+        help="Docs kept in each worker's result cache (0 disables caching).",
+    )
+    parser.add_argument(
+        "--cache_path",
+        default=None,
+        help="Optional SQLite file persisting the result cache.",
+    )
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(
+            serve(
+                args.pipeline_path,
+                host=args.host,
+                port=args.port,
+                n_workers=args.n_workers,
+                max_batch_size=args.max_batch_size,
+                max_delay=args.max_delay,
+                max_queue=args.max_queue,
+                components=args.components,
+                cache_size=args.cache_size,
+                cache_path=args.cache_path,
+            )
+        )
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,18 @@
+import spacy
+
+import lemmatizer.lemmatizer  # noqa: F401
+from lemmatizer.caching import CachedPipeline
+
+
+def test_repeats_within_a_batch_count_as_hits():
+    nlp = spacy.blank("fa")
+    nlp.add_pipe("persian_normalizer")
+    cached = CachedPipeline(nlp, maxsize=10)
+    texts = ["علی به مدرسه رفت.", "علی به مدرسه رفت.", "کتاب را خواند."]
+    docs = list(cached.pipe(texts))
+    assert [doc.text for doc in docs] == texts
+    assert docs[0] is not docs[1]
+    stats = cached.cache.stats
+    assert stats["hits"] == 1
+    assert stats["misses"] == 2
+    assert stats["hits"] + stats["misses"] + stats["disk_hits"] == len(texts)
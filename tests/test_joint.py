@@ -0,0 +1,85 @@
+import itertools
+
+import numpy
+import spacy
+from spacy.training import Example
+from spacy.util import fix_random_seed
+
+from joint.train import NER_CONFIG, TAGGER_CONFIG, TOK2VEC_CONFIG, mixed_batches
+
+
+def joint_pipeline():
+    nlp = spacy.blank("fa")
+    nlp.add_pipe("tok2vec", config=TOK2VEC_CONFIG)
+    nlp.add_pipe("tagger", config=TAGGER_CONFIG)
+    nlp.add_pipe("ner", config=NER_CONFIG)
+    pos_examples = [
+        Example.from_dict(
+            nlp.make_doc("علی به مدرسه رفت"),
+            {"tags": ["PROPN", "ADP", "NOUN", "VERB"]},
+        ),
+        Example.from_dict(nlp.make_doc("کتاب خواند"), {"tags": ["NOUN", "VERB"]}),
+    ]
+    ner_examples = [
+        Example.from_dict(
+            nlp.make_doc("علی به تهران رفت"),
+            {"entities": [(0, 3, "PER"), (7, 12, "LOC")]},
+        ),
+        Example.from_dict(nlp.make_doc("او آمد"), {"entities": []}),
+    ]
+    optimizer = nlp.initialize(lambda: pos_examples + ner_examples)
+    return nlp, optimizer, pos_examples, ner_examples
+
+
+def tok2vec_grads(nlp):
+    grads = []
+    for node in nlp.get_pipe("tok2vec").model.walk():
+        for name in node.param_names:
+            if node.has_grad(name):
+                grads.append(node.get_grad(name).copy())
+                node.set_grad(name, numpy.zeros_like(node.get_grad(name)))
+            else:
+                grads.append(None)
+    return grads
+
+
+def test_mixed_batches_hold_both_tasks():
+    # Strings stand in for examples; their length is their number of words
+    pos_examples = ["p" * n for n in range(1, 11)]
+    ner_examples = ["n" * n for n in (2, 4, 6)]
+    fix_random_seed(0)
+    batches = mixed_batches(pos_examples, ner_examples, itertools.repeat(12))
+    assert len(batches) == 3
+    for batch in batches:
+        assert any(eg[0] == "p" for eg in batch) and any(eg[0] == "n" for eg in batch)
+    assert sorted(eg for batch in batches for eg in batch) == sorted(
+        pos_examples + ner_examples
+    )
+    # The same seed gives the same batches
+    fix_random_seed(0)
+    assert mixed_batches(pos_examples, ner_examples, itertools.repeat(12)) == batches
+
+
+def test_tagger_gradient_reaches_shared_tok2vec():
+    nlp, optimizer, pos_examples, ner_examples = joint_pipeline()
+    # The output layers start at zero, so train them off zero first
+    for _ in range(3):
+        nlp.update(pos_examples + ner_examples, sgd=optimizer)
+    tok2vec_grads(nlp)
+    (batch,) = mixed_batches(pos_examples, ner_examples, itertools.repeat(100))
+
+    # Same seed, so the NER's share of the gradient is the same in both
+    fix_random_seed(0)
+    nlp.update(batch, drop=0.0, sgd=False, exclude=["tagger"])
+    ner_grads = tok2vec_grads(nlp)
+    fix_random_seed(0)
+    nlp.update(batch, drop=0.0, sgd=False)
+    joint_grads = tok2vec_grads(nlp)
+
+    tagger_grads = [
+        joint - ner
+        for joint, ner in zip(joint_grads, ner_grads)
+        if joint is not None and ner is not None
+    ]
+    assert tagger_grads
+    assert any(numpy.abs(grad).sum() > 0 for grad in tagger_grads)
@@ -0,0 +1,129 @@
+import pickle
+from pathlib import Path
+
+import spacy
+
+from lemmatizer.lemmatizer import (
+    PREFIXES,
+    SUFFIXES,
+    AffixIndex,
+    MappedLemmaDictionary,
+    lemmatize,
+    load_lemma_dictionary,
+    normalize_text,
+    pos_key,
+    remove_prefixes,
+    remove_suffixes,
+    write_lemma_dictionary,
+)
+
+DICTIONARY_PATH = Path(__file__).parent.parent / "data/lemmatizer/lemma_dict.txt"
+
+
+def test_affixes_are_normalized():
+    # Affixes are matched against normalized words, so any character the
+    # normalizer rewrites or drops would make an affix unmatchable
+    for affix in SUFFIXES + PREFIXES:
+        assert normalize_text(affix) == affix
+
+
+def test_factories_declare_assigned_attributes():
+    nlp = spacy.blank("fa")
+    nlp.add_pipe("persian_normalizer")
+    summary = nlp.analyze_pipes()["summary"]
+    assert "token.norm" in summary["persian_normalizer"]["assigns"]
+    meta = nlp.get_factory_meta("rule_based_lemmatizer")
+    assert meta.assigns == ["token.lemma"]
+
+
+def linear_scan(word, dictionary, affixes, suffix):
+    # The lookup the lemmatizer did before the affixes were compiled
+    for affix in affixes:
+        if word.endswith(affix) if suffix else word.startswith(affix):
+            stem = word[: -len(affix)] if suffix else word[len(affix) :]
+            lemma = dictionary.get(stem.strip(), None)
+            if lemma:
+                return lemma
+    return word
+
+
+def test_affix_tries_match_the_linear_scan():
+    dictionary = load_lemma_dictionary(DICTIONARY_PATH)
+    stems = list(dictionary)[::300]
+    words = stems + [stem + suffix for stem in stems for suffix in SUFFIXES]
+    words += [prefix + stem for stem in stems for prefix in PREFIXES]
+    for word in words:
+        assert remove_suffixes(word, dictionary) == linear_scan(
+            word, dictionary, SUFFIXES, suffix=True
+        )
+        assert remove_prefixes(word, dictionary) == linear_scan(
+            word, dictionary, PREFIXES, suffix=False
+        )
+        assert AffixIndex().suffixes.match(word) == [
+            len(suffix) for suffix in dict.fromkeys(SUFFIXES) if word.endswith(suffix)
+        ]
+
+
+def test_mi_is_only_a_prefix():
+    # The shipped pipeline (package.py) had "می" as a prefix, not a suffix
+    dictionary = {"جیمی": "جیمی", "میجی": "میجی", "اتمی": "اتمی", "بیات": "بیات"}
+    assert lemmatize("میجیمی", dictionary) == "جیمی"
+    assert lemmatize("بیاتمی", dictionary) == "اتمی"
+
+
+def test_compiled_dictionary_round_trip(tmp_path):
+    dictionary = load_lemma_dictionary(DICTIONARY_PATH, with_pos=True)
+    assert any("\t" in word for word in dictionary)
+    write_lemma_dictionary(dictionary, tmp_path / "lemmas.bin")
+    mapped = MappedLemmaDictionary(tmp_path / "lemmas.bin")
+
+    assert len(mapped) == len(dictionary)
+    for word, lemma in dictionary.items():
+        assert word in mapped
+        assert mapped.get(word) == lemma
+    missing = ["", "xyz", "کتابخانه‌هاییشان", pos_key("کتاب", "INTJ")]
+    for word in missing:
+        assert word not in dictionary
+        assert word not in mapped
+        assert mapped.get(word) is None
+        assert mapped.get(word, word) == word
+
+    # Workers re-map the same file
+    restored = pickle.loads(pickle.dumps(mapped))
+    assert restored.get(pos_key("کتاب", "NOUN")) == "کتاب"
+
+
+def test_pipe_matches_call():
+    nlp = spacy.blank("fa")
+    nlp.add_pipe("persian_normalizer")
+    lemmatizer = nlp.add_pipe(
+        "rule_based_lemmatizer", config={"lemma_dict_path": str(DICTIONARY_PATH)}
+    )
+    texts = [
+        "كتاب‌ها را کتاب‌ها خواندند",
+        "",
+        "کتاب‌ها را می‌خوانم",
+        "",
+        "",
+        "دانشجویان دانشجویان",
+    ]
+    tags = {"را": "ADP", "خواندند": "VERB", "می‌خوانم": "VERB"}
+
+    def make_docs():
+        docs = []
+        for i, text in enumerate(texts):
+            doc = nlp.make_doc(text)
+            for token in doc:
+                token.tag_ = tags.get(token.text, "NOUN")
+            # Mix docs with and without the normalizer's NORM in one batch
+            docs.append(nlp.get_pipe("persian_normalizer")(doc) if i % 2 else doc)
+        return docs
+
+    expected = [[token.lemma_ for token in lemmatizer(doc)] for doc in make_docs()]
+    for batch_size in (1, 4, 1000):
+        docs = list(lemmatizer.pipe(make_docs(), batch_size=batch_size))
+        assert [[token.lemma_ for token in doc] for doc in docs] == expected
+    assert expected[1] == []
+    assert expected[5] == ["دانشجو", "دانشجو"]
+    # All-empty batches have nothing to lemmatize
+    assert [len(doc) for doc in lemmatizer.pipe(make_docs()[3:5])] == [0, 0]
@@ -0,0 +1,67 @@
+import itertools
+
+import numpy
+import spacy
+from spacy.training import Example
+
+from pos.train import sampling_weights
+from training.parallel import parameter_slots, sample_examples, train_data_parallel
+
+
+def tagger_examples(nlp):
+    examples = []
+    for words, tags in [
+        (["علی", "به", "مدرسه", "رفت"], ["PROPN", "ADP", "NOUN", "VERB"]),
+        (["کتاب", "خواند"], ["NOUN", "VERB"]),
+        (["او", "آمد"], ["PRON", "VERB"]),
+    ]:
+        doc = nlp.make_doc(" ".join(words))
+        examples.append(Example.from_dict(doc, {"tags": tags}))
+    return examples
+
+
+def test_batches_left_over_by_the_workers_are_trained_on():
+    nlp = spacy.blank("fa")
+    nlp.add_pipe("tagger")
+    examples = tagger_examples(nlp)
+    optimizer = nlp.initialize(lambda: examples)
+    before = [node.get_param(name).copy() for node, name, *_ in parameter_slots(nlp)]
+
+    # One batch for two workers: the second worker has nothing to train on
+    losses = list(
+        train_data_parallel(
+            nlp, optimizer, examples, itertools.repeat(1000), 1, n_workers=2
+        )
+    )
+
+    assert losses[0]["tagger"] > 0
+    after = [node.get_param(name) for node, name, *_ in parameter_slots(nlp)]
+    assert any(not numpy.array_equal(old, new) for old, new in zip(before, after))
+
+
+def test_sampling_weights_favour_rare_tags():
+    nlp = spacy.blank("fa")
+    docs = []
+    for words, tags in [
+        (["کتاب", "آه"], ["NOUN", "INTJ"]),
+        (["کتاب", "مدرسه"], ["NOUN", "NOUN"]),
+        (["رفت"], ["VERB"]),
+        (["xyz"], ["X"]),
+        ([], []),
+    ]:
+        doc = nlp.make_doc(" ".join(words))
+        for token, tag in zip(doc, tags):
+            token.tag_ = tag
+        docs.append(doc)
+
+    # NOUN occurs three times, so it counts as common; a rare tag wins
+    weights = sampling_weights(docs, nlp, {"INTJ", "X"}, common_tag_threshold=2)
+    assert weights.tolist() == [5.0, 0.5, 1.0, 5.0, 1.0]
+
+    probabilities = weights / weights.sum()
+    assert numpy.isclose(probabilities.sum(), 1.0)
+    assert probabilities[3] > probabilities[2] > probabilities[1]
+    # An iteration draws as many examples as the weights add up to
+    drawn = sample_examples(list(range(len(docs))), weights, seed=0)
+    assert len(drawn) == round(weights.sum())
+    assert set(drawn) <= set(range(len(docs)))
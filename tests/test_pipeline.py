@@ -0,0 +1,18 @@
+from test_joint import joint_pipeline
+
+from lemmatizer.pipeline import LazyPipeline, load_pipeline
+
+
+def test_components_keep_the_tok2vec_they_listen_to(tmp_path):
+    nlp, optimizer, pos_examples, ner_examples = joint_pipeline()
+    for _ in range(10):
+        nlp.update(pos_examples + ner_examples, sgd=optimizer)
+    nlp.to_disk(tmp_path)
+    text = "علی به مدرسه رفت"
+
+    tagger_only = load_pipeline(tmp_path, components=["tagger"])
+    assert tagger_only.pipe_names == ["tok2vec", "tagger"]
+    expected = [token.tag_ for token in load_pipeline(tmp_path)(text)]
+    assert [token.tag_ for token in tagger_only(text)] == expected
+    lazy = LazyPipeline(tmp_path, components=["tagger"])
+    assert [token.tag_ for token in lazy(text)] == expected
@@ -0,0 +1,28 @@
+import numpy
+import spacy
+
+from lemmatizer.search import IVFIndex, VectorSearch, recall_at_k
+
+
+def test_probing_every_list_matches_exact_search(tmp_path):
+    nlp = spacy.blank("fa")
+    rng = numpy.random.default_rng(0)
+    words = [f"word{i}" for i in range(200)]
+    for word in words:
+        nlp.vocab.set_vector(word, rng.standard_normal(8).astype("float32"))
+
+    search = VectorSearch(nlp.vocab)
+    IVFIndex.build(search, n_lists=8, seed=0).save(tmp_path / "vectors_ivf")
+    search.index = IVFIndex.load(tmp_path / "vectors_ivf")
+    queries = words[::10]
+
+    exact = search.most_similar(queries, k=5)
+    approximate = search.most_similar(queries, k=5, n_probe=8)
+    assert [[word for word, _ in found] for found in approximate] == [
+        [word for word, _ in expected] for expected in exact
+    ]
+    for expected, found in zip(exact, approximate):
+        assert numpy.allclose(
+            [score for _, score in found], [score for _, score in expected]
+        )
+    assert recall_at_k(search, queries, k=5, n_probe=8) == 1.0
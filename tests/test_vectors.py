@@ -0,0 +1,57 @@
+import numpy
+import spacy
+import srsly
+from spacy.tokens import DocBin
+
+import lemmatizer.vectors  # noqa: F401
+from lemmatizer.vectors import load_mapped_vectors
+from package import save_variant
+
+
+def test_lazy_vectors_survive_serialization(tmp_path):
+    full = spacy.blank("fa")
+    full.vocab.set_vector("ایران", numpy.ones(4, dtype="float32"))
+    full.vocab.set_vector("کشور", numpy.arange(4, dtype="float32"))
+    full.to_disk(tmp_path / "full")
+
+    nlp = spacy.blank("fa")
+    nlp.add_pipe("lazy_vectors", config={"vectors_path": str(tmp_path / "full")})
+    doc = nlp("ایران کشور")
+    doc_bin = DocBin()
+    doc_bin.add(doc)
+    (restored,) = DocBin().from_bytes(doc_bin.to_bytes()).get_docs(nlp.vocab)
+
+    assert restored.has_vector
+    assert numpy.allclose(restored.vector, doc.vector)
+    assert restored.similarity(doc) > 0.99
+
+
+def test_mapped_vectors_answer_most_similar(tmp_path):
+    full = spacy.blank("fa")
+    full.vocab.set_vector("ایران", numpy.ones(4, dtype="float32"))
+    full.vocab.set_vector("آسیا", numpy.arange(4, dtype="float32"))
+    full.to_disk(tmp_path / "full")
+
+    nlp = spacy.blank("fa")
+    load_mapped_vectors(nlp.vocab, tmp_path / "full")
+    vectors = nlp.vocab.vectors
+    keys, _, scores = vectors.most_similar(vectors.data[:1], n=1)
+
+    assert keys[0][0] == nlp.vocab.strings["ایران"]
+    assert scores[0][0] > 0.99
+    assert numpy.array_equal(
+        numpy.load(tmp_path / "full" / "vocab" / "vectors"), full.vocab.vectors.data
+    )
+
+
+def test_variants_leave_out_the_vector_strings(tmp_path):
+    full = spacy.blank("fa")
+    full.add_pipe("persian_normalizer")
+    for word in ["ایران", "خاورمیانه", "آسیا"]:
+        full.vocab.set_vector(word, numpy.ones(4, dtype="float32"))
+
+    save_variant(full, ["persian_normalizer"], tmp_path / "variant")
+
+    strings = srsly.read_json(tmp_path / "variant" / "vocab" / "strings.json")
+    assert "خاورمیانه" not in strings
+    assert spacy.load(tmp_path / "variant")("خاورمیانه").text == "خاورمیانه"
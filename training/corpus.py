@@ -0,0 +1,21 @@
+from spacy.tokens import DocBin
+from pathlib import Path
+
+
+def read_docs(path, vocab):
+    """
+    Read the Docs of a .spacy file or of a directory of .spacy shards, as
+    written by pos/preprocess.py and ner/preprocess.py. Shards are read one at
+    a time, so only one is held in memory.
+
+    Args:
+        path (str): .spacy file or shard directory.
+        vocab (Vocab): Vocab of the Docs.
+
+    Yields:
+        Doc: Each Doc, shard by shard.
+    """
+    path = Path(path)
+    paths = sorted(path.glob("*.spacy")) if path.is_dir() else [path]
+    for shard_path in paths:
+        yield from DocBin().from_disk(shard_path).get_docs(vocab)
@@ -0,0 +1,20 @@
+from spacy.tokens import Doc
+
+
+def gold_tokenized(docs, vocab):
+    """
+    Strip the annotations from gold Docs, keeping their tokenization.
+
+    Args:
+        docs (iterable): Gold Docs.
+        vocab (Vocab): Vocab of the model that will annotate the copies.
+
+    Yields:
+        Doc: Unannotated Doc with the same tokens as the gold Doc.
+    """
+    for doc in docs:
+        yield Doc(
+            vocab,
+            words=[token.text for token in doc],
+            spaces=[bool(token.whitespace_) for token in doc],
+        )
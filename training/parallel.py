@@ -0,0 +1,289 @@
+"""
+Data-parallel training shared by the POS and NER training scripts.
+"""
+
+from spacy.util import fix_random_seed
+import multiprocessing
+import numpy
+import queue
+import random
+
+
+def uses_vectors(nlp):
+    """
+    Check whether any pipeline component reads static (pretrained) vectors.
+
+    Args:
+        nlp (Language): SpaCy language object.
+
+    Returns:
+        bool: True if a component model is configured with static vectors.
+    """
+    sections = [nlp.config["components"]]
+    while sections:
+        section = sections.pop()
+        for key, value in section.items():
+            if isinstance(value, dict):
+                sections.append(value)
+            elif key in ("pretrained_vectors", "include_static_vectors") and value:
+                return True
+            elif key == "@architectures" and "StaticVectors" in value:
+                return True
+    return False
+
+
+def sample_examples(examples, weights, seed):
+    """
+    Draw one iteration's examples in proportion to their weights, with
+    replacement. The examples themselves are shared, never copied.
+
+    Args:
+        examples (list): Training examples.
+        weights (numpy.ndarray): Sampling weight of every example, or None to
+            use every example once.
+        seed (int): Random seed of the draw.
+
+    Returns:
+        list: Examples of the iteration.
+    """
+    if weights is None:
+        return examples
+    total = weights.sum()
+    rng = numpy.random.default_rng(seed)
+    indices = rng.choice(len(examples), size=int(round(total)), p=weights / total)
+    return [examples[i] for i in indices]
+
+
+def length_bucketed_batches(examples, batch_sizes):
+    """
+    Group examples of similar length into minibatches with a word budget.
+
+    Args:
+        examples (list): Training examples.
+        batch_sizes (iterator): Word budget of each successive batch.
+
+    Returns:
+        list: Minibatches of examples, in random order.
+    """
+    # Random tie-breaking varies the batches from one iteration to the next
+    ordered = sorted(examples, key=lambda example: (len(example), random.random()))
+    batches = []
+    batch = []
+    n_words = 0
+    size = next(batch_sizes)
+    for example in ordered:
+        if batch and n_words + len(example) > size:
+            batches.append(batch)
+            batch, n_words, size = [], 0, next(batch_sizes)
+        batch.append(example)
+        n_words += len(example)
+    if batch:
+        batches.append(batch)
+    random.shuffle(batches)
+    return batches
+
+
+def parameter_slots(nlp):
+    """
+    List the parameters of the trainable components in a fixed order, so that
+    every worker lays them out identically in shared memory.
+
+    Args:
+        nlp (Language): SpaCy language object.
+
+    Returns:
+        list: (node, name, start, end, shape) for every parameter.
+    """
+    slots = []
+    seen = set()
+    start = 0
+    for _, proc in nlp.pipeline:
+        if not getattr(proc, "is_trainable", False):
+            continue
+        for node in proc.model.walk():
+            if node.id in seen:
+                continue
+            seen.add(node.id)
+            for name in node.param_names:
+                if node.has_param(name):
+                    shape = node.get_param(name).shape
+                    end = start + int(numpy.prod(shape))
+                    slots.append((node, name, start, end, shape))
+                    start = end
+    return slots
+
+
+def data_parallel_worker(
+    rank,
+    nlp,
+    optimizer,
+    examples,
+    weights,
+    batch_sizes,
+    iterations,
+    seed,
+    shared,
+    queue,
+):
+    """
+    Train one replica on its share of the minibatches, averaging gradients with
+    the other workers after every step. The minibatches are dealt out in turn,
+    so every batch of the iteration is used.
+
+    Args:
+        rank (int): Index of this worker.
+        nlp (Language): SpaCy language object (a forked copy).
+        optimizer (Optimizer): Optimizer returned by begin_training.
+        examples (list): Training examples.
+        weights (numpy.ndarray): Sampling weight of every example, or None.
+        batch_sizes (iterator): Word budget of each successive batch.
+        iterations (int): Number of training iterations.
+        seed (int): Base random seed.
+        shared (dict): Shared gradient buffers and the barrier.
+        queue (Queue): Receives the losses of every iteration.
+    """
+    n_workers = shared["barrier"].parties
+    slots = parameter_slots(nlp)
+    size = slots[-1][3]
+    grads = numpy.frombuffer(shared["grads"], dtype="float32").reshape(n_workers, size)
+    has_grad = numpy.frombuffer(shared["has_grad"], dtype="int8").reshape(
+        n_workers, len(slots)
+    )
+    summed = numpy.frombuffer(shared["summed"], dtype="float32")
+    # Each worker sums one slice of the gradients
+    low, high = rank * size // n_workers, (rank + 1) * size // n_workers
+
+    # Dropout differs per worker, but the batches must be the same everywhere
+    fix_random_seed(seed + rank)
+    try:
+        for iteration in range(iterations):
+            random.seed(seed + iteration)
+            batches = length_bucketed_batches(
+                sample_examples(examples, weights, seed + iteration), batch_sizes
+            )
+            # The last step takes the remaining batches, so some workers may
+            # have none and only contribute to the barriers
+            n_steps = -(-len(batches) // n_workers)
+            own_batches = batches[rank::n_workers]
+            losses = {}
+            for step in range(n_steps):
+                if step < len(own_batches):
+                    nlp.update(own_batches[step], drop=0.3, sgd=False, losses=losses)
+                # The optimizer zeroes gradients in place rather than removing
+                # them, so a parameter the step did not reach has a zero one
+                for i, (node, name, start, end, _) in enumerate(slots):
+                    grad = node.get_grad(name) if node.has_grad(name) else None
+                    has_grad[rank, i] = grad is not None and bool(grad.any())
+                    if has_grad[rank, i]:
+                        grads[rank, start:end] = grad.ravel()
+                    else:
+                        grads[rank, start:end] = 0
+                shared["barrier"].wait()
+                summed[low:high] = grads[:, low:high].sum(axis=0)
+                shared["barrier"].wait()
+                # Average each gradient over the workers that computed it.
+                # Parameters without any gradient are left out of the update,
+                # so the optimizer neither steps nor decays them. Same
+                # gradients and optimizer state keep the replicas identical.
+                counts = has_grad.sum(axis=0)
+                for (node, name, start, end, shape), count in zip(slots, counts):
+                    if count:
+                        grad = summed[start:end].reshape(shape) / float(count)
+                        param, grad = optimizer(
+                            (node.id, name), node.get_param(name), grad
+                        )
+                        node.set_param(name, param)
+                        node.set_grad(name, grad)
+            queue.put(losses)
+
+        # Hand the trained weights back to the parent
+        shared["barrier"].wait()
+        if rank == 0:
+            for node, name, start, end, _ in slots:
+                summed[start:end] = node.get_param(name).ravel()
+    except BaseException:
+        shared["barrier"].abort()
+        raise
+
+
+def train_data_parallel(
+    nlp, optimizer, examples, batch_sizes, iterations, n_workers, seed=0, weights=None
+):
+    """
+    Train on several forked worker processes. Every step, each worker updates
+    on a different minibatch and the gradients are averaged through shared
+    memory, which is equivalent to one update on n_workers times the batch.
+
+    Args:
+        nlp (Language): SpaCy language object, initialized for training.
+        optimizer (Optimizer): Optimizer returned by begin_training.
+        examples (list): Training examples.
+        batch_sizes (iterator): Word budget of each successive batch.
+        iterations (int): Number of training iterations.
+        n_workers (int): Number of worker processes.
+        seed (int): Base random seed.
+        weights (numpy.ndarray): Sampling weight of every example, or None to
+            use every example once per iteration.
+
+    Yields:
+        dict: Losses summed over the workers, once per iteration. The trained
+            weights are copied into nlp after the last iteration.
+    """
+    context = multiprocessing.get_context("fork")
+    slots = parameter_slots(nlp)
+    size = slots[-1][3]
+    shared = {
+        "grads": context.RawArray("f", n_workers * size),
+        "has_grad": context.RawArray("b", n_workers * len(slots)),
+        "summed": context.RawArray("f", size),
+        "barrier": context.Barrier(n_workers),
+    }
+    losses_queue = context.Queue()
+    workers = [
+        context.Process(
+            target=data_parallel_worker,
+            args=(
+                rank,
+                nlp,
+                optimizer,
+                examples,
+                weights,
+                batch_sizes,
+                iterations,
+                seed,
+                shared,
+                losses_queue,
+            ),
+            daemon=True,
+        )
+        for rank in range(n_workers)
+    ]
+    for worker in workers:
+        worker.start()
+
+    try:
+        for _ in range(iterations):
+            losses = {}
+            for _ in range(n_workers):
+                while True:
+                    try:
+                        worker_losses = losses_queue.get(timeout=5)
+                        break
+                    except queue.Empty:
+                        if any(worker.exitcode for worker in workers):
+                            raise RuntimeError("A training worker failed.")
+                for name, loss in worker_losses.items():
+                    losses[name] = losses.get(name, 0.0) + loss
+            yield losses
+        for worker in workers:
+            worker.join()
+        if any(worker.exitcode for worker in workers):
+            raise RuntimeError("A training worker failed.")
+    finally:
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+
+    summed = numpy.frombuffer(shared["summed"], dtype="float32")
+    for node, name, start, end, shape in slots:
+        node.set_param(name, summed[start:end].reshape(shape).copy())